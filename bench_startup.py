@@ -0,0 +1,127 @@
+# 基准：各入口脚本的启动耗时（python -X importtime），检查 --help、列出输入、非 LLM 步骤是否秒开
+# 用法：python bench_startup.py [--runs 5] [--threshold-ms 100] [--top 5]
+#   每个场景跑 --runs 次取中位数墙钟时间，减去空解释器（python -c pass）的耗时即为本项目的启动开销；
+#   另跑一次 -X importtime，列出自身耗时最多的几个模块，便于定位新引入的慢导入。
+#   子进程会去掉 GEMINI_API_KEY / DASHSCOPE_API_KEY，同时验证 import 不读密钥、不会因未配置而退出。
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Set, Tuple
+
+ROOT = Path(__file__).resolve().parent
+
+_SAMPLE_MD = """# 登录
+## 账号密码登录
+- 输入正确账号密码，登录成功
+- 密码错误，提示账号或密码错误
+## 验证码登录
+- 验证码过期，提示重新获取
+"""
+
+
+def _scenarios(md_path: str) -> List[Tuple[str, List[str]]]:
+    scenarios: List[Tuple[str, List[str]]] = []
+    for script in ("run_pipeline.py", "run_xmind_to_cases.py", "run_xmind_review.py"):
+        scenarios.append((f"{script} --help", [script, "--help"]))
+        scenarios.append((f"{script} --list", [script, "--list"]))
+    scenarios.append(("run_batch.py --help", ["run_batch.py", "--help"]))
+    for script in ("step0_req_to_analysis.py", "step1_req_to_md.py", "step2_md_to_xmind.py", "step3_xmind_to_excel.py"):
+        scenarios.append((f"{script} --help", [script, "--help"]))
+    scenarios.append(("step2_md_to_xmind.py <示例.md>", ["step2_md_to_xmind.py", md_path]))
+    for module in ("generate_md_v2", "generate_cases_mvp", "review_engine"):
+        scenarios.append((f"import {module}", ["-c", f"import {module}"]))
+    return scenarios
+
+
+def _env(out_dir: str) -> Dict[str, str]:
+    env = {k: v for k, v in os.environ.items() if k not in ("GEMINI_API_KEY", "DASHSCOPE_API_KEY")}
+    env["OUTPUT_DIR"] = out_dir
+    return env
+
+
+def _run(args: List[str], env: Dict[str, str], importtime: bool = False) -> Tuple[float, str]:
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + args
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=ROOT, env=env, stdin=subprocess.DEVNULL, capture_output=True, text=True)
+    elapsed = time.perf_counter() - t0
+    if proc.returncode != 0:
+        tail = "\n".join(proc.stderr.strip().splitlines()[-5:])
+        raise SystemExit(f"运行失败（退出码 {proc.returncode}）: {' '.join(args)}\n{tail}")
+    return elapsed, proc.stderr
+
+
+def _parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """解析 -X importtime 输出为 [(模块名, 嵌套深度, 自身微秒, 累计微秒)]。"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # 格式：import time:{自身:>9} | {累计:>10} | {每层两个空格缩进}{模块名}
+        self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cum_us)))
+    return rows
+
+
+def _median_wall(args: List[str], env: Dict[str, str], runs: int) -> float:
+    return statistics.median(_run(args, env)[0] for _ in range(runs))
+
+
+def main() -> None:
+    argv = sys.argv[1:]
+    runs, threshold_ms, top = 5, 100.0, 5
+    i = 0
+    while i < len(argv):
+        if argv[i] == "--runs" and i + 1 < len(argv):
+            runs = max(1, int(argv[i + 1]))
+            i += 2
+            continue
+        if argv[i] == "--threshold-ms" and i + 1 < len(argv):
+            threshold_ms = float(argv[i + 1])
+            i += 2
+            continue
+        if argv[i] == "--top" and i + 1 < len(argv):
+            top = max(0, int(argv[i + 1]))
+            i += 2
+            continue
+        i += 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        md_path = os.path.join(tmp, "测试点分析.md")
+        Path(md_path).write_text(_SAMPLE_MD, encoding="utf-8")
+        env = _env(tmp)
+
+        base_wall = _median_wall(["-c", "pass"], env, runs)
+        base_modules: Set[str] = {r[0] for r in _parse_importtime(_run(["-c", "pass"], env, importtime=True)[1])}
+        print(f"空解释器启动: {base_wall * 1000:.0f} ms（以下「启动开销」已扣除）  阈值: {threshold_ms:.0f} ms  每项 {runs} 次取中位数\n")
+        print(f"{'场景':<44}{'墙钟(ms)':>10}{'启动开销(ms)':>14}{'导入(ms)':>10}  结果")
+
+        slow = 0
+        details: List[Tuple[str, List[Tuple[str, int, int, int]]]] = []
+        for label, args in _scenarios(md_path):
+            wall = _median_wall(args, env, runs)
+            rows = [r for r in _parse_importtime(_run(args, env, importtime=True)[1]) if r[0] not in base_modules]
+            import_ms = sum(r[3] for r in rows if r[1] == 0) / 1000
+            extra_ms = max(0.0, (wall - base_wall) * 1000)
+            ok = extra_ms < threshold_ms
+            slow += not ok
+            print(f"{label:<44}{wall * 1000:>10.0f}{extra_ms:>14.0f}{import_ms:>10.0f}  {'OK' if ok else '慢'}")
+            details.append((label, rows))
+
+    if top:
+        print(f"\n各场景自身耗时最多的 {top} 个模块（-X importtime，微秒）：")
+        for label, rows in details:
+            heaviest = sorted(rows, key=lambda r: r[2], reverse=True)[:top]
+            print(f"  {label}: " + ", ".join(f"{name} {self_us}" for name, _d, self_us, _c in heaviest))
+    print(f"\n{'全部场景均在阈值内' if not slow else f'{slow} 个场景超过阈值'}")
+    if slow:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
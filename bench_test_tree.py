@@ -0,0 +1,131 @@
+# 基准：统一测试树 dict 表示 vs 紧凑列式表示（compact_tree）的内存占用与遍历耗时
+# 用法：python bench_test_tree.py [--nodes 100000] [--xmind 某个.xmind]
+#   不传 --xmind 时生成一份约 --nodes 个节点的合成 XMind（4 级：模块/子模块/场景/用例）
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from typing import Any, Callable, Dict, List, Tuple
+
+from test_tree_utils import flat_to_compressed_path_list
+from xmind_to_test_tree import xmind_to_test_tree
+
+
+def _synthetic_xmind(path: str, nodes: int) -> None:
+    """按 20 模块 × N 子模块 × 10 场景 × 10 用例 生成，总节点数约为 nodes。"""
+    per_sub = 1 + 10 + 10 * 10
+    subs = max(1, nodes // (20 * per_sub))
+    root = {"title": "合成测试树", "children": {"attached": [
+        {"title": f"模块{m}", "children": {"attached": [
+            {"title": f"子模块{s}", "children": {"attached": [
+                {"title": f"场景{c}", "children": {"attached": [
+                    {"title": f"校验{k}：输入合法时提交成功"} for k in range(10)
+                ]}} for c in range(10)
+            ]}} for s in range(subs)
+        ]}} for m in range(20)
+    ]}}
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        z.writestr("content.json", json.dumps([{"rootTopic": root}], ensure_ascii=False))
+
+
+def _retained_bytes(fn: Callable[[], Any]) -> int:
+    """fn 返回的结果仍持有的内存（tracemalloc 会拖慢执行，耗时另行测量）。"""
+    tracemalloc.start()
+    result = fn()
+    retained, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return retained
+
+
+def _timed(fn: Callable[[], Any]) -> Tuple[Any, float]:
+    t0 = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - t0
+
+
+def _walk(roots: List[Any]) -> Tuple[int, int]:
+    """按节点接口深度优先遍历整树（dict 节点或 TestNode 视图），统计 (层级之和, 叶子数)。"""
+    total = leaves = 0
+    stack = list(roots)
+    while stack:
+        n = stack.pop()
+        total += n["level"]
+        children = n["children"]
+        if not children:
+            leaves += 1
+        stack.extend(children)
+    return total, leaves
+
+
+def _scan_compact(tree: Any) -> Tuple[int, int]:
+    """同样的统计在紧凑树上按列扫描完成：不创建节点对象。"""
+    return sum(tree.level), tree.first_child.count(-1)
+
+
+def main() -> None:
+    argv = sys.argv[1:]
+    nodes = 100_000
+    xmind_path = ""
+    i = 0
+    while i < len(argv):
+        if argv[i] == "--nodes" and i + 1 < len(argv):
+            nodes = int(argv[i + 1])
+            i += 2
+            continue
+        if argv[i] == "--xmind" and i + 1 < len(argv):
+            xmind_path = argv[i + 1]
+            i += 2
+            continue
+        i += 1
+
+    tmp_dir = None
+    if not xmind_path:
+        tmp_dir = tempfile.mkdtemp()
+        xmind_path = os.path.join(tmp_dir, "bench.xmind")
+        _synthetic_xmind(xmind_path, nodes)
+
+    rows: Dict[str, Dict[str, float]] = {}
+    for label, compact in (("dict", False), ("compact", True)):
+        mem = _retained_bytes(lambda: xmind_to_test_tree(xmind_path, compact=compact))
+        (roots, flat), build_sec = _timed(lambda: xmind_to_test_tree(xmind_path, compact=compact))
+        text, prompt_sec = _timed(lambda: flat_to_compressed_path_list(flat))
+        visited, walk_sec = _timed(lambda: _walk(roots))
+        if compact:
+            scanned, scan_sec = _timed(lambda: _scan_compact(flat.tree))
+            visited = visited if scanned == visited else None
+        else:
+            scan_sec = walk_sec
+        rows[label] = {
+            "nodes": len(flat),
+            "mem_mb": mem / 1024 / 1024,
+            "build_s": build_sec,
+            "prompt_s": prompt_sec,
+            "walk_s": walk_sec,
+            "scan_s": scan_sec,
+            "prompt": hash(text),
+            "visited": visited,
+        }
+        del roots, flat, text
+
+    print(f"XMind: {xmind_path}  节点数: {rows['dict']['nodes']}")
+    print(f"{'表示':<10}{'内存(MB)':>10}{'解析(s)':>10}{'路径列表(s)':>13}{'节点接口遍历(s)':>16}{'按列统计(s)':>13}")
+    for label, r in rows.items():
+        print(f"{label:<10}{r['mem_mb']:>10.1f}{r['build_s']:>10.2f}{r['prompt_s']:>13.3f}{r['walk_s']:>16.3f}{r['scan_s']:>13.3f}")
+    d, c = rows["dict"], rows["compact"]
+    same = d["prompt"] == c["prompt"] and d["visited"] == c["visited"]
+    end_to_end = (d["build_s"] + d["prompt_s"]) / max(c["build_s"] + c["prompt_s"], 1e-9)
+    print(f"内存：紧凑表示为 dict 的 1/{d['mem_mb'] / max(c['mem_mb'], 1e-9):.1f}；"
+          f"解析+路径列表 {end_to_end:.2f}x；整树统计（按列 vs dict 遍历）{d['walk_s'] / max(c['scan_s'], 1e-9):.0f}x；"
+          f"输出一致: {'是' if same else '否'}")
+
+    if tmp_dir:
+        os.remove(xmind_path)
+        os.rmdir(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
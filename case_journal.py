@@ -0,0 +1,111 @@
+# 流程2 断点续跑日志：每个叶子的用例一生成就追加写入 JSONL（输出文件旁的 <名称>.journal.jsonl），
+# 进程中途退出（重试耗尽、Ctrl+C、断网）后用 --resume 跳过已完成的叶子，最多损失正在生成的那几个叶子。
+#
+# 文件格式：第一行 header（XMind 内容哈希 + 模型 + 提示词版本，用于判断日志是否属于本次输入），
+# 之后每行一个叶子：{"type": "leaf", "index": 叶子序号, "path": [...], "cases": [...]}
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from settings import load_env
+
+load_env()
+
+# 每写一行后 fsync，保证断电/强杀时已生成的叶子也落盘（关闭可略减 IO）
+CASES_JOURNAL_FSYNC = os.getenv("CASES_JOURNAL_FSYNC", "1").strip().lower() not in ("0", "false", "off")
+# 成功生成输出文件后保留日志（默认删除）
+CASES_KEEP_JOURNAL = os.getenv("CASES_KEEP_JOURNAL", "0").strip().lower() in ("1", "true", "on")
+
+
+def journal_path_for(output_path: Path) -> Path:
+    """输出文件对应的日志路径：用例.xlsx → 用例.journal.jsonl"""
+    return output_path.with_name(output_path.stem + ".journal.jsonl")
+
+
+def make_fingerprint(xmind_bytes: bytes, model: str, prompt_version: str) -> str:
+    """日志所属输入的指纹：XMind 内容、模型、提示词版本任一变化都不能续跑。"""
+    h = hashlib.sha256(xmind_bytes)
+    h.update(f"\0{model}\0{prompt_version}".encode("utf-8"))
+    return h.hexdigest()
+
+
+class CaseJournal:
+    """追加写入的叶子用例日志（线程安全，可在并发生成的工作线程中直接调用 record）。"""
+
+    def __init__(self, path: Path, fingerprint: str, resume: bool = False) -> None:
+        self.path = Path(path)
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if resume and self._header_matches():
+            # 上次可能在写一行的中途被中断：补一个换行，避免新记录接在半行后面
+            with open(self.path, "rb") as fb:
+                size = fb.seek(0, os.SEEK_END)
+                if size > 0:
+                    fb.seek(size - 1)
+                partial = size > 0 and fb.read(1) != b"\n"
+            self._f = open(self.path, "a", encoding="utf-8")
+            if partial:
+                self._f.write("\n")
+        else:
+            self._f = open(self.path, "w", encoding="utf-8")
+            self._write({"type": "header", "fingerprint": fingerprint, "created": time.time()})
+
+    def _header_matches(self) -> bool:
+        if not self.path.exists():
+            return False
+        try:
+            with open(self.path, "r", encoding="utf-8", errors="replace") as f:
+                header = json.loads(f.readline() or "{}")
+        except (OSError, json.JSONDecodeError):
+            return False
+        if header.get("fingerprint") != self.fingerprint:
+            print(f"[续跑] 日志 {self.path.name} 属于另一份 XMind 或模型/提示词已变化，将重新生成")
+            return False
+        return True
+
+    def load(self, leaf_paths: List[List[str]]) -> Dict[int, List[Dict[str, Any]]]:
+        """读取已完成的叶子：返回 {叶子序号: 用例列表}。序号与路径都对得上才算（半行/损坏行忽略）。"""
+        done: Dict[int, List[Dict[str, Any]]] = {}
+        with self._lock, open(self.path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if rec.get("type") != "leaf":
+                    continue
+                idx = rec.get("index")
+                if isinstance(idx, int) and 0 <= idx < len(leaf_paths) and rec.get("path") == leaf_paths[idx]:
+                    done[idx] = rec.get("cases") or []
+        return done
+
+    def record(self, index: int, path: List[str], cases: List[Dict[str, Any]]) -> None:
+        self._write({"type": "leaf", "index": index, "path": path, "cases": cases})
+
+    def _write(self, rec: Dict[str, Any]) -> None:
+        line = json.dumps(rec, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._f.write(line)
+            self._f.flush()
+            if CASES_JOURNAL_FSYNC:
+                os.fsync(self._f.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._f.closed:
+                self._f.close()
+
+
+def discard_journal(path: Path) -> None:
+    """输出文件已成功写出后调用：删除日志（设置 CASES_KEEP_JOURNAL=1 时保留）。"""
+    if CASES_KEEP_JOURNAL:
+        return
+    try:
+        Path(path).unlink()
+    except OSError:
+        pass
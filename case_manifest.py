@@ -0,0 +1,99 @@
+# 流程2 增量生成清单：每次成功运行后，在输出文件旁保存 <名称>.manifest.json，
+# 记录每个叶子路径生成的用例与耗时。下次用 --incremental 运行时，路径未变的叶子直接复用，
+# 只为新增/改动的叶子调用 LLM，已删除的叶子自然不再出现。
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+# 清单格式版本（结构有不兼容改动时递增）
+_MANIFEST_VERSION = 1
+
+
+def manifest_path_for(output_path: Path) -> Path:
+    """输出文件对应的清单路径：用例.xlsx → 用例.manifest.json"""
+    return output_path.with_name(output_path.stem + ".manifest.json")
+
+
+def _leaf_key(path: List[str]) -> str:
+    return json.dumps(path, ensure_ascii=False)
+
+
+def load_manifest(path: Path, model: str, prompt_version: str) -> Dict[str, Dict[str, Any]]:
+    """
+    读取上次的清单，返回 {叶子键: {"cases": [...], "sec": 生成耗时}}。
+    清单不存在、损坏，或模型/提示词版本与本次不同时返回空（全部重新生成）。
+    """
+    path = Path(path)
+    if not path.exists():
+        return {}
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"[增量] 清单 {path.name} 读取失败，将全部重新生成: {e}")
+        return {}
+    if data.get("version") != _MANIFEST_VERSION:
+        return {}
+    if data.get("model") != model or data.get("prompt_version") != prompt_version:
+        print("[增量] 上次使用的模型/提示词版本与本次不同，将全部重新生成")
+        return {}
+    leaves = data.get("leaves")
+    return leaves if isinstance(leaves, dict) else {}
+
+
+def match_manifest(
+    leaf_paths: List[List[str]],
+    manifest: Dict[str, Dict[str, Any]],
+) -> Tuple[Dict[int, List[Dict[str, Any]]], Dict[int, float], int]:
+    """
+    用清单匹配本次叶子：返回 ({可复用的叶子序号: 用例}, {可复用的叶子序号: 上次生成耗时}, 已删除的叶子数)。
+    """
+    reused: Dict[int, List[Dict[str, Any]]] = {}
+    reused_sec: Dict[int, float] = {}
+    current = set()
+    for i, p in enumerate(leaf_paths):
+        key = _leaf_key(p)
+        current.add(key)
+        entry = manifest.get(key)
+        if isinstance(entry, dict) and isinstance(entry.get("cases"), list):
+            reused[i] = entry["cases"]
+            reused_sec[i] = float(entry.get("sec") or 0.0)
+    removed = sum(1 for k in manifest if k not in current)
+    return reused, reused_sec, removed
+
+
+class ManifestWriter:
+    """
+    边生成边写清单：每个叶子产出时立即写入临时文件，不在内存中保留全部用例（大型导图内存占用保持平稳）。
+    commit() 时补全 JSON 并替换正式清单；abort() 丢弃临时文件，中途退出不会留下半个清单、也不覆盖上次的清单。
+    格式与整体 json.dumps 的结果一致，load_manifest 照常读取（路径重复的叶子以后写入的为准）。
+    """
+
+    def __init__(self, path: Path, model: str, prompt_version: str) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        self._f = open(self._tmp, "w", encoding="utf-8")
+        self._count = 0
+        head = {"version": _MANIFEST_VERSION, "model": model, "prompt_version": prompt_version, "updated": time.time()}
+        # 去掉结尾的 "}"，接着写 leaves 对象
+        self._f.write(json.dumps(head, ensure_ascii=False)[:-1] + ', "leaves": {')
+
+    def add(self, path: List[str], cases: List[Dict[str, Any]], sec: float) -> None:
+        entry = json.dumps({"cases": cases, "sec": round(sec, 3)}, ensure_ascii=False)
+        self._f.write(("," if self._count else "") + "\n" + json.dumps(_leaf_key(path), ensure_ascii=False) + ": " + entry)
+        self._count += 1
+
+    def commit(self) -> None:
+        self._f.write("\n}}")
+        self._f.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self) -> None:
+        if not self._f.closed:
+            self._f.close()
+        try:
+            self._tmp.unlink()
+        except OSError:
+            pass
@@ -0,0 +1,333 @@
+# 流程2：用例输出（导出器）——逐条写入，不在内存中攒全部行
+# 每生成一个叶子的用例就写出，格式可选（--format）：
+#   xlsx     按模板表头写 Excel（openpyxl write_only，行数据由 openpyxl 落到临时文件，内存不随用例数增长）
+#   csv      按模板表头写 CSV（UTF-8 BOM，Excel 可直接打开）
+#   jsonl    每行一条用例 JSON（含所属叶子路径），便于下游程序导入
+#   testlink TestLink 导入格式的 XML（叶子路径对应嵌套 testsuite）
+# 写文件时先写 <输出>.tmp，全部完成后再替换为正式文件，中途失败不会留下半个文件。
+# openpyxl 导入约需 0.3s，只在读取模板、写 xlsx 时才导入（csv / jsonl / testlink 与 --help 不需要）。
+import csv
+import io
+import json
+import os
+import re
+from pathlib import Path
+from typing import IO, Any, Dict, List, Optional, Type, Union
+
+
+def read_header_row(xlsx_path: str, sheet_name: Union[str, int, None] = None) -> List[Any]:
+    """
+    只读模式读取模板第一行作为表头（不加载其余数据）。列名规则与 pandas.read_excel 相同：
+    空表头记为 "Unnamed: 序号"，重名列依次加 ".1"、".2"，末尾的空列忽略。
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(xlsx_path, read_only=True)
+    try:
+        if not wb.sheetnames:
+            raise ValueError("没有任何工作表")
+        if isinstance(sheet_name, str):
+            ws = wb[sheet_name]
+        else:
+            ws = wb.worksheets[sheet_name or 0]
+        first = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ())
+    finally:
+        wb.close()
+
+    values = list(first)
+    while values and values[-1] is None:
+        values.pop()
+    columns: List[Any] = []
+    seen: Dict[Any, int] = {}
+    for i, v in enumerate(values):
+        name = f"Unnamed: {i}" if v is None else v
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        seen.setdefault(name, 0)
+        columns.append(name)
+    return columns
+
+
+def _strip_leading_number(text: str) -> str:
+    """去掉字符串开头已有的序号（如 '1. '、'2、'），避免与后续统一编号重复成 1.1、2.2。"""
+    if not (text or text.strip()):
+        return text
+    return re.sub(r"^\s*\d+[\.、]\s*", "", text.strip()).strip() or text.strip()
+
+
+def map_case_to_row(case: Dict[str, Any], columns: List[str]) -> Dict[str, Any]:
+    """
+    按列名关键词匹配，尽量通用：
+    - 名称/标题/summary
+    - 前置/precondition
+    - 步骤/step
+    - 预期/expected
+    - 优先级/priority
+    """
+    title = case.get("title", "")
+    pre = "\n".join(case.get("preconditions", []) or [])
+    raw_steps = case.get("steps", []) or []
+    raw_expected = case.get("expected", []) or []
+    steps = "\n".join([f"{i+1}. {_strip_leading_number(s)}" for i, s in enumerate(raw_steps)])
+    exp = "\n".join([f"{i+1}. {_strip_leading_number(e)}" for i, e in enumerate(raw_expected)])
+    prio = case.get("priority", "Medium")
+
+    row = {}
+    for col in columns:
+        k = str(col).lower()
+        if ("summary" in k) or ("标题" in col) or ("名称" in col) or ("用例" in col and "名" in col):
+            row[col] = title
+        elif ("precondition" in k) or ("前置" in col):
+            row[col] = pre
+        elif ("step" in k) or ("步骤" in col) or ("操作" in col):
+            row[col] = steps
+        elif ("expected" in k) or ("预期" in col) or ("结果" in col):
+            row[col] = exp
+        elif ("priority" in k) or ("优先级" in col):
+            row[col] = prio
+        else:
+            row[col] = ""
+    return row
+
+
+class CaseWriter:
+    """
+    导出器基类。target 为文件路径（先写 .tmp 再替换）或可写的二进制流。
+    子类实现 _begin / _write / _finish；调用方按叶子顺序调用 write_case，最后 close（失败时 abort）。
+    """
+
+    # 默认扩展名；是否需要模板表头（columns）
+    extension = ""
+    uses_template = False
+
+    def __init__(self, target: Union[str, Path, IO[bytes]], columns: Optional[List[Any]] = None) -> None:
+        self.columns = columns or []
+        self.rows = 0
+        self._target = target
+        self._tmp: Optional[Path] = None
+        if isinstance(target, (str, Path)):
+            path = Path(target)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._tmp = path.with_name(path.name + ".tmp")
+        self._begin()
+
+    def write_case(self, leaf_path: List[str], case: Dict[str, Any]) -> None:
+        self._write(leaf_path, case)
+        self.rows += 1
+
+    def close(self) -> None:
+        self._finish()
+        if self._tmp is not None:
+            os.replace(self._tmp, self._target)
+
+    def abort(self) -> None:
+        """生成失败时调用：丢弃已写入的内容，不产生输出文件。"""
+        self._discard()
+        if self._tmp is not None:
+            try:
+                self._tmp.unlink()
+            except OSError:
+                pass
+
+    def _begin(self) -> None:
+        raise NotImplementedError
+
+    def _write(self, leaf_path: List[str], case: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def _finish(self) -> None:
+        raise NotImplementedError
+
+    def _discard(self) -> None:
+        pass
+
+
+class _TextCaseWriter(CaseWriter):
+    """文本格式的公共部分：打开 .tmp 文件或包装调用方传入的二进制流。"""
+
+    encoding = "utf-8"
+
+    def _open_text(self) -> IO[str]:
+        if self._tmp is not None:
+            return open(self._tmp, "w", encoding=self.encoding, newline="")
+        return io.TextIOWrapper(self._target, encoding=self.encoding, newline="", write_through=True)
+
+    def _close_text(self) -> None:
+        if self._tmp is not None:
+            self._f.close()
+        else:
+            self._f.flush()
+            # 不关闭调用方的流
+            self._f.detach()
+
+    def _finish(self) -> None:
+        self._close_text()
+
+    def _discard(self) -> None:
+        self._close_text()
+
+
+class XlsxCaseWriter(CaseWriter):
+    """按模板列逐行写出 Excel（openpyxl write_only）。"""
+
+    extension = ".xlsx"
+    uses_template = True
+
+    def _begin(self) -> None:
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Alignment, Border, Font, Side
+
+        # 表头样式与此前 pandas.to_excel 输出一致：加粗、细边框、水平居中
+        font = Font(bold=True)
+        border = Border(*(Side(style="thin"),) * 4)
+        align = Alignment(horizontal="center", vertical="top")
+        self._wb = Workbook(write_only=True)
+        self._ws = self._wb.create_sheet("Sheet1")
+        header = []
+        for col in self.columns:
+            cell = WriteOnlyCell(self._ws, value=col)
+            cell.font, cell.border, cell.alignment = font, border, align
+            header.append(cell)
+        self._ws.append(header)
+
+    def _write(self, leaf_path: List[str], case: Dict[str, Any]) -> None:
+        row = map_case_to_row(case, self.columns)
+        self._ws.append([row.get(c, "") for c in self.columns])
+
+    def _finish(self) -> None:
+        self._wb.save(self._tmp if self._tmp is not None else self._target)
+
+    def _discard(self) -> None:
+        self._wb.close()
+
+
+class CsvCaseWriter(_TextCaseWriter):
+    """按模板列逐行写出 CSV；带 BOM，Excel 打开中文不乱码。"""
+
+    extension = ".csv"
+    uses_template = True
+    encoding = "utf-8-sig"
+
+    def _begin(self) -> None:
+        self._f = self._open_text()
+        self._csv = csv.writer(self._f)
+        self._csv.writerow(self.columns)
+
+    def _write(self, leaf_path: List[str], case: Dict[str, Any]) -> None:
+        row = map_case_to_row(case, self.columns)
+        self._csv.writerow([row.get(c, "") for c in self.columns])
+
+
+class JsonlCaseWriter(_TextCaseWriter):
+    """每行一条用例：{"path": 叶子路径, "title", "preconditions", "steps", "expected", "priority"}。"""
+
+    extension = ".jsonl"
+
+    def _begin(self) -> None:
+        self._f = self._open_text()
+
+    def _write(self, leaf_path: List[str], case: Dict[str, Any]) -> None:
+        rec = {
+            "path": leaf_path,
+            "title": case.get("title", ""),
+            "preconditions": case.get("preconditions", []) or [],
+            "steps": case.get("steps", []) or [],
+            "expected": case.get("expected", []) or [],
+            "priority": case.get("priority", "Medium"),
+        }
+        self._f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+
+# TestLink importance：1 低 / 2 中 / 3 高
+_TESTLINK_IMPORTANCE = {"high": 3, "高": 3, "p0": 3, "p1": 3, "medium": 2, "中": 2, "p2": 2, "low": 1, "低": 1, "p3": 1}
+
+
+def _cdata(text: str) -> str:
+    """多行文本转为 TestLink 字段使用的 HTML（换行转 <br />），包在 CDATA 中。"""
+    html = "<br />".join((text or "").splitlines())
+    return "<![CDATA[" + html.replace("]]>", "]]]]><![CDATA[>") + "]]>"
+
+
+def _quoteattr(text: str) -> str:
+    """XML 属性值转义并加引号（xml.sax.saxutils 会连带导入 urllib.request，只在写 TestLink 时才导入）。"""
+    from xml.sax.saxutils import quoteattr
+
+    return quoteattr(text)
+
+
+class TestLinkXmlCaseWriter(_TextCaseWriter):
+    """
+    TestLink 用例导入 XML：叶子路径的每一级对应一层 testsuite，用例挂在叶子对应的 testsuite 下。
+    用例按叶子顺序到达，路径变化时只关闭/打开有差异的那几层 testsuite，因此可以边生成边写。
+    """
+
+    extension = ".xml"
+
+    def _begin(self) -> None:
+        self._f = self._open_text()
+        self._f.write('<?xml version="1.0" encoding="UTF-8"?>\n<testsuite name="">\n')
+        self._open: List[str] = []
+
+    def _indent(self, extra: int = 0) -> str:
+        return "  " * (len(self._open) + 1 + extra)
+
+    def _write(self, leaf_path: List[str], case: Dict[str, Any]) -> None:
+        common = 0
+        while common < min(len(self._open), len(leaf_path)) and self._open[common] == leaf_path[common]:
+            common += 1
+        while len(self._open) > common:
+            self._open.pop()
+            self._f.write(f"{self._indent()}</testsuite>\n")
+        for name in leaf_path[common:]:
+            self._f.write(f"{self._indent()}<testsuite name={_quoteattr(name)}>\n")
+            self._open.append(name)
+
+        steps = [_strip_leading_number(s) for s in case.get("steps", []) or []]
+        expected = [_strip_leading_number(e) for e in case.get("expected", []) or []]
+        if len(expected) > len(steps):
+            # 预期多于步骤：多出的并入最后一步
+            tail = expected[max(len(steps) - 1, 0):]
+            expected = expected[: max(len(steps) - 1, 0)] + ["\n".join(tail)]
+            steps = steps or [""]
+        importance = _TESTLINK_IMPORTANCE.get(str(case.get("priority", "")).strip().lower(), 2)
+        ind, ind2, ind3 = self._indent(), self._indent(1), self._indent(2)
+        out = [
+            f"{ind}<testcase name={_quoteattr(case.get('title', '') or '未命名用例')}>",
+            f"{ind2}<preconditions>{_cdata(chr(10).join(case.get('preconditions', []) or []))}</preconditions>",
+            f"{ind2}<importance>{importance}</importance>",
+            f"{ind2}<execution_type>1</execution_type>",
+            f"{ind2}<steps>",
+        ]
+        for n, action in enumerate(steps, start=1):
+            out.append(
+                f"{ind3}<step><step_number>{n}</step_number><actions>{_cdata(action)}</actions>"
+                f"<expectedresults>{_cdata(expected[n - 1] if n <= len(expected) else '')}</expectedresults>"
+                f"<execution_type>1</execution_type></step>"
+            )
+        out += [f"{ind2}</steps>", f"{ind}</testcase>"]
+        self._f.write("\n".join(out) + "\n")
+
+    def _finish(self) -> None:
+        while self._open:
+            self._open.pop()
+            self._f.write(f"{self._indent()}</testsuite>\n")
+        self._f.write("</testsuite>\n")
+        self._close_text()
+
+
+# --format 可选值
+EXPORT_FORMATS: Dict[str, Type[CaseWriter]] = {
+    "xlsx": XlsxCaseWriter,
+    "csv": CsvCaseWriter,
+    "jsonl": JsonlCaseWriter,
+    "testlink": TestLinkXmlCaseWriter,
+}
+
+
+def get_writer_class(fmt: str) -> Type[CaseWriter]:
+    cls = EXPORT_FORMATS.get((fmt or "xlsx").strip().lower())
+    if cls is None:
+        raise SystemExit(f"不支持的输出格式: {fmt}（可选: {'/'.join(EXPORT_FORMATS)}）")
+    return cls
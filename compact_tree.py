@@ -0,0 +1,283 @@
+# 流程3：统一测试树的紧凑存储（列式数组），用于十万级节点的大测试树
+# 每个字段一列 array：父节点下标、层级、标题（驻留到标题表）、类型、id 与子树哈希（以整数保存）；
+# path 不落地，访问时沿父链现算。对外通过 TestNode / FlatNodes 视图提供与 dict 节点、flat 列表相同的读取方式，
+# review_engine / review_index / test_tree_utils / review_to_xmind 无需区分两种表示。
+from array import array
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+_NO_HASH = 0
+
+
+class CompactTestTree:
+    """列式测试树：节点按加入顺序编号（解析时即先序），父节点总在子节点之前。"""
+
+    def __init__(self) -> None:
+        self.parent = array("i")
+        self.level = array("H")
+        self.title_ix = array("I")
+        self.type_ix = array("B")
+        self.id_num = array("I")
+        self.hash_num = array("Q")
+        self.first_child = array("i")
+        self.last_child = array("i")
+        self.next_sibling = array("i")
+        self.titles: List[str] = []
+        self._title_lookup: Dict[str, int] = {}
+        self.types: List[str] = [""]
+        self.root_indices: List[int] = []
+        self._id_index: Optional[Dict[int, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    # ---------- 写入 ----------
+    def _intern(self, title: str) -> int:
+        ix = self._title_lookup.get(title)
+        if ix is None:
+            ix = len(self.titles)
+            self.titles.append(title)
+            self._title_lookup[title] = ix
+        return ix
+
+    def add_node(self, parent: int, title: str, level: int, node_id: str, node_type: str = "") -> int:
+        """追加节点（parent = -1 表示 sheet 根），返回下标。node_id 须为 node-<8 位十六进制>。"""
+        i = len(self.parent)
+        self.parent.append(parent)
+        self.level.append(level)
+        self.title_ix.append(self._intern(title))
+        self.type_ix.append(0)
+        self.id_num.append(int(node_id[5:], 16))
+        self.hash_num.append(_NO_HASH)
+        self.first_child.append(-1)
+        self.last_child.append(-1)
+        self.next_sibling.append(-1)
+        if node_type:
+            self.set_type(i, node_type)
+        if parent < 0:
+            self.root_indices.append(i)
+        else:
+            last = self.last_child[parent]
+            if last < 0:
+                self.first_child[parent] = i
+            else:
+                self.next_sibling[last] = i
+            self.last_child[parent] = i
+        if self._id_index is not None:
+            self._id_index[self.id_num[i]] = i
+        return i
+
+    def set_type(self, i: int, node_type: str) -> None:
+        if node_type not in self.types:
+            self.types.append(node_type)
+        self.type_ix[i] = self.types.index(node_type)
+
+    def set_subtree_hash(self, i: int, subtree_hash: str) -> None:
+        self.hash_num[i] = int(subtree_hash, 16)
+
+    # ---------- 读取 ----------
+    def raw_title(self, i: int) -> str:
+        return self.titles[self.title_ix[i]]
+
+    def title(self, i: int) -> str:
+        return self.raw_title(i) or "(无标题)"
+
+    def node_id(self, i: int) -> str:
+        return "node-%08x" % self.id_num[i]
+
+    def subtree_hash(self, i: int) -> Optional[str]:
+        h = self.hash_num[i]
+        return None if h == _NO_HASH else "%016x" % h
+
+    def children(self, i: int) -> Iterator[int]:
+        c = self.first_child[i]
+        while c >= 0:
+            yield c
+            c = self.next_sibling[c]
+
+    def has_children(self, i: int) -> bool:
+        return self.first_child[i] >= 0
+
+    def path(self, i: int) -> str:
+        """沿父链拼出路径（无标题节点不进入路径），与 dict 表示的 path 字段一致。"""
+        parts: List[str] = []
+        while i >= 0:
+            t = self.raw_title(i)
+            if t:
+                parts.append(t)
+            i = self.parent[i]
+        return "/".join(reversed(parts))
+
+    def iter_paths(self) -> Iterator[str]:
+        """按下标顺序交出全部路径，一次遍历 O(n)：只缓存有子节点的节点的路径（父节点总在子节点之前）。"""
+        parent, titles, title_ix, first_child = self.parent, self.titles, self.title_ix, self.first_child
+        cache: Dict[int, str] = {}
+        for i in range(len(parent)):
+            p = parent[i]
+            base = cache[p] if p >= 0 else ""
+            t = titles[title_ix[i]]
+            path = (base + "/" + t if base else t) if t else base
+            if first_child[i] >= 0:
+                cache[i] = path
+            yield path
+
+    def iter_preorder(self) -> Iterator[int]:
+        """按树形先序交出节点下标（含合并时追加到末尾的节点，会出现在其父节点的子树内）。"""
+        first_child, next_sibling = self.first_child, self.next_sibling
+        stack = list(reversed(self.root_indices))
+        while stack:
+            i = stack.pop()
+            yield i
+            c = first_child[i]
+            if c >= 0:
+                kids = []
+                while c >= 0:
+                    kids.append(c)
+                    c = next_sibling[c]
+                stack.extend(reversed(kids))
+
+    def index_of(self, node_id: str) -> int:
+        """按 id 查下标（首次调用时建索引），不存在返回 -1。"""
+        if self._id_index is None:
+            self._id_index = {n: i for i, n in enumerate(self.id_num)}
+        try:
+            return self._id_index.get(int(node_id[5:], 16), -1) if node_id.startswith("node-") else -1
+        except ValueError:
+            return -1
+
+    # ---------- 视图 ----------
+    def node(self, i: int) -> "TestNode":
+        return TestNode(self, i)
+
+    @property
+    def roots(self) -> List["TestNode"]:
+        return [TestNode(self, i) for i in self.root_indices]
+
+    @property
+    def flat(self) -> "FlatNodes":
+        return FlatNodes(self)
+
+    def to_dicts(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """物化为 dict 表示 (roots, flat)，字段与顺序同 xmind_to_test_tree 的默认输出。"""
+        flat: List[Dict[str, Any]] = []
+        for i, path in enumerate(self.iter_paths()):
+            p = self.parent[i]
+            d: Dict[str, Any] = {
+                "id": self.node_id(i),
+                "parent_id": self.node_id(p) if p >= 0 else "",
+                "path": path,
+                "title": self.title(i),
+                "type": self.types[self.type_ix[i]],
+                "level": self.level[i],
+                "children": [],
+            }
+            h = self.subtree_hash(i)
+            if h is not None:
+                d["subtree_hash"] = h
+            flat.append(d)
+            if p >= 0:
+                flat[p]["children"].append(d)
+        return [flat[i] for i in self.root_indices], flat
+
+
+_FIELDS = {
+    "id": lambda t, i: t.node_id(i),
+    "parent_id": lambda t, i: t.node_id(t.parent[i]) if t.parent[i] >= 0 else "",
+    "path": lambda t, i: t.path(i),
+    "title": lambda t, i: t.title(i),
+    "type": lambda t, i: t.types[t.type_ix[i]],
+    "level": lambda t, i: t.level[i],
+    "children": lambda t, i: [TestNode(t, c) for c in t.children(i)],
+}
+
+
+class TestNode:
+    """单个节点的只读视图，按 dict 节点的方式访问：node["id"]、node.get("path") 等。"""
+
+    __slots__ = ("tree", "index")
+
+    def __init__(self, tree: CompactTestTree, index: int) -> None:
+        self.tree = tree
+        self.index = index
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "subtree_hash":
+            h = self.tree.subtree_hash(self.index)
+            if h is None:
+                raise KeyError(key)
+            return h
+        try:
+            return _FIELDS[key](self.tree, self.index)
+        except KeyError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key: object) -> bool:
+        return key in _FIELDS or (key == "subtree_hash" and self.tree.hash_num[self.index] != _NO_HASH)
+
+    def keys(self) -> List[str]:
+        return [k for k in (*_FIELDS, "subtree_hash") if k in self]
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, TestNode) and other.tree is self.tree and other.index == self.index
+
+    def __hash__(self) -> int:
+        return hash((id(self.tree), self.index))
+
+    def __repr__(self) -> str:
+        return f"TestNode({self.tree.node_id(self.index)}, {self.tree.path(self.index)!r})"
+
+
+class FlatNodes(Sequence):
+    """全部节点的列表视图（按下标顺序），替代 flat 列表；切片返回 TestNode 列表。"""
+
+    def __init__(self, tree: CompactTestTree) -> None:
+        self.tree = tree
+
+    def __len__(self) -> int:
+        return len(self.tree)
+
+    def __getitem__(self, key: Union[int, slice]) -> Any:
+        if isinstance(key, slice):
+            return [TestNode(self.tree, i) for i in range(len(self.tree))[key]]
+        if key < 0:
+            key += len(self.tree)
+        if not 0 <= key < len(self.tree):
+            raise IndexError(key)
+        return TestNode(self.tree, key)
+
+    def __iter__(self) -> Iterator[TestNode]:
+        for i in range(len(self.tree)):
+            yield TestNode(self.tree, i)
+
+    def append(self, node: TestNode) -> None:
+        """兼容 list.append：节点在 CompactTestTree.add_node 时已加入，这里只校验归属。"""
+        if not (isinstance(node, TestNode) and node.tree is self.tree):
+            raise TypeError("只能追加由同一棵 CompactTestTree 创建的节点")
+
+
+class NodeIdMap(Mapping):
+    """node_id -> TestNode 的映射视图（替代 build_id_to_node 的 dict），按需查下标，不为每个节点建 dict 项。"""
+
+    def __init__(self, tree: CompactTestTree) -> None:
+        self.tree = tree
+
+    def __getitem__(self, node_id: str) -> TestNode:
+        i = self.tree.index_of(node_id) if isinstance(node_id, str) else -1
+        if i < 0:
+            raise KeyError(node_id)
+        return TestNode(self.tree, i)
+
+    def __contains__(self, node_id: object) -> bool:
+        return isinstance(node_id, str) and self.tree.index_of(node_id) >= 0
+
+    def __len__(self) -> int:
+        return len(self.tree)
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self.tree)):
+            yield self.tree.node_id(i)
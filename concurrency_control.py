@@ -0,0 +1,160 @@
+# 自适应并发（AIMD）：按 provider 控制同时在途的 LLM 请求数。
+# 请求成功且延迟正常时加性增加上限（约每完成「上限」个请求 +1），遇到 429 / 5xx / 超时乘性减半。
+# 线程池可以开得较大（--concurrency 作为上限），实际在途数由本控制器随配额与时段自动调节。
+# 默认关闭，LLM_AIMD=1 开启。
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from settings import load_env
+
+load_env()
+
+LLM_AIMD = os.getenv("LLM_AIMD", "0").strip().lower() in ("1", "true", "on")
+LLM_AIMD_INITIAL = float(os.getenv("LLM_AIMD_INITIAL", "2"))
+LLM_AIMD_MIN = float(os.getenv("LLM_AIMD_MIN", "1"))
+LLM_AIMD_MAX = float(os.getenv("LLM_AIMD_MAX", "32"))
+# 延迟超过「观测到的最低延迟 × 该倍数」视为不健康，不再加并发
+LLM_AIMD_LATENCY_TOLERANCE = float(os.getenv("LLM_AIMD_LATENCY_TOLERANCE", "3"))
+# 可选：把并发上限随时间的变化追加写入 CSV（time_sec,provider,limit,in_flight,event）
+LLM_AIMD_LOG = os.getenv("LLM_AIMD_LOG", "")
+
+# 两次减半之间的最短间隔（秒）：同一波突发里的多个 429 只算一次
+_DECREASE_COOLDOWN_SEC = 2.0
+
+
+def is_overload_error(e: BaseException) -> bool:
+    """429 / 5xx / 超时 视为过载信号；其它错误（如 JSON 解析失败）不影响并发。"""
+    status = getattr(e, "status_code", None) or getattr(e, "code", None)
+    if isinstance(status, int) and (status == 429 or 500 <= status < 600):
+        return True
+    name = type(e).__name__.lower()
+    return "timeout" in name or "ratelimit" in name
+
+
+class AIMDController:
+    """单个 provider 的并发上限与在途计数。"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.limit = max(LLM_AIMD_MIN, min(LLM_AIMD_INITIAL, LLM_AIMD_MAX))
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._min_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._t0 = time.perf_counter()
+        self.history: List[Tuple[float, float]] = [(0.0, self.limit)]
+        self.completed = 0
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency: float, overload: bool) -> None:
+        with self._cond:
+            # 只有上限确实被用满时才值得加：空闲时加上限没有意义，还会在流量回升时一下子放出过多请求
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            old = int(self.limit)
+            if overload:
+                self._decrease_locked("过载")
+            else:
+                self.completed += 1
+                if self._min_latency is None or latency < self._min_latency:
+                    self._min_latency = latency
+                if saturated and latency <= self._min_latency * LLM_AIMD_LATENCY_TOLERANCE:
+                    self.limit = min(LLM_AIMD_MAX, self.limit + 1.0 / self.limit)
+                if int(self.limit) != old:
+                    self._log_locked("增加")
+            self._cond.notify_all()
+
+    def overload(self) -> None:
+        """请求尚未结束但已观测到过载（如 SDK 内部重试前的 429）。"""
+        with self._cond:
+            self._decrease_locked("429")
+            self._cond.notify_all()
+
+    def _decrease_locked(self, event: str) -> None:
+        now = time.perf_counter()
+        if now - self._last_decrease < _DECREASE_COOLDOWN_SEC:
+            return
+        self._last_decrease = now
+        old = int(self.limit)
+        self.limit = max(LLM_AIMD_MIN, self.limit / 2.0)
+        if int(self.limit) != old:
+            self._log_locked(f"减半({event})")
+
+    def _log_locked(self, event: str) -> None:
+        t = time.perf_counter() - self._t0
+        self.history.append((t, self.limit))
+        print(f"[AIMD] {self.name} 并发上限 → {int(self.limit)}（{event}，t={t:.1f}s，在途 {self.in_flight}）")
+        if LLM_AIMD_LOG:
+            try:
+                with open(LLM_AIMD_LOG, "a", encoding="utf-8") as f:
+                    f.write(f"{t:.3f},{self.name},{self.limit:.3f},{self.in_flight},{event}\n")
+            except OSError:
+                pass
+
+    def summary(self) -> str:
+        elapsed = time.perf_counter() - self._t0
+        # 按时间加权的平均上限
+        weighted = 0.0
+        for (t_a, lim), (t_b, _) in zip(self.history, self.history[1:] + [(elapsed, self.limit)]):
+            weighted += int(lim) * (t_b - t_a)
+        avg = weighted / elapsed if elapsed > 0 else self.limit
+        rate = self.completed / elapsed if elapsed > 0 else 0.0
+        return (
+            f"[AIMD] {self.name}：当前上限 {int(self.limit)}，时间加权平均 {avg:.1f}，"
+            f"完成 {self.completed} 次，吞吐 {rate:.2f} 次/秒"
+        )
+
+
+_lock = threading.Lock()
+_controllers: Dict[str, AIMDController] = {}
+
+
+def controller_for(provider: str) -> Optional[AIMDController]:
+    if not LLM_AIMD:
+        return None
+    with _lock:
+        ctl = _controllers.get(provider)
+        if ctl is None:
+            ctl = AIMDController(provider)
+            _controllers[provider] = ctl
+        return ctl
+
+
+@contextmanager
+def slot(provider: str) -> Iterator[None]:
+    """占用 provider 的一个并发名额执行请求，并根据结果调整上限；未开启 AIMD 时直接执行。"""
+    ctl = controller_for(provider)
+    if ctl is None:
+        yield
+        return
+    ctl.acquire()
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        ctl.release(time.perf_counter() - t0, overload=is_overload_error(e))
+        raise
+    ctl.release(time.perf_counter() - t0, overload=False)
+
+
+def note_overload(provider: str) -> None:
+    """SDK 内部自行重试的 429 等，也作为减半信号上报。"""
+    ctl = controller_for(provider)
+    if ctl is not None:
+        ctl.overload()
+
+
+def stats_line() -> str:
+    if not LLM_AIMD:
+        return "[AIMD] 未开启（LLM_AIMD=1 开启）"
+    with _lock:
+        lines = [c.summary() for c in _controllers.values()]
+    return "\n".join(lines) or "[AIMD] 本次未发起 LLM 请求"
@@ -1,13 +1,20 @@
 # 使用 Google 新 SDK (google-genai) 调用 Gemini，支持 gemini-1.5-flash 等全部模型，带请求超时
+import atexit
 import base64
+import hashlib
+import json
 import os
 import re
+import threading
 import time
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-from dotenv import load_dotenv
+import concurrency_control
+from llm_clients import get_gemini_client
+from settings import load_env
+from token_budget import estimate_messages_tokens
 
-load_dotenv()
+load_env()
 
 # 请求超时（秒），避免卡住不动
 GEMINI_REQUEST_TIMEOUT_SEC = int(os.getenv("GEMINI_TIMEOUT_SEC", "180"))
@@ -33,16 +40,11 @@ except ImportError:
 
 
 def _get_client():
-    """创建带超时的 Client。"""
+    """获取进程内共享的带超时 Client（见 llm_clients，长连接复用，不在每次调用后关闭）。"""
     key = os.getenv("GEMINI_API_KEY")
     if not key:
         raise RuntimeError("未配置 GEMINI_API_KEY")
-    # timeout 单位：秒（新 SDK 的 HttpOptions.timeout 一般为秒）
-    timeout_ms = GEMINI_REQUEST_TIMEOUT_SEC * 1000
-    return genai.Client(
-        api_key=key,
-        http_options=types.HttpOptions(timeout=timeout_ms) if types else None,
-    )
+    return get_gemini_client(key, GEMINI_REQUEST_TIMEOUT_SEC)
 
 
 def _message_content_to_parts(content: Any) -> List[Any]:
@@ -68,10 +70,6 @@ def _message_content_to_parts(content: Any) -> List[Any]:
     return parts if parts else [""]
 
 
-def _parts_to_text(parts: List[Any]) -> str:
-    return " ".join(p for p in parts if isinstance(p, str)) if parts else ""
-
-
 def _parse_429_retry_seconds(error: Exception) -> int:
     """从 429 错误信息中解析「Please retry in X.XXs」的秒数，默认 30。"""
     msg = str(getattr(error, "message", "")) or str(error)
@@ -111,6 +109,7 @@ def _do_generate_content(client: Any, model_name: str, contents: Any, config: An
             if status == 429 and attempt < max_attempts - 1:
                 wait_sec = _parse_429_retry_seconds(e)
                 print(f"[Gemini] 触发限流(429)，{wait_sec} 秒后重试 ({attempt + 1}/{max_attempts})…")
+                concurrency_control.note_overload("gemini")
                 time.sleep(wait_sec)
                 continue
             raise
@@ -125,52 +124,246 @@ def _do_generate_content(client: Any, model_name: str, contents: Any, config: An
     raise last_err
 
 
-def gemini_chat(model_name: str, messages: List[Dict[str, Any]], temperature: float = 0.2) -> str:
+def _to_sdk_part(part: Any) -> Any:
+    """_message_content_to_parts 的结果中，字符串转为 Part，其余（图片 Part / inline_data）原样保留。"""
+    if isinstance(part, str) and hasattr(types.Part, "from_text"):
+        return types.Part.from_text(text=part)
+    return part
+
+
+def _split_messages(messages: List[Dict[str, Any]]) -> Tuple[str, List[Any]]:
     """
-    使用新 SDK 单次或多轮对话。
-    messages: [{"role": "system"|"user"|"assistant", "content": str 或 list}, ...]
-    返回最后一轮模型回复文本。
+    将 OpenAI 风格 messages 转为 (system_instruction, 原生多轮 contents)。
+    每轮保留自己的 role（user / model），不再拼成单个「User:/Assistant:」字符串，
+    这样相同的前缀在多次请求间逐字节一致，才能命中服务端前缀缓存。
     """
-    if genai is None or types is None:
-        raise RuntimeError("请安装: pip install google-genai")
-    client = _get_client()
     system = ""
-    turns: List[tuple[str, str]] = []
+    contents: List[Any] = []
     for m in messages:
         role = (m.get("role") or "").strip().lower()
         content = m.get("content")
         if role == "system":
             system = content if isinstance(content, str) else ""
             continue
-        parts = _message_content_to_parts(content)
-        text = _parts_to_text(parts)
         if role == "user":
-            turns.append(("user", text))
+            sdk_role = "user"
         elif role in ("assistant", "model"):
-            turns.append(("model", text))
-    if not turns or turns[-1][0] != "user":
+            sdk_role = "model"
+        else:
+            continue
+        parts = [_to_sdk_part(p) for p in _message_content_to_parts(content)]
+        contents.append(types.Content(role=sdk_role, parts=parts))
+    return system, contents
+
+
+# ---------- 显式上下文缓存（cached content）----------
+# 对大段静态前缀（系统提示词、context.md、PRD 等）在服务端创建一次缓存，本次运行内的后续请求直接引用，
+# 降低每次请求的输入 token 与首字延迟；运行结束时（close_prompt_caches / 进程退出）删除。
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "1").strip().lower() not in ("0", "false", "off")
+# 静态前缀估算 token 低于该值时不创建缓存（服务端对缓存内容有最小 token 要求，且小前缀不划算）
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "4096"))
+# 服务端缓存 TTL（秒）：正常情况下运行结束即删除，TTL 只是进程异常退出时的兜底
+GEMINI_CONTEXT_CACHE_TTL_SEC = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SEC", "900"))
+
+_cache_lock = threading.Lock()
+# key -> 缓存名；创建失败记为 ""，避免反复尝试
+_prompt_caches: Dict[str, str] = {}
+_prompt_cache_uses = 0
+
+
+def _prefix_key(model_name: str, messages: List[Dict[str, Any]]) -> str:
+    payload = json.dumps({"model": model_name, "messages": messages}, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _get_prompt_cache(client: Any, model_name: str, messages: List[Dict[str, Any]], static_prefix: int) -> str:
+    """
+    为 system + 前 static_prefix 条非 system 消息获取（必要时创建）服务端缓存，返回缓存名；不适用时返回 ""。
+    """
+    global _prompt_cache_uses
+    if not GEMINI_CONTEXT_CACHE or not hasattr(client, "caches"):
         return ""
-    prompt_parts = []
-    for r, t in turns:
-        prefix = "User:" if r == "user" else "Assistant:"
-        prompt_parts.append(f"{prefix}\n{t}")
-    prompt = "\n\n".join(prompt_parts)
+    system_msgs = [m for m in messages if (m.get("role") or "").lower() == "system"]
+    turns = [m for m in messages if (m.get("role") or "").lower() != "system"]
+    # 至少留一轮在请求里发送
+    static_prefix = max(0, min(static_prefix, len(turns) - 1))
+    prefix = system_msgs + turns[:static_prefix]
+    if estimate_messages_tokens(prefix) < GEMINI_CONTEXT_CACHE_MIN_TOKENS:
+        return ""
+    key = _prefix_key(model_name, prefix)
+    with _cache_lock:
+        if key not in _prompt_caches:
+            system, contents = _split_messages(prefix)
+            try:
+                cache = client.caches.create(
+                    model=model_name,
+                    config=types.CreateCachedContentConfig(
+                        system_instruction=system or None,
+                        contents=contents or None,
+                        ttl=f"{GEMINI_CONTEXT_CACHE_TTL_SEC}s",
+                        display_name="aitest-" + key[:12],
+                    ),
+                )
+                _prompt_caches[key] = cache.name or ""
+                print(f"[Gemini] 已创建上下文缓存（静态前缀约 {estimate_messages_tokens(prefix)} tokens）")
+            except Exception as e:
+                _prompt_caches[key] = ""
+                print(f"[Gemini] 上下文缓存不可用，按普通请求发送: {type(e).__name__}: {e}")
+        name = _prompt_caches[key]
+        if name:
+            _prompt_cache_uses += 1
+        return name
+
+
+def _invalidate_prompt_cache(name: str) -> None:
+    with _cache_lock:
+        for k, v in list(_prompt_caches.items()):
+            if v == name:
+                _prompt_caches[k] = ""
+
+
+def close_prompt_caches() -> None:
+    """删除本进程创建的全部服务端上下文缓存（流程结束时调用；进程退出时也会自动调用）。"""
+    global _prompt_cache_uses
+    with _cache_lock:
+        names = [n for n in _prompt_caches.values() if n]
+        uses = _prompt_cache_uses
+        _prompt_caches.clear()
+        _prompt_cache_uses = 0
+    if not names:
+        return
+    try:
+        client = _get_client()
+    except Exception:
+        return
+    for name in names:
+        try:
+            client.caches.delete(name=name)
+        except Exception:
+            pass
+    print(f"[Gemini] 已释放 {len(names)} 个上下文缓存（共复用 {uses} 次）")
+
+
+atexit.register(close_prompt_caches)
+
+
+def _build_chat_request(
+    client: Any,
+    model_name: str,
+    messages: List[Dict[str, Any]],
+    temperature: float,
+    static_prefix: int = 0,
+) -> Optional[Tuple[List[Any], Any]]:
+    """
+    将 messages 转为 (contents, config)；最后一轮不是 user 时返回 None。
+    static_prefix > 0 或系统提示词足够大时，静态前缀改为引用服务端上下文缓存，contents 只含其余轮次。
+    """
+    turns = [m for m in messages if (m.get("role") or "").lower() != "system"]
+    if not turns or (turns[-1].get("role") or "").lower() != "user":
+        return None
+    cache_name = _get_prompt_cache(client, model_name, messages, static_prefix)
+    if cache_name:
+        n = max(0, min(static_prefix, len(turns) - 1))
+        _, contents = _split_messages(turns[n:])
+        return contents, types.GenerateContentConfig(cached_content=cache_name, temperature=temperature)
+    system, contents = _split_messages(messages)
     if system:
         config = types.GenerateContentConfig(system_instruction=system, temperature=temperature)
     else:
         config = types.GenerateContentConfig(temperature=temperature)
+    return contents, config
+
+
+def _is_cache_miss_error(e: Exception) -> bool:
+    """引用的上下文缓存已过期/被删除等错误。"""
+    return getattr(e, "code", None) in (400, 403, 404) and "cache" in str(e).lower()
+
+
+def gemini_chat(
+    model_name: str,
+    messages: List[Dict[str, Any]],
+    temperature: float = 0.2,
+    static_prefix: int = 0,
+) -> str:
+    """
+    使用新 SDK 单次或多轮对话（原生多轮 contents + system_instruction）。
+    messages: [{"role": "system"|"user"|"assistant", "content": str 或 list}, ...]
+    static_prefix: system 之后前几条消息在本次运行内不变（如 context、PRD），可放入服务端上下文缓存复用。
+    返回最后一轮模型回复文本。
+    """
+    if genai is None or types is None:
+        raise RuntimeError("请安装: pip install google-genai")
+    client = _get_client()
+    request = _build_chat_request(client, model_name, messages, temperature, static_prefix)
+    if request is None:
+        return ""
+    contents, config = request
     try:
-        response = _do_generate_content(client, model_name, prompt, config)
-    finally:
-        try:
-            client.close()
-        except Exception:
-            pass
+        response = _do_generate_content(client, model_name, contents, config)
+    except ClientError as e:
+        if not (getattr(config, "cached_content", None) and _is_cache_miss_error(e)):
+            raise
+        # 缓存失效：作废后按普通请求重发一次
+        _invalidate_prompt_cache(config.cached_content)
+        contents, config = _build_chat_request(client, model_name, messages, temperature, 0)
+        response = _do_generate_content(client, model_name, contents, config)
     if not response or not getattr(response, "text", None):
         return ""
     return (response.text or "").strip()
 
 
+def gemini_chat_stream(
+    model_name: str,
+    messages: List[Dict[str, Any]],
+    temperature: float = 0.2,
+    static_prefix: int = 0,
+) -> Iterator[str]:
+    """
+    流式版 gemini_chat（generate_content_stream），逐段产出模型回复文本。
+    尚未收到任何内容时遇 429 / 网络断开会按 gemini_chat 的策略等待后重试；已开始输出后出错则直接抛出。
+    """
+    if genai is None or types is None:
+        raise RuntimeError("请安装: pip install google-genai")
+    client = _get_client()
+    request = _build_chat_request(client, model_name, messages, temperature, static_prefix)
+    if request is None:
+        return
+    contents, config = request
+    max_attempts = GEMINI_429_MAX_RETRIES
+    attempt = 0
+    rebuilt = False
+    while True:
+        started = False
+        try:
+            for chunk in client.models.generate_content_stream(model=model_name, contents=contents, config=config):
+                text = getattr(chunk, "text", None)
+                if text:
+                    started = True
+                    yield text
+            return
+        except ClientError as e:
+            if not started and not rebuilt and getattr(config, "cached_content", None) and _is_cache_miss_error(e):
+                # 缓存失效：作废后按普通请求重发一次，与 gemini_chat 一致不占用重试次数
+                # （否则最后一次尝试遇到时循环直接结束，调用方拿到空回复）
+                _invalidate_prompt_cache(config.cached_content)
+                contents, config = _build_chat_request(client, model_name, messages, temperature, 0)
+                rebuilt = True
+                continue
+            if started or getattr(e, "code", None) != 429 or attempt >= max_attempts - 1:
+                raise
+            wait_sec = _parse_429_retry_seconds(e)
+            print(f"[Gemini] 触发限流(429)，{wait_sec} 秒后重试 ({attempt + 1}/{max_attempts})…")
+            concurrency_control.note_overload("gemini")
+            time.sleep(wait_sec)
+        except Exception as e:
+            if started or not _is_retryable_network_error(e) or attempt >= max_attempts - 1:
+                raise
+            wait = GEMINI_NETWORK_RETRY_WAIT_SEC
+            print(f"[Gemini] 网络/连接异常（{type(e).__name__}），{wait} 秒后重试 ({attempt + 1}/{max_attempts})…")
+            time.sleep(wait)
+        attempt += 1
+
+
 def gemini_vision(
     model_name: str,
     image_data_url: str,
@@ -187,18 +380,12 @@ def gemini_vision(
     b64 = m.group(2).strip()
     image_bytes = base64.b64decode(b64)
     client = _get_client()
-    try:
-        if hasattr(types.Part, "from_bytes"):
-            contents = [types.Part.from_bytes(data=image_bytes, mime_type=mime), text_prompt]
-        else:
-            contents = [{"inline_data": {"mime_type": mime, "data": image_bytes}}, text_prompt]
-        config = types.GenerateContentConfig(temperature=temperature)
-        response = _do_generate_content(client, model_name, contents, config)
-    finally:
-        try:
-            client.close()
-        except Exception:
-            pass
+    if hasattr(types.Part, "from_bytes"):
+        contents = [types.Part.from_bytes(data=image_bytes, mime_type=mime), text_prompt]
+    else:
+        contents = [{"inline_data": {"mime_type": mime, "data": image_bytes}}, text_prompt]
+    config = types.GenerateContentConfig(temperature=temperature)
+    response = _do_generate_content(client, model_name, contents, config)
     if not response or not getattr(response, "text", None):
         return ""
     return (response.text or "").strip()
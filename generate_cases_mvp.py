@@ -1,26 +1,39 @@
 # XMind → Excel 核心逻辑。解析 XMind 叶子节点，调 LLM 生成用例并填 Excel，供 Step3 和 app_cases 使用。
 import os
-import re
 import json
-import zipfile
 import io
+import zipfile
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Iterator, Tuple
 
-import pandas as pd
-from dotenv import load_dotenv
-from openai import OpenAI
 from tenacity import retry, stop_after_attempt, wait_exponential
 
-try:
-    from gemini_native import gemini_chat as _gemini_chat
-except ImportError:
-    _gemini_chat = None  # type: ignore[assignment]
+import concurrency_control
+import llm_cache
+from case_journal import CaseJournal, make_fingerprint
+from case_manifest import ManifestWriter, load_manifest, match_manifest
+from case_writer import get_writer_class, map_case_to_row, read_header_row  # noqa: F401 - map_case_to_row 保留旧的导入位置
+from llm_clients import get_openai_client
+from llm_gateway import chat as llm_chat
+from settings import load_env
+from token_budget import estimate_tokens
+from xmind_reader import xmind_leaf_paths
 
 _PROMPT_DIR = Path(__file__).resolve().parent / "prompt"
 _CASES_SYSTEM_PATH = _PROMPT_DIR / "cases_system.txt"
 _CASES_USER_PATH = _PROMPT_DIR / "cases_user.txt"
+_CASES_BATCH_USER_PATH = _PROMPT_DIR / "cases_batch_user.txt"
+
+# 叶子级并发数（同时在途的 LLM 请求数）；1 为串行，可被 --concurrency 覆盖
+CASES_CONCURRENCY = int(os.getenv("CASES_CONCURRENCY", "1"))
+# 增量模式：复用上次清单中路径未变的叶子，可被 --incremental 覆盖
+CASES_INCREMENTAL = os.getenv("CASES_INCREMENTAL", "0").strip().lower() in ("1", "true", "on")
+# 同父兄弟叶子批量打包：单请求估算 token 预算（0 关闭，可被 --batch-tokens 覆盖）与每批最多叶子数
+CASES_BATCH_TOKENS = int(os.getenv("CASES_BATCH_TOKENS", "0"))
+CASES_BATCH_MAX_LEAVES = int(os.getenv("CASES_BATCH_MAX_LEAVES", "8"))
 
 _DEFAULT_SYSTEM = "输出必须是严格JSON。"
 _DEFAULT_USER_TEMPLATE = """
@@ -47,56 +60,41 @@ _DEFAULT_USER_TEMPLATE = """
 }
 """.strip()
 
+_DEFAULT_BATCH_USER_TEMPLATE = """
+你是资深测试工程师。下面多个测试点同属一个父路径，请分别为每个测试点生成测试用例。
+父路径：{{PARENT_PATH}}
+测试点（编号: 名称）：
+{{TEST_POINT_LIST}}
+
+要求：
+- 每个测试点输出 1~3 条测试用例（不要太多）
+- 每条用例包含：title / preconditions / steps / expected / priority
+- steps 和 expected 要一一对应、可执行
+- 每个编号都必须出现在输出中，编号原样作为 key
+- 只能输出严格 JSON，不要解释、不要Markdown
+
+输出JSON格式：
+{
+  "L1": [
+    {
+      "title": "...",
+      "preconditions": ["..."],
+      "steps": ["1...", "2..."],
+      "expected": ["1...", "2..."],
+      "priority": "High|Medium|Low"
+    }
+  ],
+  "L2": [ ... ]
+}
+""".strip()
+
 
 # ========= 1) 解析 XMind =========
 def parse_xmind_leaf_paths(xmind_path: str) -> List[List[str]]:
     """
-    返回所有节点路径（含中间节点），你可以把最后一个视作“测试点”。
+    返回所有叶子节点路径（最后一级即“测试点”）。一次遍历完成，支持 content.json 与 XMind 8 content.xml（见 xmind_reader）。
     """
-    out: List[List[str]] = []
-
-    def walk(node: Dict[str, Any], path: List[str]):
-        title = (node.get("title") or "").strip()
-        cur = path + ([title] if title else [])
-        if title:
-            out.append(cur)
-        for child in node.get("children", {}).get("attached", []) or []:
-            walk(child, cur)
-
-    with zipfile.ZipFile(xmind_path, "r") as z:
-        # 通常是 content.json
-        name = "content.json" if "content.json" in z.namelist() else None
-        if not name:
-            cand = [n for n in z.namelist() if n.endswith("content.json")]
-            if not cand:
-                return []
-            name = cand[0]
-        data = json.loads(z.read(name).decode("utf-8"))
-
-    if isinstance(data, list):
-        for sheet in data:
-            root = sheet.get("rootTopic")
-            if root:
-                walk(root, [])
-    elif isinstance(data, dict):
-        root = data.get("rootTopic")
-        if root:
-            walk(root, [])
-
-    # 只保留“叶子节点路径”（最后一级不再有 children）
-    # 简化：把所有路径里“不是任何其他路径前缀的”当叶子
-    set_paths = [tuple(p) for p in out if len(p) >= 2]
-    set_all = set(set_paths)
-    leaf = []
-    for p in set_paths:
-        is_prefix = False
-        for q in set_paths:
-            if len(q) > len(p) and q[: len(p)] == p:
-                is_prefix = True
-                break
-        if not is_prefix:
-            leaf.append(list(p))
-    return leaf
+    return xmind_leaf_paths(xmind_path)
 
 
 # ========= 2) 提示词与 LLM 调用 =========
@@ -114,6 +112,13 @@ def _load_cases_user_template() -> str:
     return _DEFAULT_USER_TEMPLATE
 
 
+def _load_cases_batch_template() -> str:
+    """从 prompt/cases_batch_user.txt 读取批量用户提示词模板，不存在则用默认。"""
+    if _CASES_BATCH_USER_PATH.exists():
+        return _CASES_BATCH_USER_PATH.read_text(encoding="utf-8").strip()
+    return _DEFAULT_BATCH_USER_TEMPLATE
+
+
 def build_prompt(path: List[str]) -> str:
     """
     根据测试点路径拼出用户 prompt。内容来自 prompt/cases_user.txt，占位符 {{TEST_POINT_PATH}} 会被替换。
@@ -122,58 +127,226 @@ def build_prompt(path: List[str]) -> str:
     return template.replace("{{TEST_POINT_PATH}}", " > ".join(path))
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=8))
-def llm_generate(client: Any, model: str, prompt: str) -> List[Dict[str, Any]]:
-    system_content = _load_cases_system()
-    if client is None and _gemini_chat:
-        text = _gemini_chat(
-            model,
-            [
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.2,
-        )
-        text = (text or "").strip()
-    else:
-        resp = client.chat.completions.create(
-            model=model,
-            temperature=0.2,
-            messages=[
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": prompt},
-            ],
-        )
-        text = (resp.choices[0].message.content or "").strip()
-
-    # 兼容 ```json 包裹
+def _parse_json_text(text: str) -> Any:
+    """解析模型回复中的 JSON（兼容 ```json 包裹）。"""
+    text = (text or "").strip()
     if text.startswith("```"):
         text = text.strip("`").strip()
         if text.lower().startswith("json"):
             text = text[4:].strip()
+    return json.loads(text)
 
-    data = json.loads(text)
-    cases = data.get("cases", [])
+
+def _parse_cases(text: str) -> List[Dict[str, Any]]:
+    """单叶子回复：解析 JSON 并取出 cases；不是对象或 cases 不是列表时抛 ValueError。"""
+    data = _parse_json_text(text)
+    if not isinstance(data, dict):
+        raise ValueError("LLM output: result is not an object")
+    cases = data.get("cases")
     if not isinstance(cases, list):
         raise ValueError("LLM output: cases is not a list")
     return cases
 
 
+def _parse_batch(text: str) -> Dict[str, Any]:
+    """批量回复：解析 JSON，接受 {leaf_id: ...} 或 {"results": {leaf_id: ...}}；否则抛 ValueError。"""
+    data = _parse_json_text(text)
+    if isinstance(data, dict) and isinstance(data.get("results"), dict):
+        data = data["results"]
+    if not isinstance(data, dict):
+        raise ValueError("LLM output: batch result is not an object")
+    return data
+
+
+def _chat_json(client: Any, model: str, prompt: str, parse: Callable[[str], Any]) -> Any:
+    """
+    发送 system(cases_system) + user(prompt)，返回 parse 的结果。
+    parse 同时作为 validate 传给 llm_chat：结构不合法的回复在写入缓存前就抛出，重试与下次运行不会命中坏回复。
+    """
+    text = llm_chat(
+        client,
+        model,
+        [
+            {"role": "system", "content": _load_cases_system()},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.2,
+        validate=parse,
+    )
+    return parse(text)
+
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=8))
+def llm_generate(client: Any, model: str, prompt: str) -> List[Dict[str, Any]]:
+    return _chat_json(client, model, prompt, _parse_cases)
+
+
+# ========= 2.1) 同父兄弟叶子批量打包 =========
+def build_batch_prompt(parent: List[str], leaves: List[Tuple[str, str]]) -> str:
+    """
+    同一父路径下多个叶子共用一次请求。leaves 为 [(leaf_id, 叶子标题), ...]。
+    内容来自 prompt/cases_batch_user.txt，占位符 {{PARENT_PATH}}、{{TEST_POINT_LIST}} 会被替换。
+    """
+    template = _load_cases_batch_template()
+    listing = "\n".join(f"- {leaf_id}: {title}" for leaf_id, title in leaves)
+    return template.replace("{{PARENT_PATH}}", " > ".join(parent)).replace("{{TEST_POINT_LIST}}", listing)
+
+
+@retry(stop=stop_after_attempt(2), wait=wait_exponential(multiplier=1, min=1, max=8))
+def llm_generate_batch(client: Any, model: str, prompt: str) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    批量请求：返回 {leaf_id: cases[]}。结构不合法的条目直接丢弃，由调用方回退为单叶子请求。
+    """
+    data = _chat_json(client, model, prompt, _parse_batch)
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    for leaf_id, value in data.items():
+        cases = value.get("cases") if isinstance(value, dict) else value
+        if isinstance(cases, list) and cases:
+            out[str(leaf_id)] = cases
+    return out
+
+
+def pack_sibling_batches(
+    leaf_paths: List[List[str]],
+    token_budget: int,
+    max_leaves: int = CASES_BATCH_MAX_LEAVES,
+) -> List[List[int]]:
+    """
+    将相邻且父路径相同的叶子按 token 预算打包，返回若干批（每批为 leaf_paths 下标列表，保持原顺序）。
+    单批估算 token = 系统提示词 + 批量模板 + 父路径 + 各叶子标题；超预算或超 max_leaves 即另起一批。
+    """
+    fixed = estimate_tokens(_load_cases_system()) + estimate_tokens(_load_cases_batch_template())
+    batches: List[List[int]] = []
+    cur: List[int] = []
+    cur_parent: Tuple[str, ...] | None = None
+    cur_tokens = 0
+    for i, path in enumerate(leaf_paths):
+        parent = tuple(path[:-1])
+        # 每个叶子占一行 "- Lxx: 标题"
+        leaf_tokens = estimate_tokens(path[-1]) + 4
+        if cur and (
+            parent != cur_parent
+            or len(cur) >= max_leaves
+            or cur_tokens + leaf_tokens > token_budget
+        ):
+            batches.append(cur)
+            cur = []
+        if not cur:
+            cur_parent = parent
+            cur_tokens = fixed + estimate_tokens(" > ".join(parent))
+        cur.append(i)
+        cur_tokens += leaf_tokens
+    if cur:
+        batches.append(cur)
+    return batches
+
+
+def _generate_batch(
+    client: Any,
+    model: str,
+    leaf_paths: List[List[str]],
+    batch: List[int],
+) -> List[List[Dict[str, Any]]]:
+    """执行一批：单叶子直接走 llm_generate；多叶子走批量请求，批量回复中缺失的叶子逐个回退单叶子请求。"""
+    if len(batch) == 1:
+        return [llm_generate(client, model, build_prompt(leaf_paths[batch[0]]))]
+    parent = leaf_paths[batch[0]][:-1]
+    leaf_ids = [f"L{n}" for n in range(1, len(batch) + 1)]
+    prompt = build_batch_prompt(parent, [(lid, leaf_paths[i][-1]) for lid, i in zip(leaf_ids, batch)])
+    try:
+        by_id = llm_generate_batch(client, model, prompt)
+    except Exception as e:
+        print(f"[CASES] 批量请求失败，{len(batch)} 个叶子回退为单叶子请求: {e}")
+        by_id = {}
+    missing = [lid for lid in leaf_ids if lid not in by_id]
+    if by_id and missing:
+        print(f"[CASES] 批量回复缺少 {len(missing)}/{len(batch)} 个叶子，逐个回退单叶子请求")
+    results: List[List[Dict[str, Any]]] = []
+    for lid, i in zip(leaf_ids, batch):
+        cases = by_id.get(lid)
+        if cases is None:
+            cases = llm_generate(client, model, build_prompt(leaf_paths[i]))
+        results.append(cases)
+    return results
+
+
+def iter_leaf_cases(
+    client: Any,
+    model: str,
+    leaf_paths: List[List[str]],
+    concurrency: int = 1,
+    batch_tokens: int = 0,
+    done: Dict[int, List[Dict[str, Any]]] | None = None,
+    journal: CaseJournal | None = None,
+    timings: Dict[int, float] | None = None,
+) -> Iterator[Tuple[int, List[str], List[Dict[str, Any]]]]:
+    """
+    按叶子顺序逐个产出 (叶子序号, 测试点路径, 用例列表)，叶子序号即在 leaf_paths 中的下标。
+    concurrency > 1 时用线程池并发调用 LLM（最多 concurrency 个请求在途），
+    但产出顺序始终与 leaf_paths 一致，保证 Excel 行序与 XMind 叶子顺序相同。
+    batch_tokens > 0 时启用同父兄弟叶子批量打包（单批估算 token 不超过该预算）。
+    done: 已完成叶子 {序号: 用例}（断点续跑 / 增量复用），这些叶子直接产出、不再请求。
+    journal: 每批生成完立即写入日志（在工作线程中完成，不等前面的慢请求）。
+    timings: 传入时记录每个新生成叶子的耗时（批量请求按叶子数均摊），供增量清单统计节省时间。
+    """
+    done = done or {}
+    if batch_tokens > 0:
+        batches = pack_sibling_batches(leaf_paths, batch_tokens)
+        print(f"[CASES] 批量模式：{len(leaf_paths)} 个叶子打包为 {len(batches)} 个请求（预算 {batch_tokens} tokens/请求）")
+    else:
+        batches = [[i] for i in range(len(leaf_paths))]
+    if done:
+        batches = [b for b in ([i for i in batch if i not in done] for batch in batches) if b]
+
+    def _run(batch: List[int]) -> List[List[Dict[str, Any]]]:
+        t0 = time.perf_counter()
+        results = _generate_batch(client, model, leaf_paths, batch)
+        if timings is not None:
+            per_leaf = (time.perf_counter() - t0) / len(batch)
+            for i in batch:
+                timings[i] = per_leaf
+        if journal is not None:
+            for i, cases in zip(batch, results):
+                journal.record(i, leaf_paths[i], cases)
+        return results
+
+    def _ordered(results_for: Any) -> Iterator[Tuple[int, List[str], List[Dict[str, Any]]]]:
+        # 按叶子序号逐个产出：批次剔除已完成叶子后不再连续，已完成叶子可能夹在同一批次的成员之间
+        batch_of = {i: batch for batch in batches for i in batch}
+        pending: Dict[int, List[Dict[str, Any]]] = {}
+        for i in range(len(leaf_paths)):
+            if i in done:
+                yield i, leaf_paths[i], done[i]
+                continue
+            if i not in pending:
+                batch = batch_of[i]
+                pending = dict(zip(batch, results_for(batch)))
+            yield i, leaf_paths[i], pending.pop(i)
+
+    if concurrency <= 1:
+        yield from _ordered(_run)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="cases")
+    try:
+        futures = {batch[0]: executor.submit(_run, batch) for batch in batches}
+        yield from _ordered(lambda batch: futures[batch[0]].result())
+    finally:
+        # 出错或调用方提前停止时，取消尚未开始的请求
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
 # ========= 3) 写入 Excel（按模板表头自动匹配） =========
 def read_template_columns(xlsx_path: str, sheet_name: str = None) -> List[str]:
     """
-    读取用例模板表头：
+    读取用例模板表头（只读模式，仅读第一行）：
     - 默认取第一个工作表
     - sheet_name 传入时则按指定工作表名/索引
     """
     try:
-        df_or_dict = pd.read_excel(
-            xlsx_path,
-            sheet_name=sheet_name if sheet_name is not None else 0,
-            engine="openpyxl",
-        )
-    except ValueError as e:
-        # pandas 有时无法自动识别格式（例如文件不是标准 xlsx、内容损坏、或被错误改了后缀）
+        return read_header_row(xlsx_path, sheet_name)
+    except (ValueError, KeyError, IndexError, OSError, zipfile.BadZipFile) as e:
+        # 文件不是标准 xlsx、内容损坏、或被错误改了后缀
         raise SystemExit(
             f"读取模板失败：{xlsx_path}\n"
             f"- 可能原因：文件不是标准 .xlsx（例如 .csv 改后缀）、文件损坏、或被占用\n"
@@ -181,64 +354,36 @@ def read_template_columns(xlsx_path: str, sheet_name: str = None) -> List[str]:
             f"- 原始错误：{e}"
         )
 
-    # 兼容 sheet_name=None 返回 dict 的情况，取第一个 sheet
-    if isinstance(df_or_dict, dict):
-        if not df_or_dict:
-            raise SystemExit(f"读取模板失败：{xlsx_path} 没有任何工作表")
-        df = next(iter(df_or_dict.values()))
-    else:
-        df = df_or_dict
-
-    return list(df.columns)
-
-
-def _strip_leading_number(text: str) -> str:
-    """去掉字符串开头已有的序号（如 '1. '、'2、'），避免与后续统一编号重复成 1.1、2.2。"""
-    if not (text or text.strip()):
-        return text
-    return re.sub(r"^\s*\d+[\.、]\s*", "", text.strip()).strip() or text.strip()
-
 
-def map_case_to_row(case: Dict[str, Any], columns: List[str]) -> Dict[str, Any]:
+def generate_cases_from_xmind_bytes(
+    xmind_bytes: bytes,
+    template_xlsx: str,
+    concurrency: int | None = None,
+    batch_tokens: int | None = None,
+    journal_path: str | None = None,
+    resume: bool = False,
+    manifest_path: str | None = None,
+    incremental: bool | None = None,
+    output_path: str | None = None,
+    output_format: str = "xlsx",
+) -> bytes | None:
     """
-    按列名关键词匹配，尽量通用：
-    - 名称/标题/summary
-    - 前置/precondition
-    - 步骤/step
-    - 预期/expected
-    - 优先级/priority
+    将上传的 XMind bytes + 本地模板生成用例文件：传 output_path 时边生成边写入该文件并返回 None，
+    否则返回文件 bytes（用于 Web 下载）。两种方式都逐条写出，不在内存中攒全部行。
+    output_format: xlsx（默认）/ csv / jsonl / testlink，见 case_writer.EXPORT_FORMATS；jsonl、testlink 不需要模板。
+    concurrency: 叶子级并发数，默认取 CASES_CONCURRENCY；行顺序不受并发影响。开启 LLM_AIMD 时为在途请求数上限。
+    batch_tokens: 同父兄弟叶子批量打包的 token 预算，默认取 CASES_BATCH_TOKENS；0 为逐叶子请求。
+    journal_path: 断点续跑日志路径（None 不记录）；resume=True 时跳过日志中已完成的叶子。
+    manifest_path: 增量清单路径（None 不读写）；边生成边写入本次全部叶子的用例，成功后替换旧清单。
+    incremental: 为 True 时复用清单中路径未变的叶子，只为新增/改动的叶子请求 LLM；默认取 CASES_INCREMENTAL。
     """
-    title = case.get("title", "")
-    pre = "\n".join(case.get("preconditions", []) or [])
-    raw_steps = case.get("steps", []) or []
-    raw_expected = case.get("expected", []) or []
-    steps = "\n".join([f"{i+1}. {_strip_leading_number(s)}" for i, s in enumerate(raw_steps)])
-    exp = "\n".join([f"{i+1}. {_strip_leading_number(e)}" for i, e in enumerate(raw_expected)])
-    prio = case.get("priority", "Medium")
-
-    row = {}
-    for col in columns:
-        k = str(col).lower()
-        if ("summary" in k) or ("标题" in col) or ("名称" in col) or ("用例" in col and "名" in col):
-            row[col] = title
-        elif ("precondition" in k) or ("前置" in col):
-            row[col] = pre
-        elif ("step" in k) or ("步骤" in col) or ("操作" in col):
-            row[col] = steps
-        elif ("expected" in k) or ("预期" in col) or ("结果" in col):
-            row[col] = exp
-        elif ("priority" in k) or ("优先级" in col):
-            row[col] = prio
-        else:
-            row[col] = ""
-    return row
-
-
-def generate_cases_from_xmind_bytes(xmind_bytes: bytes, template_xlsx: str) -> bytes:
-    """
-    将上传的 XMind bytes + 本地模板，生成 Excel bytes（用于 Web 下载）。
-    """
-    load_dotenv()
+    incremental = CASES_INCREMENTAL if incremental is None else incremental
+    if concurrency is None and "CASES_CONCURRENCY" not in os.environ and concurrency_control.LLM_AIMD:
+        # 开启 AIMD 且未指定并发数：线程池开到 AIMD 上限，实际在途请求数由自适应控制器调节
+        concurrency = int(concurrency_control.LLM_AIMD_MAX)
+    concurrency = max(1, concurrency or CASES_CONCURRENCY)
+    batch_tokens = CASES_BATCH_TOKENS if batch_tokens is None else max(0, batch_tokens)
+    load_env()
     use_gemini_native = bool(os.getenv("GEMINI_API_KEY"))
     if use_gemini_native:
         model = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
@@ -248,10 +393,11 @@ def generate_cases_from_xmind_bytes(xmind_bytes: bytes, template_xlsx: str) -> b
         api_key = os.getenv("DASHSCOPE_API_KEY")
         base_url = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
         model = os.getenv("QWEN_MODEL", "qwen-plus")
-        client = OpenAI(api_key=api_key, base_url=base_url) if api_key else None
+        client = get_openai_client(api_key, base_url) if api_key else None
     if not api_key and not use_gemini_native:
         raise SystemExit("请在 .env 里配置 GEMINI_API_KEY 或 DASHSCOPE_API_KEY")
-    if not os.path.exists(template_xlsx):
+    writer_cls = get_writer_class(output_format)
+    if writer_cls.uses_template and not os.path.exists(template_xlsx):
         raise SystemExit(f"找不到模板文件：{template_xlsx}")
 
     # 写入临时 xmind 文件
@@ -264,24 +410,81 @@ def generate_cases_from_xmind_bytes(xmind_bytes: bytes, template_xlsx: str) -> b
         if not leaf_paths:
             raise SystemExit("没有解析到有效的 XMind 叶子节点（测试点）")
         print(f"[CASES] 解析到叶子测试点数量: {len(leaf_paths)}")
-        columns = read_template_columns(template_xlsx)
-        rows: List[Dict[str, Any]] = []
+        columns = read_template_columns(template_xlsx) if writer_cls.uses_template else []
+
+        journal = None
+        done: Dict[int, List[Dict[str, Any]]] = {}
+        timings: Dict[int, float] = {}
+        reused: Dict[int, List[Dict[str, Any]]] = {}
+        reused_sec: Dict[int, float] = {}
+        if manifest_path and incremental:
+            previous = load_manifest(Path(manifest_path), model, llm_cache.PROMPT_VERSION)
+            reused, reused_sec, removed = match_manifest(leaf_paths, previous)
+            done.update(reused)
+            timings.update(reused_sec)
+            print(
+                f"[增量] 复用未变化叶子 {len(reused)} 个，新增/改动 {len(leaf_paths) - len(reused)} 个，已删除 {removed} 个"
+            )
+        if journal_path:
+            fingerprint = make_fingerprint(xmind_bytes, model, llm_cache.PROMPT_VERSION)
+            journal = CaseJournal(Path(journal_path), fingerprint, resume=resume)
+            if resume:
+                resumed = {i: c for i, c in journal.load(leaf_paths).items() if i not in done}
+                done.update(resumed)
+                print(f"[续跑] 日志中已完成 {len(resumed)} 个叶子，只生成剩余 {len(leaf_paths) - len(done)} 个")
 
         # 每个叶子节点生成 1~3 条
-        for idx, path in enumerate(leaf_paths, start=1):
-            prompt = build_prompt(path)
-            cases = llm_generate(client, model, prompt)
-            for c in cases:
-                rows.append(map_case_to_row(c, columns))
-            if idx % 5 == 0:
-                print(f"[CASES] 已处理测试点 {idx}/{len(leaf_paths)}，当前用例总数={len(rows)}")
-
-        out_df = pd.DataFrame(rows, columns=columns)
-        buf = io.BytesIO()
-        out_df.to_excel(buf, index=False)
-        buf.seek(0)
-        print(f"[CASES] 生成用例完成，总用例数={len(rows)}")
-        return buf.getvalue()
+        if concurrency > 1:
+            aimd = "，实际在途数由 AIMD 自适应调节" if concurrency_control.LLM_AIMD else ""
+            print(f"[CASES] 并发模式：最多 {concurrency} 个请求同时进行{aimd}")
+        buf = io.BytesIO() if output_path is None else None
+        writer = writer_cls(output_path if output_path is not None else buf, columns)
+        # 清单随叶子产出逐条写入临时文件，不在内存中保留全部用例
+        manifest = ManifestWriter(Path(manifest_path), model, llm_cache.PROMPT_VERSION) if manifest_path else None
+        t0 = time.perf_counter()
+        try:
+            leaf_iter = iter_leaf_cases(
+                client, model, leaf_paths, concurrency, batch_tokens, done=done, journal=journal, timings=timings
+            )
+            idx = 0
+            for idx, (leaf_idx, path, cases) in enumerate(leaf_iter, start=1):
+                if manifest is not None:
+                    manifest.add(path, cases, timings.get(leaf_idx, 0.0))
+                for c in cases:
+                    writer.write_case(path, c)
+                if idx % 5 == 0:
+                    print(f"[CASES] 已处理测试点 {idx}/{len(leaf_paths)}，当前用例总数={writer.rows}")
+            if idx != len(leaf_paths):
+                raise RuntimeError(f"产出叶子数 {idx} 与解析到的叶子数 {len(leaf_paths)} 不一致")
+        except BaseException:
+            writer.abort()
+            if manifest is not None:
+                manifest.abort()
+            if journal is not None:
+                print(f"[续跑] 生成中断，已完成的叶子保存在 {journal.path}，加 --resume 重新运行可继续")
+            raise
+        finally:
+            if journal is not None:
+                journal.close()
+        elapsed = time.perf_counter() - t0
+        generated = len(leaf_paths) - len(done)
+        print(
+            f"[CASES] LLM 生成耗时 {elapsed:.1f}s，吞吐 {generated / max(elapsed, 1e-6):.2f} 叶子/秒"
+            f"（并发={concurrency}）"
+        )
+        if manifest is not None:
+            manifest.commit()
+            if incremental and reused:
+                # 复用叶子上次的请求耗时累计；并发时按并发数折算为墙钟时间
+                saved_sec = sum(reused_sec.values())
+                print(
+                    f"[增量] 复用 {len(reused)}/{len(leaf_paths)} 个叶子，节省 LLM 请求耗时约 {saved_sec:.1f}s"
+                    f"（并发={concurrency}，墙钟约 {saved_sec / concurrency:.1f}s）"
+                )
+
+        writer.close()
+        print(f"[CASES] 生成用例完成，总用例数={writer.rows}")
+        return buf.getvalue() if buf is not None else None
     finally:
         try:
             os.remove(tmp_path)
@@ -303,9 +506,7 @@ def main():
     with open(xmind_file, "rb") as f:
         xmind_bytes = f.read()
 
-    excel_bytes = generate_cases_from_xmind_bytes(xmind_bytes, template_xlsx)
-    with open(out_xlsx, "wb") as f:
-        f.write(excel_bytes)
+    generate_cases_from_xmind_bytes(xmind_bytes, template_xlsx, output_path=out_xlsx)
 
     print(f"✅ 已生成：{out_xlsx}")
 
@@ -1,64 +1,48 @@
 # 需求 → 测试点核心逻辑（含 get_req_text、图片识别、5W1H、llm_generate_struct、build_test_point_prompt 等）
 import base64
+import hashlib
 import json
 import os
 import re
 import sys
-import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List, Optional
-from urllib.request import urlopen, Request
-
-from dotenv import load_dotenv
-from jsonschema import validate
-from openai import OpenAI
-from pypdf import PdfReader
-
-try:
-    from gemini_native import gemini_chat as _gemini_chat
-    from gemini_native import gemini_vision as _gemini_vision
-except ImportError:
-    _gemini_chat = _gemini_vision = None  # type: ignore[assignment]
-
-try:
-    import json_repair
-except ImportError:
-    json_repair = None  # type: ignore[assignment]
-
-load_dotenv()
-
-
-def _get_llm_config():
-    """优先使用 Gemini（原生 SDK），否则使用 DashScope。"""
-    if os.getenv("GEMINI_API_KEY"):
-        return {
-            "provider": "gemini",
-            "api_key": os.getenv("GEMINI_API_KEY"),
-            "base_url": os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta/openai/"),
-            "model": os.getenv("GEMINI_MODEL", "gemini-2.0-flash"),
-            "vision_model": os.getenv("GEMINI_VISION_MODEL", "gemini-2.0-flash"),
-        }
-    api_key = os.getenv("DASHSCOPE_API_KEY")
-    if not api_key:
-        raise SystemExit("请在 .env 里配置 GEMINI_API_KEY 或 DASHSCOPE_API_KEY")
-    return {
-        "provider": "dashscope",
-        "api_key": api_key,
-        "base_url": os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"),
-        "model": os.getenv("DASHSCOPE_MODEL", "qwen-plus"),
-        "vision_model": os.getenv("DASHSCOPE_VISION_MODEL", "qwen-vl-plus"),
-    }
-
-
-_cfg = _get_llm_config()
-USE_NATIVE_GEMINI = _cfg.get("provider") == "gemini"
-API_KEY = _cfg["api_key"]
-BASE_URL = _cfg["base_url"]
-MODEL = _cfg["model"]
-VISION_MODEL = _cfg["vision_model"]
-client = None if USE_NATIVE_GEMINI else OpenAI(api_key=API_KEY, base_url=BASE_URL)
+from typing import Any, Callable, Dict, List, Optional
+
+import rate_limiter
+import settings
+import vision_cache
+from json_stream import SectionStreamParser
+from llm_gateway import chat as llm_chat, chat_stream as llm_chat_stream, provider_of
+from token_budget import estimate_tokens
+
+settings.load_env()
+
+# pypdf / jsonschema / json_repair / google-genai / urllib.request 导入较慢，均在用到时才导入；
+# LLM 配置与客户端由 settings 在首次调用时创建，import 本模块不读配置、不会因缺少密钥退出。
+_LEGACY_CONFIG = {
+    "API_KEY": "api_key",
+    "BASE_URL": "base_url",
+    "MODEL": "model",
+    "VISION_MODEL": "vision_model",
+}
+
+
+def __getattr__(name: str) -> Any:
+    """兼容旧的模块级常量（generate_md_v2.MODEL、generate_md_v2.client 等），访问时才解析配置。"""
+    if name in _LEGACY_CONFIG:
+        return settings.llm_config()[_LEGACY_CONFIG[name]]
+    if name == "USE_NATIVE_GEMINI":
+        return settings.use_native_gemini()
+    if name == "client":
+        return settings.text_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 ROOT = Path(__file__).resolve().parent
+# Markdown 内嵌图片的并发识别数（同时在途的视觉模型请求数）
+VISION_CONCURRENCY = int(os.getenv("VISION_CONCURRENCY", "4"))
 CONTEXT_GOODS_PATH = "context.md"
 SYSTEM_TEMPLATE_PATH = ROOT / "prompt" / "system_template.txt"
 
@@ -77,6 +61,8 @@ def read_pdf_text(path: str) -> str:
     从 PDF 文件提取文本（适用于可选中文字的数字 PDF）。
     若为扫描件/纯图 PDF，提取结果可能为空，建议改为上传图片或使用 OCR。
     """
+    from pypdf import PdfReader
+
     reader = PdfReader(path)
     parts = []
     for page in reader.pages:
@@ -95,74 +81,125 @@ def read_pdf_text(path: str) -> str:
     return text
 
 
-def _image_to_data_url(image_path: str) -> str:
-    """将本地图片转为 data URL，供视觉 API 使用。"""
-    ext = os.path.splitext(image_path)[1].lower()
-    mime = {
-        ".png": "image/png",
-        ".jpg": "image/jpeg",
-        ".jpeg": "image/jpeg",
-        ".webp": "image/webp",
-    }.get(ext, "image/jpeg")
-    with open(image_path, "rb") as f:
-        b64 = base64.b64encode(f.read()).decode("utf-8")
-    return f"data:{mime};base64,{b64}"
+_IMAGE_MIME = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+}
 
 
-def image_to_requirement_text(image_path: str) -> tuple[str, str]:
-    """
-    用多模态视觉模型理解图片中的需求，返回 (需求描述文本, 本轮对话记录 Markdown)。
-    """
-    data_url = _image_to_data_url(image_path)
-    prompt = """请用多模态能力理解本图，并输出一份「软件需求描述」，便于后续编写测试点。要求：
+def _image_mime(name: str, default: str = "image/jpeg") -> str:
+    """按扩展名推断图片 MIME（name 可以是路径或 URL）。"""
+    ext = os.path.splitext(name.split("?", 1)[0])[1].lower()
+    return _IMAGE_MIME.get(ext, default)
+
+
+def _bytes_to_data_url(data: bytes, mime: str) -> str:
+    return f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}"
+
+
+def _gemini_vision() -> Optional[Callable[..., str]]:
+    """按需导入 Gemini 原生视觉调用（google-genai 导入耗时较长）；未安装时返回 None。"""
+    try:
+        from gemini_native import gemini_vision
+    except ImportError:
+        return None
+    return gemini_vision
+
+
+_VISION_PROMPT = """请用多模态能力理解本图，并输出一份「软件需求描述」，便于后续编写测试点。要求：
 - 若为逻辑图/流程图/架构图：理解节点、箭头、分支与流程，用文字描述业务逻辑、判断条件、状态流转与数据流，不要只罗列图中的文字。
 - 若为需求文档/说明：提取并整理为条理清晰的需求正文（可保留小标题与要点）。
 - 若为界面截图/原型图：描述页面元素、功能入口、主要操作与业务逻辑。
 不要做纯 OCR 式的文字识别；重点理解图所表达的逻辑与需求。只输出需求正文，不要输出“根据图片……”等前缀。"""
-    if USE_NATIVE_GEMINI and _gemini_vision:
-        req_text = _gemini_vision(VISION_MODEL, data_url, prompt, temperature=0.2)
+
+
+def image_to_requirement_text(image_path: str) -> tuple[str, str]:
+    """
+    用多模态视觉模型理解图片中的需求，返回 (需求描述文本, 本轮对话记录 Markdown)。
+    """
+    with open(image_path, "rb") as f:
+        data = f.read()
+    return image_bytes_to_requirement_text(data, _image_mime(image_path))
+
+
+def image_bytes_to_requirement_text(data: bytes, mime: str, digest: Optional[str] = None) -> tuple[str, str]:
+    """
+    同 image_to_requirement_text，图片以内存中的字节给出（如下载得到的图片，不落临时文件）。
+    识别结果按图片内容哈希缓存（见 vision_cache），同一张图再次识别时直接复用；digest 为已算好的 SHA-256。
+    """
+    prompt = _VISION_PROMPT
+    cfg = settings.llm_config()
+    client = settings.text_client()
+    provider = provider_of(client)
+    key = vision_cache.make_key(digest or vision_cache.image_digest(data), provider, cfg["vision_model"], prompt, 0.2)
+    req_text = vision_cache.get(key)
+    if req_text is None:
+        req_text = _recognize_image(client, cfg["vision_model"], _bytes_to_data_url(data, mime), prompt)
+        vision_cache.put(key, req_text, provider=provider, model=cfg["vision_model"])
     else:
-        resp = client.chat.completions.create(
-            model=VISION_MODEL,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "image_url", "image_url": {"url": data_url}},
-                        {"type": "text", "text": prompt},
-                    ],
-                }
-            ],
-            temperature=0.2,
-        )
-        req_text = (resp.choices[0].message.content or "").strip()
+        print(f"[视觉] 命中缓存，跳过识别（{len(req_text)} 字）")
     vision_md = (
         "## 第1轮：图片识别\n\n**User**\n\n(已发送图片)\n\n" + prompt + "\n\n**Assistant**\n\n" + req_text
     )
     return (req_text, vision_md)
 
 
+def _recognize_image(client: Any, vision_model: str, data_url: str, prompt: str) -> str:
+    """调用视觉模型识别一张图片（data URL），返回识别文本。"""
+    vision = _gemini_vision() if client is None else None
+    # 图片按固定 1000 token 估算，加上文字提示词
+    rate_limiter.acquire(provider_of(client), vision_model, 1000 + estimate_tokens(prompt))
+    if vision:
+        return vision(vision_model, data_url, prompt, temperature=0.2)
+    resp = client.chat.completions.create(
+        model=vision_model,
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {"type": "image_url", "image_url": {"url": data_url}},
+                    {"type": "text", "text": prompt},
+                ],
+            }
+        ],
+        temperature=0.2,
+    )
+    return (resp.choices[0].message.content or "").strip()
+
+
 # 图片引用正则：![alt](url_or_path)
 _IMG_REF_RE = re.compile(r"!\[([^\]]*)\]\(([^)]+)\)")
 
 
-def _download_image_to_temp(url: str) -> str:
-    """从 URL 下载图片到临时文件，返回本地路径。"""
+def _fetch_image(url: str) -> tuple[bytes, str]:
+    """从 URL 下载图片到内存，返回 (字节, MIME)。MIME 优先取响应头，其次按 URL 扩展名，默认 image/png。"""
+    from urllib.request import Request, urlopen
+
     req = Request(url, headers={"User-Agent": "Mozilla/5.0"})
     with urlopen(req, timeout=30) as resp:
         data = resp.read()
-        ct = resp.headers.get("Content-Type", "")
-    ext = ".png"
-    if "jpeg" in ct or "jpg" in ct:
-        ext = ".jpg"
-    elif "webp" in ct:
-        ext = ".webp"
-    fd, path = tempfile.mkstemp(suffix=ext)
-    try:
-        os.write(fd, data)
-    finally:
-        os.close(fd)
-    return path
+        ct = (resp.headers.get("Content-Type") or "").split(";", 1)[0].strip().lower()
+    if ct.startswith("image/"):
+        mime = "image/jpeg" if ct == "image/jpg" else ct
+    else:
+        mime = _image_mime(url, default="image/png")
+    return data, mime
+
+
+def _load_image_ref(url_or_path: str, base_path: Path) -> Optional[tuple[bytes, str]]:
+    """读取一处图片引用的内容：URL 下载到内存，相对路径按 base_path 解析；取不到返回 None。"""
+    if url_or_path.startswith(("http://", "https://")):
+        try:
+            return _fetch_image(url_or_path)
+        except Exception as e:
+            print(f"[视觉] 图片下载失败，保留原图引用: {url_or_path}（{e}）")
+            return None
+    full = (base_path / url_or_path).resolve()
+    if not full.is_file():
+        return None
+    return full.read_bytes(), _image_mime(str(full))
 
 
 def enrich_markdown_with_image_content(md_text: str, base_dir: str = ".") -> str:
@@ -170,52 +207,74 @@ def enrich_markdown_with_image_content(md_text: str, base_dir: str = ".") -> str
     解析 Markdown 中的图片引用 ![](url)：统一用多模态视觉模型理解图中逻辑与需求，
     将结果替换原图片引用。不再读取或复用任何 OCR 注释，逻辑图/流程图等均由 AI 直接解析。
 
+    分两阶段：先收集全部引用，按地址去重后并发读取/下载（在内存中，不落临时文件），
+    再按内容哈希去重、并发识别（同时在途的识别请求不超过 VISION_CONCURRENCY），最后统一替换。
+    同一张图被引用多次（地址相同或内容相同）只识别一次；识别结果按内容哈希持久缓存，
+    文档更新后重跑时只有新增/改动的图片会调用视觉模型。
+
     base_dir: 解析相对路径时的基准目录（通常为 md 文件所在目录）。
     """
+    matches = list(_IMG_REF_RE.finditer(md_text))
+    if not matches:
+        return md_text
     base_path = Path(base_dir) if base_dir else Path(".")
-
-    def _replace_one(match: re.Match) -> str:
-        alt = match.group(1) or "图片"
-        url_or_path = match.group(2).strip()
-
-        local_path: Optional[str] = None
-        if url_or_path.startswith(("http://", "https://")):
-            try:
-                local_path = _download_image_to_temp(url_or_path)
-            except Exception:
-                return match.group(0)
-        else:
-            full = (base_path / url_or_path).resolve()
-            if full.exists() and full.is_file():
-                local_path = str(full)
-            else:
-                return match.group(0)
-
-        if not local_path:
-            return match.group(0)
-
-        is_local = not url_or_path.startswith(("http://", "https://"))
-        display_path = url_or_path if len(url_or_path) <= 60 else url_or_path[:57] + "..."
-        print(f"[视觉] 正在解析图片: {alt or '图片'} ({'本地文件: ' if is_local else '已下载: '}{display_path})")
+    t0 = time.perf_counter()
+    refs = list(dict.fromkeys(m.group(2).strip() for m in matches))
+
+    # 阶段 1：按地址去重后并发读取，再按内容哈希归并
+    with ThreadPoolExecutor(max_workers=max(1, min(VISION_CONCURRENCY, len(refs))), thread_name_prefix="vision-fetch") as pool:
+        loaded = dict(zip(refs, pool.map(lambda r: _load_image_ref(r, base_path), refs)))
+    digest_of: Dict[str, str] = {}
+    images: Dict[str, tuple[bytes, str, str]] = {}
+    for ref, item in loaded.items():
+        if item is None:
+            continue
+        digest = hashlib.sha256(item[0]).hexdigest()
+        digest_of[ref] = digest
+        images.setdefault(digest, (item[0], item[1], ref))
+
+    # 阶段 2：每张不同内容的图片识别一次
+    def _recognize(digest: str) -> str:
+        data, mime, ref = images[digest]
+        alt = next((m.group(1) for m in matches if m.group(2).strip() == ref), "") or "图片"
+        is_local = not ref.startswith(("http://", "https://"))
+        display_path = ref if len(ref) <= 60 else ref[:57] + "..."
+        print(f"[视觉] 正在解析图片: {alt} ({'本地文件: ' if is_local else '已下载: '}{display_path})")
         try:
-            recognized, _ = image_to_requirement_text(local_path)
+            recognized, _ = image_bytes_to_requirement_text(data, mime, digest)
         except Exception as e:
-            print(f"[视觉] 解析失败（该图将不会进入后续分析）: {e}")
-            recognized = ""
-        finally:
-            if url_or_path.startswith(("http://", "https://")):
-                try:
-                    os.unlink(local_path)
-                except OSError:
-                    pass
+            print(f"[视觉] 解析失败（该图将不会进入后续分析）: {display_path}: {e}")
+            return ""
+        if recognized:
+            print(f"[视觉] 解析完成，得到 {len(recognized)} 字: {display_path}")
+        else:
+            print(f"[视觉] 解析结果为空，保留原图引用: {display_path}")
+        return recognized
 
+    digests = list(images)
+    hits_before = vision_cache.stats()["hits"]
+    workers = max(1, min(VISION_CONCURRENCY, len(digests)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vision") as pool:
+        results = dict(zip(digests, pool.map(_recognize, digests)))
+
+    # 阶段 3：统一替换
+    def _replace_one(match: re.Match) -> str:
+        alt = match.group(1) or "图片"
+        recognized = results.get(digest_of.get(match.group(2).strip(), ""), "")
         if recognized:
-            print(f"[视觉] 解析完成，得到 {len(recognized)} 字")
             return f"\n\n<!-- 图片「{alt}」识别结果：\n{recognized}\n-->\n\n"
-        print(f"[视觉] 解析结果为空，保留原图引用")
         return match.group(0)
 
-    return _IMG_REF_RE.sub(_replace_one, md_text)
+    out = _IMG_REF_RE.sub(_replace_one, md_text)
+    reused = sum(1 for m in matches if m.group(2).strip() in digest_of) - len(digests)
+    cached = vision_cache.stats()["hits"] - hits_before
+    print(
+        f"[视觉] 图片引用 {len(matches)} 处，识别 {len(digests)} 张"
+        + (f"（重复引用 {reused} 处复用结果）" if reused > 0 else "")
+        + (f"，其中 {cached} 张命中缓存" if cached > 0 else "")
+        + f"，并发 {workers}，耗时 {time.perf_counter() - t0:.1f}s"
+    )
+    return out
 
 
 def read_markdown_with_images(path: str) -> str:
@@ -246,12 +305,16 @@ def get_req_text(in_path: Path | str, prefix: str = "[解析]") -> str:
     return read_text(str(p))
 
 
-def llm_generate_struct_from_image(image_path: str) -> tuple[Dict[str, Any], str]:
-    """从需求图片生成测试点结构，返回 (结构 dict, 完整对话记录 Markdown)。"""
+def llm_generate_struct_from_image(
+    image_path: str,
+    stream: bool = False,
+    on_section: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> tuple[Dict[str, Any], str]:
+    """从需求图片生成测试点结构，返回 (结构 dict, 完整对话记录 Markdown)。stream/on_section 同 llm_generate_struct。"""
     req_text, vision_md = image_to_requirement_text(image_path)
     if not req_text:
         raise ValueError("视觉模型未返回需求内容，请换图或检查图片是否清晰。")
-    data, conv_md = llm_generate_struct(req_text)
+    data, conv_md = llm_generate_struct(req_text, stream=stream, on_section=on_section)
     # 合并为一份对话记录：总标题 + 第1轮图片识别 + 第2轮测试点生成（去掉 conv 内重复的 # 对话记录）
     second_part = conv_md.replace("# 对话记录\n\n", "", 1).strip()
     full_conv = "# 对话记录\n\n" + vision_md + "\n\n---\n\n## 第2轮：测试点生成\n\n" + second_part
@@ -274,25 +337,15 @@ def llm_req_analysis_5w1h(req_text: str) -> str:
 【需求正文】
 {req_text}
 """
-    if USE_NATIVE_GEMINI and _gemini_chat:
-        raw = _gemini_chat(
-            MODEL,
-            [
-                {"role": "system", "content": "你输出一篇简洁的 Markdown 需求分析，语言浅显易懂。"},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.3,
-        )
-    else:
-        resp = client.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {"role": "system", "content": "你输出一篇简洁的 Markdown 需求分析，语言浅显易懂。"},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.3,
-        )
-        raw = (resp.choices[0].message.content or "").strip()
+    raw = llm_chat(
+        settings.text_client(),
+        settings.llm_config()["model"],
+        [
+            {"role": "system", "content": "你输出一篇简洁的 Markdown 需求分析，语言浅显易懂。"},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.3,
+    )
     # 若模型用 ```markdown 包裹，去掉
     if raw.startswith("```"):
         lines = raw.split("\n")
@@ -466,15 +519,7 @@ def _build_two_turn_messages(req_text: str) -> List[Dict[str, str]]:
     if goods_ctx:
         # 第一次：只发 context
         messages.append({"role": "user", "content": goods_ctx})
-        if USE_NATIVE_GEMINI and _gemini_chat:
-            reply1 = _gemini_chat(MODEL, messages, temperature=0.1) or "好的，我已理解上述规则，请提供需求正文。"
-        else:
-            resp1 = client.chat.completions.create(
-                model=MODEL,
-                messages=messages,
-                temperature=0.1,
-            )
-            reply1 = (resp1.choices[0].message.content or "").strip() or "好的，我已理解上述规则，请提供需求正文。"
+        reply1 = llm_chat(settings.text_client(), settings.llm_config()["model"], messages, temperature=0.1) or "好的，我已理解上述规则，请提供需求正文。"
         messages.append({"role": "assistant", "content": reply1})
 
     # 第二次：发需求正文；无 context 时追加最小输出格式说明，保证能解析
@@ -483,25 +528,20 @@ def _build_two_turn_messages(req_text: str) -> List[Dict[str, str]]:
     return messages
 
 
-def llm_generate_struct(req_text: str) -> tuple[Dict[str, Any], str]:
-    """返回 (测试点结构 dict, 完整对话记录 Markdown)。"""
-    messages = _build_two_turn_messages(req_text)
+def _static_prefix(messages: List[Dict[str, Any]]) -> int:
+    """两轮对话中 context 与模型确认回复是静态前缀，只有最后一条需求正文每次不同。"""
+    return max(0, sum(1 for m in messages if m.get("role") != "system") - 1)
 
-    if USE_NATIVE_GEMINI and _gemini_chat:
-        raw = _gemini_chat(MODEL, messages, temperature=0.2) or ""
-    else:
-        resp = client.chat.completions.create(
-            model=MODEL,
-            messages=messages,
-            temperature=0.2,
-        )
-        raw = resp.choices[0].message.content or ""
-    conversation_md = _format_conversation_md(messages, raw)
+
+def _parse_struct_json(raw: str) -> Dict[str, Any]:
+    """截取并解析模型返回的测试点 JSON；标准解析失败时尝试 json_repair 修复。"""
     json_str = extract_json(raw)
     try:
         data = json.loads(json_str)
     except json.JSONDecodeError as e:
-        if json_repair is None:
+        try:
+            import json_repair
+        except ImportError:
             raise ValueError(
                 f"模型返回的 JSON 无法解析（位置约 line {e.lineno} col {e.colno}）：{e.msg}。"
                 " 可安装 json-repair 以尝试自动修复，或检查 prompt 是否过长导致截断。"
@@ -513,84 +553,135 @@ def llm_generate_struct(req_text: str) -> tuple[Dict[str, Any], str]:
                 f"模型返回的 JSON 无法解析（位置约 line {e.lineno} col {e.colno}）：{e.msg}，json_repair 也无法修复。"
                 " 可重试或缩短需求正文。"
             ) from e
+    if not isinstance(data, dict):
+        raise ValueError("模型返回的 JSON 不是对象，无法解析为测试点结构。")
+    return data
+
+
+_NODE_KEYS = frozenset({"title", "points", "tables", "callouts", "children"})
+
+def _fix_callouts_and_tables(container: Dict[str, Any], table_prefix: str = "表格") -> None:
+    callouts = container.get("callouts")
+    if not isinstance(callouts, list):
+        callouts = []
+        container["callouts"] = callouts
+    for i, c in enumerate(callouts):
+        if isinstance(c, str):
+            callouts[i] = {"title": c, "items": [c]}
+        elif isinstance(c, dict):
+            if "content" in c and "items" not in c:
+                content = c.pop("content", None)
+                c["items"] = [str(content)] if content is not None else []
+            if "title" not in c:
+                c["title"] = "要点"
+            items = c.get("items")
+            if isinstance(items, str):
+                c["items"] = [items]
+            elif not isinstance(items, list):
+                c["items"] = []
+            c["items"] = [str(x) for x in c["items"]]
+            if not c["items"]:
+                pts = c.get("points")
+                if isinstance(pts, list) and pts:
+                    c["items"] = [str(x) for x in pts]
+                else:
+                    c["items"] = [c.get("title", "要点")]
+
+    tables = container.get("tables")
+    if not isinstance(tables, list):
+        tables = []
+        container["tables"] = tables
+    for idx, t in enumerate(tables, start=1):
+        if not isinstance(t, dict):
+            tables[idx - 1] = {"title": f"{table_prefix}{idx}", "headers": ["列1", "列2"], "rows": []}
+            continue
+        if "title" not in t:
+            t["title"] = f"{table_prefix}{idx}"
+        if not isinstance(t.get("headers"), list) or len(t.get("headers", [])) < 2:
+            t["headers"] = (t.get("headers") or [])[:2] if isinstance(t.get("headers"), list) else ["列1", "列2"]
+        if len(t["headers"]) < 2:
+            t["headers"] = t["headers"] + ["列2"] * (2 - len(t["headers"]))
+        t["headers"] = [str(h) for h in t["headers"]]
+        if not isinstance(t.get("rows"), list):
+            t["rows"] = []
+        t["rows"] = [[str(cell) for cell in (r if isinstance(r, list) else [r])] for r in t["rows"]]
+        for r in t["rows"]:
+            if len(r) < len(t["headers"]):
+                r.extend([""] * (len(t["headers"]) - len(r)))
+            elif len(r) > len(t["headers"]):
+                r[:] = r[: len(t["headers"])]
+
+    points = container.get("points")
+    if not isinstance(points, list):
+        container["points"] = []
+    else:
+        container["points"] = [str(p) for p in points]
+
+def _fix_node(node: Dict[str, Any]) -> None:
+    """就地规整单个节点（递归子节点），使其符合 SCHEMA 的节点定义。"""
+    if not isinstance(node, dict):
+        return
+    # 只保留 schema 允许的 key，避免 additionalProperties 报错
+    allowed = {k: node[k] for k in _NODE_KEYS if k in node}
+    node.clear()
+    node.update(allowed)
+    if not node.get("title"):
+        node["title"] = "未命名"
+    node["title"] = str(node["title"])
+    _fix_callouts_and_tables(node)
+    children = node.get("children")
+    if not isinstance(children, list):
+        node["children"] = []
+        children = []
+    node["children"] = [ch for ch in children if isinstance(ch, dict)]
+    for ch in node["children"]:
+        _fix_node(ch)
+
+
+def _stream_struct_reply(
+    messages: List[Dict[str, Any]],
+    on_section: Optional[Callable[[Dict[str, Any]], None]],
+) -> str:
+    """流式获取测试点 JSON：增量解析出每个完成的顶层章节并回调，记录首个章节耗时。返回完整回复文本。"""
+    parser = SectionStreamParser()
+    t0 = time.perf_counter()
+    count = 0
+    for piece in llm_chat_stream(
+        settings.text_client(), settings.llm_config()["model"], messages, temperature=0.2, validate=_parse_struct_json, static_prefix=_static_prefix(messages)
+    ):
+        for section in parser.feed(piece):
+            count += 1
+            if count == 1:
+                print(f"[Step1] 首个章节到达，耗时 {time.perf_counter() - t0:.1f}s")
+            _fix_node(section)
+            print(f"[Step1] 已生成章节 {count}: {section['title']}")
+            if on_section:
+                on_section(section)
+    print(f"[Step1] 流式生成完成，共 {count} 个章节，总耗时 {time.perf_counter() - t0:.1f}s")
+    return parser.text.strip()
+
+
+def llm_generate_struct(
+    req_text: str,
+    stream: bool = False,
+    on_section: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> tuple[Dict[str, Any], str]:
+    """
+    返回 (测试点结构 dict, 完整对话记录 Markdown)。
+    stream=True 时流式接收模型输出，每完成一个顶层 sections[i] 节点就（规整后）回调 on_section，
+    便于边生成边写出；最终返回值与非流式一致。
+    """
+    messages = _build_two_turn_messages(req_text)
 
-    _NODE_KEYS = frozenset({"title", "points", "tables", "callouts", "children"})
-
-    def _fix_callouts_and_tables(container: Dict[str, Any], table_prefix: str = "表格") -> None:
-        callouts = container.get("callouts")
-        if not isinstance(callouts, list):
-            callouts = []
-            container["callouts"] = callouts
-        for i, c in enumerate(callouts):
-            if isinstance(c, str):
-                callouts[i] = {"title": c, "items": [c]}
-            elif isinstance(c, dict):
-                if "content" in c and "items" not in c:
-                    content = c.pop("content", None)
-                    c["items"] = [str(content)] if content is not None else []
-                if "title" not in c:
-                    c["title"] = "要点"
-                items = c.get("items")
-                if isinstance(items, str):
-                    c["items"] = [items]
-                elif not isinstance(items, list):
-                    c["items"] = []
-                c["items"] = [str(x) for x in c["items"]]
-                if not c["items"]:
-                    pts = c.get("points")
-                    if isinstance(pts, list) and pts:
-                        c["items"] = [str(x) for x in pts]
-                    else:
-                        c["items"] = [c.get("title", "要点")]
-
-        tables = container.get("tables")
-        if not isinstance(tables, list):
-            tables = []
-            container["tables"] = tables
-        for idx, t in enumerate(tables, start=1):
-            if not isinstance(t, dict):
-                tables[idx - 1] = {"title": f"{table_prefix}{idx}", "headers": ["列1", "列2"], "rows": []}
-                continue
-            if "title" not in t:
-                t["title"] = f"{table_prefix}{idx}"
-            if not isinstance(t.get("headers"), list) or len(t.get("headers", [])) < 2:
-                t["headers"] = (t.get("headers") or [])[:2] if isinstance(t.get("headers"), list) else ["列1", "列2"]
-            if len(t["headers"]) < 2:
-                t["headers"] = t["headers"] + ["列2"] * (2 - len(t["headers"]))
-            t["headers"] = [str(h) for h in t["headers"]]
-            if not isinstance(t.get("rows"), list):
-                t["rows"] = []
-            t["rows"] = [[str(cell) for cell in (r if isinstance(r, list) else [r])] for r in t["rows"]]
-            for r in t["rows"]:
-                if len(r) < len(t["headers"]):
-                    r.extend([""] * (len(t["headers"]) - len(r)))
-                elif len(r) > len(t["headers"]):
-                    r[:] = r[: len(t["headers"])]
-
-        points = container.get("points")
-        if not isinstance(points, list):
-            container["points"] = []
-        else:
-            container["points"] = [str(p) for p in points]
-
-    def _fix_node(node: Dict[str, Any]) -> None:
-        if not isinstance(node, dict):
-            return
-        # 只保留 schema 允许的 key，避免 additionalProperties 报错
-        allowed = {k: node[k] for k in _NODE_KEYS if k in node}
-        node.clear()
-        node.update(allowed)
-        if not node.get("title"):
-            node["title"] = "未命名"
-        node["title"] = str(node["title"])
-        _fix_callouts_and_tables(node)
-        children = node.get("children")
-        if not isinstance(children, list):
-            node["children"] = []
-            children = []
-        node["children"] = [ch for ch in children if isinstance(ch, dict)]
-        for ch in node["children"]:
-            _fix_node(ch)
+    # 校验通过（可解析为 JSON）的回复才会写入缓存，避免重跑时反复命中坏回复
+    if stream:
+        raw = _stream_struct_reply(messages, on_section)
+    else:
+        raw = llm_chat(
+            settings.text_client(), settings.llm_config()["model"], messages, temperature=0.2, validate=_parse_struct_json, static_prefix=_static_prefix(messages)
+        )
+    conversation_md = _format_conversation_md(messages, raw)
+    data = _parse_struct_json(raw)
 
     # 根层：确保有 title、sections 且 sections 非空（minItems 1）
     if not data.get("title"):
@@ -606,6 +697,8 @@ def llm_generate_struct(req_text: str) -> tuple[Dict[str, Any], str]:
     for section in data["sections"]:
         _fix_node(section)
 
+    from jsonschema import validate
+
     validate(instance=data, schema=SCHEMA)
     return (data, conversation_md)
 
@@ -625,43 +718,64 @@ def md_table(headers: List[str], rows: List[List[str]]) -> str:
     return "\n".join(lines)
 
 
-def save_to_markdown(data: Dict[str, Any], out_path: str, file_title: str) -> None:
-    out: List[str] = [f"# {file_title}", ""]
-    # section 级别：你希望是“## 一、xxx”还是“ 一、xxx ”都行；我按 Markdown 标准输出
-    def _render_node(node: Dict[str, Any], depth: int) -> None:
-        level = min(depth + 2, 6)
-        out.append(f"{'#' * level} {node['title']}")
+def _render_node_md(node: Dict[str, Any], depth: int, out: List[str]) -> None:
+    """将一个（已规整的）节点及其子节点渲染为 Markdown 行，追加到 out。"""
+    level = min(depth + 2, 6)
+    out.append(f"{'#' * level} {node['title']}")
+    out.append("")
+    for p in node.get("points", []) or []:
+        out.append(p)
         out.append("")
-        for p in node.get("points", []) or []:
-            out.append(p)
-            out.append("")
-        for t in node.get("tables", []) or []:
-            if t.get("title"):
-                out.append(t["title"])
-                out.append("")
-            out.append(md_table(t["headers"], t["rows"]))
+    for t in node.get("tables", []) or []:
+        if t.get("title"):
+            out.append(t["title"])
             out.append("")
-        for c in node.get("callouts", []) or []:
-            out.append(c["title"])
-            if c.get("description"):
-                out.append(c["description"])
-            out.append("")
-            for it in c.get("items", []) or []:
-                out.append(f"- {it}")
-            for p in c.get("points", []) or []:
-                if p not in (c.get("items") or []):
-                    out.append(f"- {p}")
-            out.append("")
-        for ch in node.get("children") or []:
-            _render_node(ch, depth + 1)
+        out.append(md_table(t["headers"], t["rows"]))
+        out.append("")
+    for c in node.get("callouts", []) or []:
+        out.append(c["title"])
+        if c.get("description"):
+            out.append(c["description"])
+        out.append("")
+        for it in c.get("items", []) or []:
+            out.append(f"- {it}")
+        for p in c.get("points", []) or []:
+            if p not in (c.get("items") or []):
+                out.append(f"- {p}")
+        out.append("")
+    for ch in node.get("children") or []:
+        _render_node_md(ch, depth + 1, out)
+
 
+def save_to_markdown(data: Dict[str, Any], out_path: str, file_title: str) -> None:
+    out: List[str] = [f"# {file_title}", ""]
+    # section 级别：你希望是“## 一、xxx”还是“ 一、xxx ”都行；我按 Markdown 标准输出
     for section in data["sections"]:
-        _render_node(section, 0)
+        _render_node_md(section, 0, out)
     content = "\n".join(out).rstrip() + "\n"
     with open(out_path, "w", encoding="utf-8") as f:
         f.write(content)
 
 
+class ProgressiveMarkdownWriter:
+    """
+    流式生成时边收边写 测试点分析.md：构造时写入标题，每个完成的顶层章节调用 append_section 追加。
+    生成结束后仍以 save_to_markdown 写出最终版本（内容一致，覆盖本文件）。
+    """
+
+    def __init__(self, out_path: str, file_title: str) -> None:
+        self.out_path = out_path
+        with open(out_path, "w", encoding="utf-8") as f:
+            f.write(f"# {file_title}\n\n")
+
+    def append_section(self, section: Dict[str, Any]) -> None:
+        out: List[str] = []
+        _render_node_md(section, 0, out)
+        with open(self.out_path, "a", encoding="utf-8") as f:
+            f.write("\n".join(out))
+            f.write("\n")
+
+
 def save_json(data: Dict[str, Any], out_path: str) -> None:
     with open(out_path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
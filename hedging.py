@@ -0,0 +1,146 @@
+# 对冲请求（hedged requests）：请求超过「历史延迟的第 P 百分位」仍未返回时，再发一份重复请求
+# （可选发往另一个 provider），谁先返回有效结果就用谁，另一份结果丢弃。用少量额外请求削掉长尾延迟。
+# 默认关闭，LLM_HEDGE=1 开启。
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from settings import load_env
+
+load_env()
+
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0").strip().lower() in ("1", "true", "on")
+# 触发对冲的延迟百分位（如 90 表示超过 P90 还没返回就对冲）
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "90"))
+# 样本不足 LLM_HEDGE_MIN_SAMPLES 时使用的固定对冲延迟（秒）；对冲延迟不低于 LLM_HEDGE_MIN_DELAY_SEC
+LLM_HEDGE_DELAY_SEC = float(os.getenv("LLM_HEDGE_DELAY_SEC", "60"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "10"))
+LLM_HEDGE_MIN_DELAY_SEC = float(os.getenv("LLM_HEDGE_MIN_DELAY_SEC", "2"))
+# 1 = 对冲请求发往另一个已配置的 provider（Gemini ↔ DashScope），否则重复发往同一 provider
+LLM_HEDGE_CROSS_PROVIDER = os.getenv("LLM_HEDGE_CROSS_PROVIDER", "0").strip().lower() in ("1", "true", "on")
+
+_lock = threading.Lock()
+_latencies: Dict[str, Deque[float]] = {}
+_stats = {"requests": 0, "hedged": 0, "backup_wins": 0, "saved_sec": 0.0}
+
+
+def record_latency(bucket: str, seconds: float) -> None:
+    """记录一次成功请求的耗时（按 provider/model 分桶，保留最近 200 次）。"""
+    with _lock:
+        _latencies.setdefault(bucket, deque(maxlen=200)).append(seconds)
+
+
+def hedge_delay(bucket: str) -> float:
+    """当前应在多少秒后对冲：观测样本足够时取第 P 百分位，否则用固定值。"""
+    with _lock:
+        samples = sorted(_latencies.get(bucket) or ())
+    if len(samples) < LLM_HEDGE_MIN_SAMPLES:
+        return LLM_HEDGE_DELAY_SEC
+    idx = min(len(samples) - 1, int(len(samples) * LLM_HEDGE_PERCENTILE / 100.0))
+    return max(LLM_HEDGE_MIN_DELAY_SEC, samples[idx])
+
+
+def _start(fn: Callable[[], Any]) -> Future:
+    """在守护线程中执行 fn，返回 Future。守护线程保证落败的请求不会拖住进程退出。"""
+    fut: Future = Future()
+    fut.set_running_or_notify_cancel()
+
+    def _run() -> None:
+        try:
+            fut.set_result(fn())
+        except BaseException as e:  # noqa: BLE001 - 原样转交给等待方
+            fut.set_exception(e)
+
+    threading.Thread(target=_run, daemon=True, name="llm-hedge").start()
+    return fut
+
+
+def _valid(fut: Future, validate: Optional[Callable[[str], Any]]) -> bool:
+    if fut.exception() is not None:
+        return False
+    text = fut.result()
+    if not text:
+        return False
+    if validate is None:
+        return True
+    try:
+        validate(text)
+        return True
+    except Exception:
+        return False
+
+
+def hedged_call(
+    bucket: str,
+    primary: Callable[[], str],
+    backup: Callable[[], str],
+    validate: Optional[Callable[[str], Any]] = None,
+) -> Tuple[str, bool]:
+    """
+    先执行 primary；超过 hedge_delay(bucket) 仍未完成则并行执行 backup，返回 (先到的有效结果, 是否由 backup 胜出)。
+    两份都失败时抛出 primary 的异常（primary 成功但无效时返回其结果，由调用方的校验报错）。
+    """
+    t0 = time.perf_counter()
+    with _lock:
+        _stats["requests"] += 1
+    first = _start(primary)
+    done, _ = wait([first], timeout=hedge_delay(bucket))
+    if done:
+        if first.exception() is None:
+            record_latency(bucket, time.perf_counter() - t0)
+        return first.result(), False
+
+    with _lock:
+        _stats["hedged"] += 1
+    second = _start(backup)
+    pending = {first, second}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            if _valid(fut, validate):
+                winner_backup = fut is second
+                elapsed = time.perf_counter() - t0
+                if winner_backup:
+                    _track_saved(first, t0, elapsed)
+                else:
+                    record_latency(bucket, elapsed)
+                # 落败的一方不再等待，其结果被丢弃
+                return fut.result(), winner_backup
+    # 两份都无效：优先抛 primary 的异常，否则返回 primary 结果交由调用方处理
+    if first.exception() is not None:
+        if second.exception() is None and second.result():
+            return second.result(), True
+        raise first.exception()
+    return first.result(), False
+
+
+def _track_saved(primary: Future, t0: float, winner_elapsed: float) -> None:
+    """backup 胜出：等 primary 最终结束时，记下节省的时间（primary 耗时 − 实际耗时）。"""
+    with _lock:
+        _stats["backup_wins"] += 1
+
+    def _on_done(fut: Future) -> None:
+        primary_elapsed = time.perf_counter() - t0
+        with _lock:
+            _stats["saved_sec"] += max(0.0, primary_elapsed - winner_elapsed)
+
+    primary.add_done_callback(_on_done)
+
+
+def stats() -> Dict[str, float]:
+    with _lock:
+        return dict(_stats)
+
+
+def stats_line() -> str:
+    if not LLM_HEDGE:
+        return "[对冲] 未开启（LLM_HEDGE=1 开启）"
+    s = stats()
+    rate = (s["hedged"] / s["requests"] * 100) if s["requests"] else 0.0
+    return (
+        f"[对冲] 请求 {s['requests']} 次，对冲 {s['hedged']} 次（{rate:.0f}%），"
+        f"对冲胜出 {s['backup_wins']} 次，累计节省约 {s['saved_sec']:.1f}s"
+    )
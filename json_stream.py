@@ -0,0 +1,91 @@
+# 增量 JSON 解析：在模型流式输出测试点树的过程中，每收完一个 sections[i] 节点就立即解析并交出，
+# 不必等整棵树返回。只做括号/字符串状态扫描，已扫描过的字符不会重复处理。
+import json
+from typing import Any, Dict, List, Optional
+
+
+class SectionStreamParser:
+    """
+    逐段 feed 模型输出文本，返回其中新完成的顶层 "sections" 数组元素（已解析为 dict）。
+
+    用法：
+        parser = SectionStreamParser()
+        for chunk in stream:
+            for section in parser.feed(chunk):
+                ...
+    """
+
+    def __init__(self, array_key: str = "sections") -> None:
+        self.array_key = array_key
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_key: Optional[str] = None
+        self._array_depth = -1
+        self._item_start = -1
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self._text += chunk
+        out: List[Dict[str, Any]] = []
+        text = self._text
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        # 顶层对象里的字符串：可能是 key，紧随的 "[" 决定它是否为 sections
+                        self._last_key = text[self._string_start + 1 : i]
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if (
+                    ch == "["
+                    and self._depth == 1
+                    and self._array_depth < 0
+                    and self._last_key == self.array_key
+                ):
+                    self._array_depth = 2
+                elif ch == "{" and self._depth == self._array_depth:
+                    self._item_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if ch == "}" and self._depth == self._array_depth and self._item_start >= 0:
+                    node = self._parse(text[self._item_start : i + 1])
+                    self._item_start = -1
+                    if isinstance(node, dict):
+                        out.append(node)
+                elif ch == "]" and self._depth == 1 and self._array_depth == 2:
+                    self._array_depth = -3  # sections 数组已结束
+            i += 1
+        self._pos = i
+        return out
+
+    @property
+    def text(self) -> str:
+        """目前收到的完整文本。"""
+        return self._text
+
+    @staticmethod
+    def _parse(fragment: str) -> Any:
+        try:
+            return json.loads(fragment)
+        except json.JSONDecodeError:
+            try:
+                import json_repair  # 只在片段解析失败时才导入
+            except ImportError:
+                return None
+            try:
+                return json_repair.loads(fragment)
+            except Exception:
+                return None
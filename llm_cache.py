@@ -0,0 +1,180 @@
+# LLM 响应持久化缓存（SQLite）：按 provider + model + temperature + messages 哈希 + 提示词版本 做内容寻址，
+# 同一输入重复运行时直接返回历史回复，不再发起网络请求。支持按时间（TTL）与总大小（LRU）淘汰。
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from settings import load_env
+
+load_env()
+
+_ROOT = Path(__file__).resolve().parent
+
+# 缓存文件位置；过期天数；总大小上限（MB，超出按最久未访问淘汰）
+LLM_CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", str(_ROOT / ".cache" / "llm_cache.sqlite")))
+LLM_CACHE_TTL_DAYS = float(os.getenv("LLM_CACHE_TTL_DAYS", "30"))
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "200"))
+# 提示词/解析逻辑有不兼容改动时递增，旧缓存自动失效
+PROMPT_VERSION = os.getenv("LLM_CACHE_PROMPT_VERSION", "1")
+
+# 每写入多少条做一次淘汰检查
+_EVICT_EVERY = 50
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+_writes_since_evict = 0
+# 运行模式：enabled=False 完全不读不写；refresh=True 不读旧结果但写入新结果
+_mode = {
+    "enabled": os.getenv("LLM_CACHE", "1").strip().lower() not in ("0", "false", "off"),
+    "refresh": os.getenv("LLM_CACHE_REFRESH", "0").strip().lower() in ("1", "true", "on"),
+}
+_stats = {"hits": 0, "misses": 0, "writes": 0, "evicted": 0}
+
+
+def set_mode(enabled: Optional[bool] = None, refresh: Optional[bool] = None) -> None:
+    """由入口脚本的 --no-cache / --refresh 调用。"""
+    if enabled is not None:
+        _mode["enabled"] = enabled
+    if refresh is not None:
+        _mode["refresh"] = refresh
+
+
+def is_enabled() -> bool:
+    return _mode["enabled"]
+
+
+def apply_cli_flags(argv: List[str]) -> List[str]:
+    """从命令行参数中取出 --no-cache / --refresh 并生效，返回去掉这两个开关后的参数。"""
+    rest = []
+    for a in argv:
+        if a == "--no-cache":
+            set_mode(enabled=False)
+        elif a == "--refresh":
+            set_mode(refresh=True)
+        else:
+            rest.append(a)
+    return rest
+
+
+def make_key(provider: str, model: str, temperature: float, messages: List[Dict[str, Any]]) -> str:
+    """缓存键：provider、model、temperature、完整 messages、提示词版本 的 SHA-256。"""
+    payload = json.dumps(
+        {
+            "provider": provider,
+            "model": model,
+            "temperature": round(float(temperature), 4),
+            "messages": messages,
+            "prompt_version": PROMPT_VERSION,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _connect() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        LLM_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(LLM_CACHE_PATH), timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, provider TEXT, model TEXT, value TEXT,"
+            " size INTEGER, created REAL, accessed REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+        conn.commit()
+        _conn = conn
+        _evict_locked()
+    return _conn
+
+
+def get(key: str) -> Optional[str]:
+    """命中返回缓存文本（并刷新访问时间），未命中或已关闭缓存返回 None。"""
+    if not _mode["enabled"]:
+        return None
+    if _mode["refresh"]:
+        _stats["misses"] += 1
+        return None
+    with _lock:
+        try:
+            conn = _connect()
+            row = conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row and now - row[1] <= LLM_CACHE_TTL_DAYS * 86400:
+                conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                conn.commit()
+                _stats["hits"] += 1
+                return row[0]
+        except sqlite3.Error as e:
+            print(f"[缓存] 读取失败，忽略缓存: {e}")
+        _stats["misses"] += 1
+        return None
+
+
+def put(key: str, value: str, provider: str = "", model: str = "") -> None:
+    """写入一条回复（空文本不缓存）。"""
+    global _writes_since_evict
+    if not _mode["enabled"] or not value:
+        return
+    with _lock:
+        try:
+            conn = _connect()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, provider, model, value, size, created, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, model, value, len(value.encode("utf-8")), now, now),
+            )
+            conn.commit()
+            _stats["writes"] += 1
+            _writes_since_evict += 1
+            if _writes_since_evict >= _EVICT_EVERY:
+                _evict_locked()
+        except sqlite3.Error as e:
+            print(f"[缓存] 写入失败，忽略缓存: {e}")
+
+
+def _evict_locked() -> None:
+    """删除过期条目；总大小超过上限时按最久未访问删除，直到降到上限的 90%。调用方持有 _lock。"""
+    global _writes_since_evict
+    _writes_since_evict = 0
+    conn = _conn
+    if conn is None:
+        return
+    cur = conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - LLM_CACHE_TTL_DAYS * 86400,))
+    removed = cur.rowcount or 0
+    max_bytes = int(LLM_CACHE_MAX_MB * 1024 * 1024)
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    if total > max_bytes:
+        target = int(max_bytes * 0.9)
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed ASC"):
+            if total <= target:
+                break
+            doomed.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        removed += len(doomed)
+    conn.commit()
+    _stats["evicted"] += removed
+
+
+def stats() -> Dict[str, int]:
+    """本进程内的命中/未命中/写入/淘汰计数。"""
+    return dict(_stats)
+
+
+def stats_line() -> str:
+    s = _stats
+    total = s["hits"] + s["misses"]
+    if not _mode["enabled"]:
+        return "[缓存] 已关闭（--no-cache）"
+    rate = (s["hits"] / total * 100) if total else 0.0
+    return f"[缓存] 命中 {s['hits']} / 未命中 {s['misses']}（命中率 {rate:.0f}%），新写入 {s['writes']}"
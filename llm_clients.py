@@ -0,0 +1,96 @@
+# 共享 LLM 客户端注册表：进程内复用 OpenAI 兼容客户端与 Gemini Client，底层 httpx 连接池保持长连接
+# 三套流程（generate_md_v2 / generate_cases_mvp / review_engine / gemini_native）统一从这里取客户端，
+# 避免每次调用都新建 Client、重新握手 TLS。
+import atexit
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from settings import load_env
+
+load_env()
+
+# 连接池大小：最大并发连接数、最多保留的空闲长连接数、空闲连接保活秒数
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "20"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "10"))
+LLM_POOL_KEEPALIVE_EXPIRY_SEC = float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY_SEC", "60"))
+
+_lock = threading.Lock()
+_clients: Dict[Tuple[Any, ...], Any] = {}
+
+
+def _httpx() -> Any:
+    """httpx 在首次创建客户端时才导入（导入约 0.1s）；未安装返回 None，SDK 使用默认连接池。"""
+    try:
+        import httpx
+    except ImportError:
+        return None
+    return httpx
+
+
+def _pool_limits() -> Any:
+    """按配置构建 httpx 连接池限制。"""
+    return _httpx().Limits(
+        max_connections=LLM_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_POOL_KEEPALIVE_EXPIRY_SEC,
+    )
+
+
+def _get_or_create(key: Tuple[Any, ...], factory) -> Any:
+    """双重检查加锁：同一 key 在进程内只创建一次。"""
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = factory()
+            _clients[key] = client
+    return client
+
+
+def get_openai_client(api_key: str, base_url: Optional[str] = None) -> Any:
+    """获取（或首次创建）共享的 OpenAI 兼容同步客户端（DashScope 等），线程安全。"""
+    from openai import OpenAI
+
+    def _factory():
+        httpx = _httpx()
+        kwargs: Dict[str, Any] = {"api_key": api_key, "base_url": base_url}
+        if httpx is not None:
+            kwargs["http_client"] = httpx.Client(limits=_pool_limits(), timeout=httpx.Timeout(600.0, connect=10.0))
+        return OpenAI(**kwargs)
+
+    return _get_or_create(("openai", api_key, base_url), _factory)
+
+
+def get_gemini_client(api_key: str, timeout_sec: int) -> Any:
+    """
+    获取共享的 google-genai Client（同步调用走 client.models，异步走 client.aio.models，二者都复用连接池）。
+    """
+    from google import genai
+    from google.genai import types
+
+    def _factory():
+        opts: Dict[str, Any] = {"timeout": timeout_sec * 1000}
+        if _httpx() is not None and "client_args" in getattr(types.HttpOptions, "model_fields", {}):
+            opts["client_args"] = {"limits": _pool_limits()}
+            opts["async_client_args"] = {"limits": _pool_limits()}
+        return genai.Client(api_key=api_key, http_options=types.HttpOptions(**opts))
+
+    return _get_or_create(("gemini", api_key, timeout_sec), _factory)
+
+
+def close_all_clients() -> None:
+    """关闭并清空所有共享客户端（进程退出前或测试中调用；一般无需手动调用）。"""
+    with _lock:
+        items = list(_clients.items())
+        _clients.clear()
+    for _key, client in items:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+
+atexit.register(close_all_clients)
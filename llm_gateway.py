@@ -0,0 +1,212 @@
+# 统一的文本对话调用入口：client 为 None 走 Gemini 原生 SDK，否则走 OpenAI 兼容接口（DashScope 等）。
+# 三套流程的文本 LLM 调用都经由这里，便于统一接入响应缓存、跨进程限流、对冲请求等横切能力。
+import os
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import concurrency_control
+import hedging
+import llm_cache
+import rate_limiter
+from llm_clients import get_openai_client
+from token_budget import context_limit, estimate_for_model, estimate_messages_tokens
+
+
+def _gemini() -> Any:
+    """按需导入 gemini_native（google-genai 导入约需 0.5s 以上，只走 OpenAI 兼容接口或命中缓存时不导入）；不可用返回 None。"""
+    try:
+        import gemini_native
+    except ImportError:
+        return None
+    return gemini_native
+
+
+def provider_of(client: Any) -> str:
+    """缓存/统计用的 provider 标识。"""
+    if client is None:
+        return "gemini"
+    return f"openai:{getattr(client, 'base_url', '')}"
+
+
+def _raw_chat(
+    client: Any,
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float,
+    static_prefix: int = 0,
+) -> str:
+    if client is None:
+        gemini = _gemini()
+        if gemini is None:
+            raise RuntimeError("请安装: pip install google-genai")
+        return (gemini.gemini_chat(model, messages, temperature=temperature, static_prefix=static_prefix) or "").strip()
+    # OpenAI 兼容接口（DashScope 等）为服务端自动前缀缓存：静态消息已在最前且逐字节不变，无需额外处理
+    resp = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+    )
+    return (resp.choices[0].message.content or "").strip()
+
+
+def _backup_target(client: Any, model: str) -> Tuple[Any, str]:
+    """
+    对冲请求的目标 (client, model)：开启 LLM_HEDGE_CROSS_PROVIDER 且另一 provider 已配置时发往另一 provider，
+    否则重复发往同一 provider/model。
+    """
+    if hedging.LLM_HEDGE_CROSS_PROVIDER:
+        if client is None and os.getenv("DASHSCOPE_API_KEY"):
+            base_url = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+            other_model = os.getenv("DASHSCOPE_MODEL") or os.getenv("QWEN_MODEL", "qwen-plus")
+            return get_openai_client(os.getenv("DASHSCOPE_API_KEY"), base_url), other_model
+        if client is not None and os.getenv("GEMINI_API_KEY") and _gemini() is not None:
+            return None, os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+    return client, model
+
+
+def _warn_if_over_context(model: str, messages: List[Dict[str, Any]]) -> None:
+    """估算输入超过模型上下文窗口时提前提示（请求仍会发出，由服务端决定是否拒绝）。"""
+    est = estimate_for_model(model, messages)
+    limit = context_limit(model)
+    if est > limit:
+        print(f"[Token] 估算输入约 {est} tokens，超过模型 {model} 的上下文窗口 {limit}，可能被拒绝或截断")
+
+
+def _send(
+    client: Any,
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float,
+    static_prefix: int,
+    validate: Optional[Callable[[str], Any]],
+) -> Tuple[str, str, str]:
+    """
+    限流后在自适应并发名额内发送；开启对冲时慢请求会在延迟超过历史百分位后补发一份，取先到的有效结果。
+    返回 (回复文本, 实际产出该回复的 provider, 模型)：跨 provider 对冲胜出时为补发目标，供调用方按其写缓存。
+    """
+    provider = provider_of(client)
+    est = estimate_messages_tokens(messages)
+    _warn_if_over_context(model, messages)
+    bucket = f"{provider}/{model}"
+    if not hedging.LLM_HEDGE:
+        rate_limiter.acquire(provider, model, est)
+        with concurrency_control.slot(provider):
+            t0 = time.perf_counter()
+            text = _raw_chat(client, model, messages, temperature, static_prefix)
+            hedging.record_latency(bucket, time.perf_counter() - t0)
+        return text, provider, model
+
+    backup_client, backup_model = _backup_target(client, model)
+
+    def _primary() -> str:
+        with concurrency_control.slot(provider):
+            return _raw_chat(client, model, messages, temperature, static_prefix)
+
+    backup_provider = provider_of(backup_client)
+
+    def _backup() -> str:
+        # 补发请求不占 AIMD 名额：同 provider 对冲时名额池正被慢的主请求占着，上限小（或刚减半到 1）时
+        # 补发会排在它要赛跑的那个请求后面，对冲形同虚设。补发仍经过令牌桶限流，过载错误照常上报给 AIMD。
+        rate_limiter.acquire(backup_provider, backup_model, est)
+        try:
+            return _raw_chat(backup_client, backup_model, messages, temperature, static_prefix)
+        except Exception as e:
+            if concurrency_control.is_overload_error(e):
+                concurrency_control.note_overload(backup_provider)
+            raise
+
+    rate_limiter.acquire(provider, model, est)
+    text, by_backup = hedging.hedged_call(bucket, _primary, _backup, validate)
+    if by_backup:
+        print(f"[对冲] {model} 请求过慢，已采用对冲请求（{backup_model}）的结果")
+        return text, backup_provider, backup_model
+    return text, provider, model
+
+
+def chat(
+    client: Any,
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float = 0.2,
+    *,
+    validate: Optional[Callable[[str], Any]] = None,
+    static_prefix: int = 0,
+) -> str:
+    """
+    发送一次对话并返回模型回复文本（已 strip）。
+    validate: 可选的校验函数（如 JSON 解析），抛异常则该回复不写入缓存、异常原样抛出，
+    避免把坏回复缓存下来导致重试时反复命中。
+    static_prefix: system 之后前几条消息为本次运行内不变的静态上下文，Gemini 会放入服务端上下文缓存复用。
+    """
+    provider = provider_of(client)
+    key = llm_cache.make_key(provider, model, temperature, messages)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached
+    text, src_provider, src_model = _send(client, model, messages, temperature, static_prefix, validate)
+    if validate is not None:
+        validate(text)
+    if (src_provider, src_model) != (provider, model):
+        # 跨 provider 对冲胜出：回复来自另一模型，按实际来源写缓存，不冒充主请求模型的结果
+        key = llm_cache.make_key(src_provider, src_model, temperature, messages)
+    llm_cache.put(key, text, provider=src_provider, model=src_model)
+    return text
+
+
+def _raw_chat_stream(
+    client: Any,
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float,
+    static_prefix: int = 0,
+) -> Iterator[str]:
+    if client is None:
+        gemini = _gemini()
+        if gemini is None:
+            raise RuntimeError("请安装: pip install google-genai")
+        yield from gemini.gemini_chat_stream(model, messages, temperature=temperature, static_prefix=static_prefix)
+        return
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        stream=True,
+    )
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
+
+def chat_stream(
+    client: Any,
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float = 0.2,
+    *,
+    validate: Optional[Callable[[str], Any]] = None,
+    static_prefix: int = 0,
+) -> Iterator[str]:
+    """
+    流式版 chat：逐段产出回复文本。缓存命中时一次性产出完整文本；
+    未命中时边收边产出，全部收完且 validate 通过后再写入缓存。
+    """
+    provider = provider_of(client)
+    key = llm_cache.make_key(provider, model, temperature, messages)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+    _warn_if_over_context(model, messages)
+    rate_limiter.acquire(provider, model, estimate_messages_tokens(messages))
+    parts: List[str] = []
+    with concurrency_control.slot(provider):
+        for piece in _raw_chat_stream(client, model, messages, temperature, static_prefix):
+            parts.append(piece)
+            yield piece
+    text = "".join(parts).strip()
+    if validate is not None:
+        validate(text)
+    llm_cache.put(key, text, provider=provider, model=model)
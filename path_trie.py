@@ -0,0 +1,103 @@
+# 公共：路径前缀树（按路径片段逐级建树），用于测试树节点的路径查找
+# - 精确查找 O(路径深度)，与按完整路径字符串查 dict 结果一致
+# - 前缀查询：某路径下的全部节点（如「模块/子模块」下所有节点）
+# - 最长已存在前缀：AI 给出的路径部分有误时，定位到实际存在的最深祖先
+# - 支持边合并边插入（合并 AI 建议时新增的节点立即可查）
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from compact_tree import FlatNodes
+
+
+def split_path(path: str) -> List[str]:
+    """把 "模块/子模块/场景" 拆成片段；去掉片段首尾空白与空片段（容忍 AI 输出的 "模块 / 子模块"、多余的斜杠）。"""
+    return [seg.strip() for seg in (path or "").split("/") if seg.strip()]
+
+
+class TrieNode:
+    """前缀树节点：children 为 片段 -> 子节点；items 为路径恰好到此的测试树节点（同名兄弟会有多个）。"""
+
+    __slots__ = ("children", "items")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "TrieNode"] = {}
+        self.items: List[Any] = []
+
+    def child(self, segment: str) -> "TrieNode":
+        """取（不存在则创建）子节点。"""
+        node = self.children.get(segment)
+        if node is None:
+            node = self.children[segment] = TrieNode()
+        return node
+
+
+class PathTrie:
+    """按路径片段组织的测试树索引。"""
+
+    def __init__(self) -> None:
+        self.root = TrieNode()
+
+    @classmethod
+    def from_nodes(cls, flat: Sequence[Any]) -> "PathTrie":
+        """由 flat 节点列表建树（dict 节点或紧凑存储视图）；无路径的节点按标题收录。"""
+        trie = cls()
+        paths = flat.tree.iter_paths() if isinstance(flat, FlatNodes) else (n.get("path") or "" for n in flat)
+        for n, path in zip(flat, paths):
+            path = path.strip()
+            if path:
+                trie.insert(path, n)
+            elif n.get("title"):
+                # 根节点 path 可能为空，按标题查找
+                trie.insert(n["title"], n)
+        return trie
+
+    def insert(self, path: str, item: Any) -> TrieNode:
+        """收录 item 到 path；返回对应的前缀树节点。"""
+        node = self.root
+        for seg in split_path(path):
+            node = node.child(seg)
+        node.items.append(item)
+        return node
+
+    def node_for(self, path: str) -> Optional[TrieNode]:
+        node: Optional[TrieNode] = self.root
+        for seg in split_path(path):
+            node = node.children.get(seg)
+            if node is None:
+                return None
+        return node
+
+    def get(self, path: str) -> Optional[Any]:
+        """精确查找：路径完全一致的节点（同一路径有多个时取最后收录的，与按路径建 dict 的行为一致）。"""
+        node = self.node_for(path)
+        return node.items[-1] if node is not None and node.items else None
+
+    def under(self, prefix: str, include_self: bool = True) -> Iterator[Any]:
+        """前缀查询：按先序交出 prefix 路径下的全部节点（include_self 时含 prefix 本身）。"""
+        start = self.node_for(prefix)
+        if start is None:
+            return
+        if include_self:
+            yield from start.items
+        stack = list(reversed(list(start.children.values())))
+        while stack:
+            node = stack.pop()
+            yield from node.items
+            stack.extend(reversed(list(node.children.values())))
+
+    def longest_prefix(self, path: str) -> Tuple[Optional[Any], List[str]]:
+        """
+        沿路径向下走到最深的已存在节点，返回 (该节点, 未匹配上的剩余片段)。
+        完全匹配时剩余为空；第一个片段就不存在时返回 (None, 全部片段)。
+        """
+        segs = split_path(path)
+        node = self.root
+        best: Optional[Any] = None
+        matched = 0
+        for depth, seg in enumerate(segs, start=1):
+            nxt = node.children.get(seg)
+            if nxt is None:
+                break
+            node = nxt
+            if node.items:
+                best, matched = node.items[-1], depth
+        return best, segs[matched:]
@@ -0,0 +1,172 @@
+# 跨进程令牌桶限流：按 provider 与 provider/model 两级限制每分钟请求数（RPM）与估算 token 数（TPM）。
+# 桶状态存放在 SQLite 中（BEGIN IMMEDIATE 串行化），同时运行的多个流程/进程共享同一配额，
+# 在请求发出前主动等待，而不是一起撞上 429 再一起退避。
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from settings import load_env
+
+load_env()
+
+_ROOT = Path(__file__).resolve().parent
+
+LLM_RATE_LIMIT_PATH = Path(os.getenv("LLM_RATE_LIMIT_PATH", str(_ROOT / ".cache" / "rate_limit.sqlite")))
+# provider 级限额（0 表示不限）
+LLM_RPM = int(os.getenv("LLM_RPM", "0"))
+LLM_TPM = int(os.getenv("LLM_TPM", "0"))
+# 模型级限额：「模型:RPM:TPM」逗号分隔，如 gemini-2.0-flash:15:1000000,qwen-plus:60:0
+LLM_MODEL_LIMITS = os.getenv("LLM_MODEL_LIMITS", "")
+# 估算 TPM 时为每次请求预留的输出 token 数
+LLM_RATE_OUTPUT_TOKENS = int(os.getenv("LLM_RATE_OUTPUT_TOKENS", "800"))
+
+# 单次睡眠上限（秒），醒来后重新检查桶，便于其它进程释放/补充后尽快继续
+_MAX_SLEEP_SEC = 5.0
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+_stats_lock = threading.Lock()
+_waits: List[float] = []
+_acquired = 0
+
+
+def _parse_model_limits(raw: str) -> Dict[str, Tuple[int, int]]:
+    out: Dict[str, Tuple[int, int]] = {}
+    for item in raw.split(","):
+        parts = [p.strip() for p in item.split(":")]
+        if len(parts) != 3 or not parts[0]:
+            continue
+        try:
+            out[parts[0]] = (int(parts[1] or 0), int(parts[2] or 0))
+        except ValueError:
+            continue
+    return out
+
+
+_MODEL_LIMITS = _parse_model_limits(LLM_MODEL_LIMITS)
+
+
+def enabled() -> bool:
+    return bool(LLM_RPM or LLM_TPM or _MODEL_LIMITS)
+
+
+def _buckets_for(provider: str, model: str) -> List[Tuple[str, float]]:
+    """返回 [(桶名, 每分钟容量), ...]；容量为 0 的维度不限流。"""
+    buckets: List[Tuple[str, float]] = []
+    if LLM_RPM:
+        buckets.append((f"{provider}|rpm", float(LLM_RPM)))
+    if LLM_TPM:
+        buckets.append((f"{provider}|tpm", float(LLM_TPM)))
+    rpm, tpm = _MODEL_LIMITS.get(model, (0, 0))
+    if rpm:
+        buckets.append((f"{provider}/{model}|rpm", float(rpm)))
+    if tpm:
+        buckets.append((f"{provider}/{model}|tpm", float(tpm)))
+    return buckets
+
+
+def _connect() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        LLM_RATE_LIMIT_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(
+            str(LLM_RATE_LIMIT_PATH), timeout=30, isolation_level=None, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+        _conn = conn
+    return _conn
+
+
+def _try_take(buckets: List[Tuple[str, float]], est_tokens: int) -> float:
+    """
+    在一个写事务内补充并尝试扣减所有相关桶。全部足够则扣减并返回 0；否则不扣减，返回需要等待的秒数。
+    """
+    with _lock:
+        conn = _connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            levels: Dict[str, float] = {}
+            wait = 0.0
+            for name, capacity in buckets:
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+                rate = capacity / 60.0
+                if row is None:
+                    level = capacity
+                else:
+                    level = min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+                # 单次请求估算超过桶容量时按容量计，避免永远等不到
+                need = 1.0 if name.endswith("|rpm") else float(min(est_tokens, capacity))
+                levels[name] = level - need
+                if level < need:
+                    wait = max(wait, (need - level) / rate)
+            if wait == 0.0:
+                for name, level in levels.items():
+                    conn.execute(
+                        "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                        (name, level, now),
+                    )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+def acquire(provider: str, model: str, est_tokens: int = 0) -> float:
+    """
+    发送请求前调用：阻塞直到 provider 与 model 两级的 RPM/TPM 桶都有余量，返回本次等待秒数。
+    est_tokens 为估算的输入 token，另加 LLM_RATE_OUTPUT_TOKENS 作为输出预留。
+    """
+    global _acquired
+    buckets = _buckets_for(provider, model)
+    if not buckets:
+        return 0.0
+    est_tokens += LLM_RATE_OUTPUT_TOKENS
+    t0 = time.perf_counter()
+    while True:
+        try:
+            wait = _try_take(buckets, est_tokens)
+        except sqlite3.Error as e:
+            print(f"[限流] 读取共享令牌桶失败，本次不限流: {e}")
+            wait = 0.0
+        if wait <= 0:
+            break
+        time.sleep(min(wait, _MAX_SLEEP_SEC))
+    waited = time.perf_counter() - t0
+    with _stats_lock:
+        _acquired += 1
+        _waits.append(waited)
+    return waited
+
+
+def stats() -> Dict[str, float]:
+    """本进程的限流等待统计：请求数、发生等待的次数、总等待、平均/P95/最大等待（秒）。"""
+    with _stats_lock:
+        waits = sorted(_waits)
+        acquired = _acquired
+    delayed = [w for w in waits if w >= 0.01]
+    p95 = waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0
+    return {
+        "requests": acquired,
+        "delayed": len(delayed),
+        "total_wait_sec": sum(waits),
+        "avg_wait_sec": (sum(waits) / len(waits)) if waits else 0.0,
+        "p95_wait_sec": p95,
+        "max_wait_sec": waits[-1] if waits else 0.0,
+    }
+
+
+def stats_line() -> str:
+    if not enabled():
+        return "[限流] 未配置（LLM_RPM / LLM_TPM / LLM_MODEL_LIMITS）"
+    s = stats()
+    return (
+        f"[限流] 请求 {s['requests']} 次，其中等待 {s['delayed']} 次；"
+        f"累计等待 {s['total_wait_sec']:.1f}s，平均 {s['avg_wait_sec']:.2f}s，"
+        f"P95 {s['p95_wait_sec']:.2f}s，最长 {s['max_wait_sec']:.2f}s"
+    )
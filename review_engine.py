@@ -1,18 +1,39 @@
 # 流程3：测试智能评审引擎——拼 prompt、调 AI、解析遗漏清单 JSON
+import hashlib
 import os
+import re
 import json
-from typing import Any, Dict, List, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Tuple
 
-from dotenv import load_dotenv
-from openai import OpenAI
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+import llm_cache
+import review_index
+from llm_clients import get_openai_client
+from llm_gateway import chat as llm_chat
+from settings import load_env
 from test_tree_utils import flat_to_compressed_path_list
+from token_budget import calibration_factor, estimate_for_model, estimate_tokens, prompt_budget
 
-try:
-    from gemini_native import gemini_chat as _gemini_chat
-except ImportError:
-    _gemini_chat = None  # type: ignore[assignment]
+load_env()
+
+# 单次评审请求的输入 token 上限（0 = 按模型上下文窗口减去输出预留）；超出时自动拆成多次请求
+REVIEW_MAX_PROMPT_TOKENS = int(os.getenv("REVIEW_MAX_PROMPT_TOKENS", "0"))
+# 分片评审：空 = 整棵树一次评审；module = 每个一级模块一片；nodes = 按节点数打包。可被 --shard 覆盖
+REVIEW_SHARD = os.getenv("REVIEW_SHARD", "").strip().lower()
+# 单个分片最多节点数（module 模式下超出的模块继续按子树拆分；0 表示不限）
+REVIEW_SHARD_MAX_NODES = int(os.getenv("REVIEW_SHARD_MAX_NODES", "300"))
+# 分片/拆分后的评审请求并发数，可被 --concurrency 覆盖
+REVIEW_CONCURRENCY = int(os.getenv("REVIEW_CONCURRENCY", "4"))
+# 增量评审：子树与 PRD 都未变化的分片沿用上次结论（隐含按模块分片），可被 --incremental 覆盖
+REVIEW_INCREMENTAL = os.getenv("REVIEW_INCREMENTAL", "0").strip().lower() in ("1", "true", "on")
+# missing_branch 去重：同一父路径下场景名相似度不低于该值视为同一条建议
+REVIEW_DEDUPE_SIMILARITY = float(os.getenv("REVIEW_DEDUPE_SIMILARITY", "0.8"))
+# 分片提示中最多列出的「其它分片范围」条数
+_MAX_OTHER_SCOPES = 60
 
 # 期望的 AI 输出结构（供校验与文档）
 REVIEW_ITEM_SCHEMA = """
@@ -23,19 +44,36 @@ items 数组中每项为以下之一：
 """
 
 
-def build_review_user_prompt(
-    prd_text: str,
-    prototype_text: str,
-    compressed_path_list: str,
-) -> str:
-    """拼接 PRD + 原型 + 测试树路径列表 + 任务说明。"""
+def build_review_context_prompt(prd_text: str, prototype_text: str) -> str:
+    """PRD + 原型：同一次运行内不变的静态上下文（可放入服务端上下文缓存复用）。"""
     return f"""# 业务需求
 {prd_text or '（未提供）'}
 
 # 页面原型说明
 {prototype_text or '（未提供）'}
+"""
+
+
+def build_review_scope_prompt(
+    ancestors: List[Dict[str, Any]],
+    other_scopes: List[str],
+    shard_label: str = "",
+) -> str:
+    """分片评审时的范围说明：上级节点链（精简为一行一个）+ 由其它分片负责的范围。"""
+    lines = [f"# 本次评审范围{shard_label}", "只评审下方「当前测试结构」中的节点；上级节点仅供定位，不在本次评审范围内。"]
+    if ancestors:
+        lines.append("上级节点：")
+        lines.append(flat_to_compressed_path_list(ancestors))
+    if other_scopes:
+        shown = other_scopes[:_MAX_OTHER_SCOPES]
+        more = f" 等共 {len(other_scopes)} 处" if len(other_scopes) > len(shown) else ""
+        lines.append(f"以下范围由其它分片评审，不要为它们报告缺失场景：{'、'.join(shown)}{more}")
+    return "\n".join(lines) + "\n\n"
 
-# 当前测试结构（树形，每行：路径 [id:xxx] level=N）
+
+def build_review_task_prompt(compressed_path_list: str, scope_prompt: str = "") -> str:
+    """（可选的分片范围说明）+ 测试树路径列表 + 任务说明 + 输出格式。"""
+    return scope_prompt + f"""# 当前测试结构（树形，每行：路径 [id:xxx] level=N）
 {compressed_path_list}
 
 # 任务
@@ -59,6 +97,15 @@ def build_review_user_prompt(
 """
 
 
+def build_review_user_prompt(
+    prd_text: str,
+    prototype_text: str,
+    compressed_path_list: str,
+) -> str:
+    """拼接 PRD + 原型 + 测试树路径列表 + 任务说明。"""
+    return build_review_context_prompt(prd_text, prototype_text) + "\n" + build_review_task_prompt(compressed_path_list)
+
+
 def _extract_json_from_response(text: str) -> Dict[str, Any]:
     """从模型回复中提取 JSON（兼容 ```json ... ``` 包裹）。"""
     text = (text or "").strip()
@@ -76,27 +123,24 @@ def call_review_llm(
     system_content: str,
     user_content: str,
     use_gemini_native: bool = False,
+    context_content: str = "",
 ) -> Dict[str, Any]:
-    """调用 LLM 做评审，返回解析后的 JSON。"""
-    if use_gemini_native and _gemini_chat:
-        raw = _gemini_chat(
-            model,
-            [
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": user_content},
-            ],
-            temperature=0.2,
-        )
-    else:
-        resp = client.chat.completions.create(
-            model=model,
-            temperature=0.2,
-            messages=[
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": user_content},
-            ],
-        )
-        raw = (resp.choices[0].message.content or "").strip()
+    """
+    调用 LLM 做评审，返回解析后的 JSON。
+    context_content 非空时作为独立的首条 user 消息（PRD/原型等静态上下文），可被服务端上下文缓存复用。
+    """
+    messages = [{"role": "system", "content": system_content}]
+    if context_content:
+        messages.append({"role": "user", "content": context_content})
+    messages.append({"role": "user", "content": user_content})
+    raw = llm_chat(
+        None if use_gemini_native else client,
+        model,
+        messages,
+        temperature=0.2,
+        validate=_extract_json_from_response,
+        static_prefix=1 if context_content else 0,
+    )
     return _extract_json_from_response(raw)
 
 
@@ -107,12 +151,24 @@ def run_review(
     *,
     model: Optional[str] = None,
     system_template_path: Optional[str] = None,
+    shard: Optional[str] = None,
+    concurrency: Optional[int] = None,
+    incremental: Optional[bool] = None,
 ) -> Dict[str, Any]:
     """
     执行一次评审：拼 prompt、调 LLM、返回标准化的报告结构。
     flat_nodes 来自 xmind_to_test_tree 的 flat 列表。
+    shard: 分片模式（module / nodes），默认取 REVIEW_SHARD；为空时整棵树一起评审（超出 token 预算仍会自动拆分）。
+    concurrency: 同时进行的评审请求数，默认取 REVIEW_CONCURRENCY。
+    incremental: 默认取 REVIEW_INCREMENTAL。开启时按分片查增量评审索引，未变化的分片沿用上次结论，
+        只评审有改动的分片；未指定分片模式时按 module 分片。分片模式下每次评审结果都会写入索引。
     """
-    load_dotenv()
+    load_env()
+    shard = (REVIEW_SHARD if shard is None else shard).strip().lower()
+    incremental = REVIEW_INCREMENTAL if incremental is None else incremental
+    if incremental and shard not in ("module", "nodes"):
+        shard = "module"
+    concurrency = max(1, concurrency or REVIEW_CONCURRENCY)
     # 优先使用 Gemini（原生 SDK，支持 gemini-1.5-flash）；未配置则使用 DashScope（通义）
     use_gemini_native = bool(os.getenv("GEMINI_API_KEY"))
     if use_gemini_native:
@@ -123,7 +179,7 @@ def run_review(
         api_key = os.getenv("DASHSCOPE_API_KEY")
         base_url = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
         model = model or os.getenv("QWEN_MODEL", "qwen-plus")
-        client = OpenAI(api_key=api_key, base_url=base_url) if api_key else None
+        client = get_openai_client(api_key, base_url) if api_key else None
     if not api_key and not use_gemini_native:
         raise RuntimeError("请在 .env 里配置 GEMINI_API_KEY 或 DASHSCOPE_API_KEY")
 
@@ -135,11 +191,224 @@ def run_review(
         with open(system_path, "r", encoding="utf-8") as f:
             system_content = f.read()
 
-    compressed = flat_to_compressed_path_list(flat_nodes)
-    user_content = build_review_user_prompt(prd_text, prototype_text, compressed)
-    raw_result = call_review_llm(client, model, system_content, user_content, use_gemini_native=use_gemini_native)
+    context_content = build_review_context_prompt(prd_text, prototype_text)
+    budget = prompt_budget(model, REVIEW_MAX_PROMPT_TOKENS)
+
+    sharded = shard in ("module", "nodes")
+    if sharded:
+        shards = build_review_shards(flat_nodes, shard, REVIEW_SHARD_MAX_NODES)
+        print(f"[评审] 分片模式 {shard}：{len(flat_nodes)} 个节点拆为 {len(shards)} 个分片")
+    else:
+        shards = [{"label": "", "module": "", "nodes": flat_nodes, "roots": [], "ancestors": []}]
+
+    # 增量评审：按「评审上下文 + 分片子树哈希」查索引，命中的分片沿用上次结论
+    shard_keys: List[str] = []
+    carried: Dict[int, List[Dict[str, Any]]] = {}
+    if sharded:
+        payload = [model, llm_cache.PROMPT_VERSION, system_content, context_content]
+        context_hash = hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+        shard_keys = [review_index.shard_key(context_hash, sh) for sh in shards]
+        if incremental:
+            for sh_idx, (sh, key) in enumerate(zip(shards, shard_keys)):
+                findings = review_index.get(key)
+                if findings is not None:
+                    carried[sh_idx] = review_index.from_portable(sh, findings)
+            print(f"[增量评审] {len(carried)} 个分片未变化，沿用上次结论；{len(shards) - len(carried)} 个分片需要重新评审")
+
+    # 每个待评审分片再按 token 预算拆分，得到最终的请求列表（分片下标, user_content, 节点数）
+    requests: List[Tuple[int, str, int]] = []
+    for sh_idx, sh in enumerate(shards):
+        if sh_idx in carried:
+            continue
+        if len(shards) > 1:
+            others = list(dict.fromkeys(o["module"] for o in shards if o["module"] and o["module"] != sh["module"]))
+            if sum(1 for o in shards if o["module"] == sh["module"]) > 1:
+                others.insert(0, f"{sh['module']} 下不在本分片中的其余部分")
+            scope = build_review_scope_prompt(sh["ancestors"], others, f"（分片 {sh_idx + 1}/{len(shards)}：{sh['label']}）")
+        else:
+            scope = ""
+        # 不含测试树时的固定开销：system + PRD/原型 + 范围说明 + 任务说明
+        base_tokens = estimate_for_model(
+            model,
+            [
+                {"role": "system", "content": system_content},
+                {"role": "user", "content": context_content},
+                {"role": "user", "content": build_review_task_prompt("", scope)},
+            ],
+        )
+        if base_tokens >= budget:
+            raise RuntimeError(
+                f"PRD/原型等固定内容约 {base_tokens} tokens，已超过模型 {model} 的单次输入预算 {budget}，"
+                "请精简文档或换用上下文更大的模型（LLM_CONTEXT_LIMITS / REVIEW_MAX_PROMPT_TOKENS）"
+            )
+        chunks = split_flat_nodes_by_budget(sh["nodes"], budget - base_tokens, calibration_factor(model))
+        for chunk in chunks:
+            requests.append((sh_idx, build_review_task_prompt(flat_to_compressed_path_list(chunk), scope), len(chunk)))
+    if len(requests) > len(shards) - len(carried):
+        print(f"[评审] 部分输入超出预算 {budget} tokens，共拆分为 {len(requests)} 次请求")
+
+    def _review_one(idx: int, user_content: str, node_count: int) -> Dict[str, Any]:
+        est = estimate_for_model(
+            model,
+            [
+                {"role": "system", "content": system_content},
+                {"role": "user", "content": context_content},
+                {"role": "user", "content": user_content},
+            ],
+        )
+        print(f"[评审] 请求 {idx}/{len(requests)}：节点 {node_count} 个，估算输入约 {est} tokens（模型 {model}，预算 {budget}）")
+        raw_result = call_review_llm(
+            client,
+            model,
+            system_content,
+            user_content,
+            use_gemini_native=use_gemini_native,
+            context_content=context_content,
+        )
+        return _normalize_report(raw_result)
+
+    t0 = time.perf_counter()
+    if concurrency <= 1 or len(requests) <= 1:
+        results = [_review_one(i, u, c) for i, (_, u, c) in enumerate(requests, start=1)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(requests)), thread_name_prefix="review") as ex:
+            futures = [ex.submit(_review_one, i, u, c) for i, (_, u, c) in enumerate(requests, start=1)]
+            results = [f.result() for f in futures]
+    if len(requests) > 1:
+        print(f"[评审] {len(requests)} 次请求完成，耗时 {time.perf_counter() - t0:.1f}s（并发={min(concurrency, len(requests))}）")
+
+    if not sharded and len(results) == 1:
+        return results[0]
+
+    # 按分片汇总（沿用的结论 + 新评审结果），新结果写入增量评审索引
+    by_shard: Dict[int, List[Dict[str, Any]]] = {i: [] for i in range(len(shards)) if i not in carried}
+    for (sh_idx, _, _), r in zip(requests, results):
+        by_shard[sh_idx].extend(r["details"])
+    if sharded:
+        for sh_idx, details in by_shard.items():
+            review_index.put(shard_keys[sh_idx], review_index.to_portable(shards[sh_idx], details))
+    reports = [{"details": carried[i] if i in carried else by_shard[i]} for i in range(len(shards))]
+    return merge_review_reports(reports)
+
+
+def build_review_shards(
+    flat_nodes: List[Dict[str, Any]],
+    mode: str = "module",
+    max_nodes: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    把测试树拆成若干分片，每片为
+    {"label": 分片说明, "module": 所属一级模块路径, "nodes": 子树节点（先序）, "roots": 各子树根节点, "ancestors": 上级节点链}。
+    module：每个一级模块（根节点的子节点）一片，超过 max_nodes 的模块继续按子节点拆分；
+    nodes：在 module 的基础上，把同一父节点下相邻的小子树合并，使每片尽量接近 max_nodes。
+    flat_nodes 为先序遍历结果，任一子树在其中是连续的一段，因此按下标切片即可取出子树。
+    """
+    index = {n.get("id"): i for i, n in enumerate(flat_nodes) if n.get("id")}
+    children: List[List[int]] = [[] for _ in flat_nodes]
+    roots: List[int] = []
+    for i, n in enumerate(flat_nodes):
+        parent = index.get(n.get("parent_id") or "")
+        if parent is None:
+            roots.append(i)
+        else:
+            children[parent].append(i)
+    size = [1] * len(flat_nodes)
+    for i in range(len(flat_nodes) - 1, -1, -1):
+        for c in children[i]:
+            size[i] += size[c]
+
+    # units: (子树根下标, 上级节点下标链)
+    units: List[Tuple[int, Tuple[int, ...]]] = []
+
+    def _visit(i: int, ancestors: Tuple[int, ...]) -> None:
+        if not children[i] or max_nodes <= 0 or size[i] <= max_nodes:
+            units.append((i, ancestors))
+            return
+        for c in children[i]:
+            _visit(c, ancestors + (i,))
+
+    for r in roots:
+        if not children[r]:
+            units.append((r, ()))
+        for c in children[r]:
+            _visit(c, (r,))
+
+    groups: List[List[Tuple[int, Tuple[int, ...]]]] = []
+    for unit in units:
+        last = groups[-1] if groups else None
+        if (
+            mode == "nodes"
+            and last
+            and last[0][1] == unit[1]
+            and sum(size[u[0]] for u in last) + size[unit[0]] <= max_nodes
+        ):
+            last.append(unit)
+        else:
+            groups.append([unit])
+
+    shards: List[Dict[str, Any]] = []
+    for group in groups:
+        nodes: List[Dict[str, Any]] = []
+        for i, _ in group:
+            nodes.extend(flat_nodes[i : i + size[i]])
+        first, chain = group[0]
+        label = flat_nodes[first].get("path") or flat_nodes[first].get("title") or ""
+        if len(group) > 1:
+            label += f" 等 {len(group)} 个子树"
+        # 所属一级模块：上级链中根之下的第一个节点，或分片根本身
+        module_idx = chain[1] if len(chain) > 1 else first
+        shards.append(
+            {
+                "label": label,
+                "module": flat_nodes[module_idx].get("path") or "",
+                "nodes": nodes,
+                "roots": [flat_nodes[i] for i, _ in group],
+                "ancestors": [flat_nodes[a] for a in chain],
+            }
+        )
+    return shards
+
+
+def split_flat_nodes_by_budget(
+    flat_nodes: List[Dict[str, Any]],
+    token_budget: int,
+    factor: float = 1.0,
+) -> List[List[Dict[str, Any]]]:
+    """
+    按 token 预算把扁平节点（先序）切成若干段，每段的压缩路径列表不超过预算（单个节点本身超预算时独占一段）。
+    每行自带完整路径，单独一段也能定位；切分时尽量落在模块/场景（level <= 2）边界上。
+    """
+    chunks: List[List[Dict[str, Any]]] = []
+    current: List[Dict[str, Any]] = []
+    costs: List[int] = []
+    used = 0
+    boundary = 0  # current 中最后一个模块/场景节点的下标
+    for n in flat_nodes:
+        line = flat_to_compressed_path_list([n])
+        cost = int((estimate_tokens(line) + 1) * factor)
+        if current and used + cost > token_budget:
+            # 边界在后半段时从边界切开，让同一模块/场景尽量留在同一次请求里
+            cut = boundary if boundary > len(current) // 2 else len(current)
+            chunks.append(current[:cut])
+            current, costs = current[cut:], costs[cut:]
+            used = sum(costs)
+            boundary = 0
+            if current and used + cost > token_budget:
+                # 带过来的尾部加上当前节点仍超预算：尾部单独成段
+                chunks.append(current)
+                current, costs, used = [], [], 0
+        if (n.get("level") or 0) <= 2:
+            boundary = len(current)
+        current.append(n)
+        costs.append(cost)
+        used += cost
+    if current or not chunks:
+        chunks.append(current)
+    return chunks
+
 
-    # 标准化为统一报告结构
+def _normalize_report(raw_result: Dict[str, Any]) -> Dict[str, Any]:
+    """标准化为统一报告结构。"""
     summary = raw_result.get("summary") or {}
     details = raw_result.get("details")
     if not isinstance(details, list):
@@ -152,3 +421,85 @@ def run_review(
         },
         "details": details,
     }
+
+
+def _norm_text(text: Any) -> str:
+    """去掉空白与常见标点后小写，用于比较建议文本。"""
+    return re.sub(r"[\s\u3000-\u303f\uff00-\uff0f\uff1a-\uff20/>\uff5c|\-_.,:;'\"()\[\]]+", "", str(text or "")).lower()
+
+
+def _same_missing_branch(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    """同一父路径下场景名相同、互相包含或足够相似，视为重叠的 missing_branch。"""
+    if _norm_text(a.get("suggest_parent_path")) != _norm_text(b.get("suggest_parent_path")):
+        return False
+    sa, sb = _norm_text(a.get("missing_scene")), _norm_text(b.get("missing_scene"))
+    if not sa or not sb:
+        return sa == sb
+    if sa in sb or sb in sa:
+        return True
+    return SequenceMatcher(None, sa, sb).ratio() >= REVIEW_DEDUPE_SIMILARITY
+
+
+def dedupe_review_details(details: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    合并分片结果中的重复建议（保持首次出现的顺序）：
+    missing_branch 按父路径 + 场景名相似度去重，保留理由更详细的一条；
+    insufficient_coverage 按 node_id + 问题去重；risk_node 按 node_id 去重，保留最高分。
+    """
+    out: List[Dict[str, Any]] = []
+    missing_by_parent: Dict[str, List[int]] = {}
+    seen_weak: Dict[Tuple[str, str], int] = {}
+    risk_by_node: Dict[str, int] = {}
+    for d in details:
+        if not isinstance(d, dict):
+            continue
+        t = d.get("type")
+        if t == "missing_branch":
+            bucket = missing_by_parent.setdefault(_norm_text(d.get("suggest_parent_path")), [])
+            dup = next((j for j in bucket if _same_missing_branch(out[j], d)), None)
+            if dup is None:
+                bucket.append(len(out))
+                out.append(d)
+            elif len(str(d.get("reason") or "")) > len(str(out[dup].get("reason") or "")):
+                out[dup] = d
+        elif t == "insufficient_coverage":
+            key = (str(d.get("node_id") or ""), _norm_text(d.get("problem")))
+            if key not in seen_weak:
+                seen_weak[key] = len(out)
+                out.append(d)
+        elif t == "risk_node":
+            nid = str(d.get("node_id") or "")
+            j = risk_by_node.get(nid)
+            if j is None:
+                risk_by_node[nid] = len(out)
+                out.append(d)
+            elif _risk_score(d) > _risk_score(out[j]):
+                out[j] = d
+        else:
+            out.append(d)
+    return out
+
+
+def _risk_score(d: Dict[str, Any]) -> float:
+    try:
+        return float(d.get("risk_score") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def merge_review_reports(reports: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """合并多次评审的结果：details 顺序拼接并去重，summary 按去重后各类型条数重新统计。"""
+    details: List[Dict[str, Any]] = []
+    for r in reports:
+        details.extend(r.get("details") or [])
+    merged = dedupe_review_details(details)
+    if len(merged) < len(details):
+        print(f"[评审] 合并分片结果：{len(details)} 条建议去重后剩 {len(merged)} 条")
+    return {
+        "summary": {
+            "total_missing": sum(1 for d in merged if d.get("type") == "missing_branch"),
+            "weak_nodes": sum(1 for d in merged if d.get("type") == "insufficient_coverage"),
+            "risk_count": sum(1 for d in merged if d.get("type") == "risk_node"),
+        },
+        "details": merged,
+    }
@@ -0,0 +1,134 @@
+# 流程3 增量评审索引（SQLite）：以「PRD/原型哈希 + 分片子树 Merkle 哈希」为键，保存每个分片上次的评审结论。
+# 重新评审时，子树与 PRD 都没变的分片直接沿用上次结论，只把有改动的分片发给 LLM。
+# 结论中的 node_id 按节点在分片内的先序位置保存，沿用时映射回本次解析出的节点 id（模块前插入兄弟节点等会改变 id，而子树内容不变）。
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from settings import load_env
+
+load_env()
+
+_ROOT = Path(__file__).resolve().parent
+
+REVIEW_INDEX_PATH = Path(os.getenv("REVIEW_INDEX_PATH", str(_ROOT / ".cache" / "review_index.sqlite")))
+# 超过该天数的索引条目在打开时清理
+REVIEW_INDEX_TTL_DAYS = float(os.getenv("REVIEW_INDEX_TTL_DAYS", "90"))
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+
+
+def _connect() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        REVIEW_INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(REVIEW_INDEX_PATH), timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS shard_reviews (key TEXT PRIMARY KEY, findings TEXT, created REAL)")
+        conn.execute("DELETE FROM shard_reviews WHERE created < ?", (time.time() - REVIEW_INDEX_TTL_DAYS * 86400,))
+        conn.commit()
+        _conn = conn
+    return _conn
+
+
+def shard_key(context_hash: str, shard: Dict[str, Any]) -> str:
+    """
+    分片键：评审上下文哈希（PRD/原型、系统提示词、模型、提示词版本）+ 上级节点标题 + 各子树根的 subtree_hash。
+    节点缺少 subtree_hash 时退化为对分片内全部节点标题/层级做哈希。
+    """
+    h = hashlib.sha256(context_hash.encode("utf-8"))
+    for a in shard.get("ancestors") or []:
+        h.update(b"\0a" + str(a.get("title") or "").encode("utf-8"))
+    roots = shard.get("roots") or []
+    if roots and all(r.get("subtree_hash") for r in roots):
+        for r in roots:
+            h.update(b"\0r" + r["subtree_hash"].encode("utf-8"))
+    else:
+        for n in shard.get("nodes") or []:
+            h.update(f"\0n{n.get('level', 0)}:{n.get('title') or ''}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def to_portable(shard: Dict[str, Any], details: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """把分片的评审结论中的 node_id / 父路径 换成分片内的相对位置；无法定位的条目丢弃。"""
+    pos_by_id = {n.get("id"): i for i, n in enumerate(shard["nodes"])}
+    pos_by_path = {n.get("path"): i for i, n in enumerate(shard["nodes"])}
+    anc_by_id = {a.get("id"): i for i, a in enumerate(shard.get("ancestors") or [])}
+    anc_by_path = {a.get("path"): i for i, a in enumerate(shard.get("ancestors") or [])}
+    out: List[Dict[str, Any]] = []
+    for d in details:
+        item = dict(d)
+        if item.get("type") == "missing_branch":
+            parent = (item.pop("suggest_parent_path", "") or "").strip()
+            if parent in pos_by_path:
+                item["_parent_pos"] = pos_by_path[parent]
+            elif parent in anc_by_path:
+                item["_parent_anc"] = anc_by_path[parent]
+            else:
+                continue
+        elif "node_id" in item:
+            nid = str(item.pop("node_id") or "").strip()
+            if nid in pos_by_id:
+                item["_node_pos"] = pos_by_id[nid]
+            elif nid in anc_by_id:
+                item["_node_anc"] = anc_by_id[nid]
+            else:
+                continue
+        out.append(item)
+    return out
+
+
+def from_portable(shard: Dict[str, Any], findings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """to_portable 的逆过程：按相对位置映射回本次解析出的节点 id / 路径。"""
+    nodes = shard["nodes"]
+    ancestors = shard.get("ancestors") or []
+    out: List[Dict[str, Any]] = []
+    for f in findings:
+        item = dict(f)
+        try:
+            if "_parent_pos" in item:
+                item["suggest_parent_path"] = nodes[item.pop("_parent_pos")].get("path", "")
+            elif "_parent_anc" in item:
+                item["suggest_parent_path"] = ancestors[item.pop("_parent_anc")].get("path", "")
+            elif "_node_pos" in item:
+                item["node_id"] = nodes[item.pop("_node_pos")].get("id", "")
+            elif "_node_anc" in item:
+                item["node_id"] = ancestors[item.pop("_node_anc")].get("id", "")
+        except (IndexError, TypeError):
+            continue
+        out.append(item)
+    return out
+
+
+def get(key: str) -> Optional[List[Dict[str, Any]]]:
+    with _lock:
+        try:
+            row = _connect().execute("SELECT findings FROM shard_reviews WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"[增量评审] 读取索引失败，忽略: {e}")
+            return None
+    if not row:
+        return None
+    try:
+        return json.loads(row[0])
+    except json.JSONDecodeError:
+        return None
+
+
+def put(key: str, findings: List[Dict[str, Any]]) -> None:
+    with _lock:
+        try:
+            conn = _connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO shard_reviews (key, findings, created) VALUES (?, ?, ?)",
+                (key, json.dumps(findings, ensure_ascii=False), time.time()),
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"[增量评审] 写入索引失败，忽略: {e}")
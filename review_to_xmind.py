@@ -1,17 +1,21 @@
 # 流程3：将 AI 建议合并回原测试树，并输出为新的 XMind 文件
 # 在对应节点下增加「AI 建议新增」「AI 建议补充」「风险」等子节点
+# 新增节点与 XMind topic 的 id 均由内容派生：同样的测试树 + 同样的评审结果输出相同的 content.json
+import hashlib
 import json
 import time
-import uuid
 import zipfile
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Set
 
+from compact_tree import FlatNodes, NodeIdMap, TestNode
+from path_trie import PathTrie, split_path
 from xmind_to_test_tree import _make_node_id
 
 
-def _xmind_topic_id() -> str:
-    return uuid.uuid4().hex
+def _xmind_topic_id(key: str) -> str:
+    """XMind topic/sheet id（32 位十六进制，与 XMind 自身格式一致），由标准节点 id 等唯一键派生。"""
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
 
 
 def _standard_node_to_xmind_topic(node: Dict[str, Any]) -> Dict[str, Any]:
@@ -19,7 +23,7 @@ def _standard_node_to_xmind_topic(node: Dict[str, Any]) -> Dict[str, Any]:
     title = node.get("title") or "(无标题)"
     children = node.get("children") or []
     out: Dict[str, Any] = {
-        "id": _xmind_topic_id(),
+        "id": _xmind_topic_id(node.get("id") or title),
         "class": "topic",
         "title": title,
     }
@@ -30,9 +34,20 @@ def _standard_node_to_xmind_topic(node: Dict[str, Any]) -> Dict[str, Any]:
     return out
 
 
-def _add_standard_child(parent: Dict[str, Any], title: str, parent_path: str) -> Dict[str, Any]:
-    """在父节点下追加一个标准格式的子节点，并加入父的 children，返回新节点。"""
-    new_id = _make_node_id()
+def _add_standard_child(
+    parent: Dict[str, Any],
+    title: str,
+    parent_path: str,
+    used: Optional[Set[str]] = None,
+) -> Dict[str, Any]:
+    """在父节点下追加一个标准格式的子节点，并加入父的 children，返回新节点（id 按父 id + 同级序号 + 标题派生）。"""
+    if isinstance(parent, TestNode):
+        # 紧凑存储：直接追加到列式数组，path 由父链现算
+        tree, p = parent.tree, parent.index
+        new_id = _make_node_id(tree.node_id(p), sum(1 for _ in tree.children(p)), title, used)
+        return tree.node(tree.add_node(p, title, tree.level[p] + 1, new_id, "case"))
+    siblings = parent.setdefault("children", [])
+    new_id = _make_node_id(parent.get("id", ""), len(siblings), title, used)
     new_path = f"{parent_path}/{title}" if parent_path else title
     child: Dict[str, Any] = {
         "id": new_id,
@@ -43,10 +58,26 @@ def _add_standard_child(parent: Dict[str, Any], title: str, parent_path: str) ->
         "level": parent.get("level", 0) + 1,
         "children": [],
     }
-    parent.setdefault("children", []).append(child)
+    siblings.append(child)
     return child
 
 
+def _resolve_parent(trie: PathTrie, roots: List[Dict[str, Any]], parent_path: str) -> Optional[Dict[str, Any]]:
+    """
+    AI 给出的父路径不存在时，取最长已存在前缀对应的节点。
+    也尝试在各 sheet 根路径下匹配（AI 常省略中心主题），取匹配片段最多的一个；一个片段都对不上返回 None。
+    """
+    total = len(split_path(parent_path))
+    best, rest = trie.longest_prefix(parent_path)
+    best_matched = total - len(rest) if best is not None else 0
+    for root in roots:
+        prefix = root.get("path") or root.get("title") or ""
+        node, rest = trie.longest_prefix(f"{prefix}/{parent_path}")
+        if node is not None and total - len(rest) > best_matched:
+            best, best_matched = node, total - len(rest)
+    return best if best_matched > 0 else None
+
+
 def merge_ai_suggestions_into_tree(
     roots: List[Dict[str, Any]],
     flat: List[Dict[str, Any]],
@@ -54,19 +85,14 @@ def merge_ai_suggestions_into_tree(
 ) -> None:
     """
     将 AI 评审结果合并进测试树（原地修改）。
-    - missing_branch：在 suggest_parent_path 对应节点下增加「【AI建议新增】missing_scene」及原因
+    - missing_branch：在 suggest_parent_path 对应节点下增加「【AI建议新增】missing_scene」及原因；
+      路径部分有误时挂到最长已存在前缀对应的节点下（路径索引见 path_trie）
     - insufficient_coverage：在 node_id 对应节点下增加「【AI建议补充】problem」
     - risk_node：在 node_id 对应节点下增加「【风险】reason (评分:N)」
     """
-    id_to_node = {n["id"]: n for n in flat}
-    path_to_node: Dict[str, Dict[str, Any]] = {}
-    for n in flat:
-        p = (n.get("path") or "").strip()
-        if p:
-            path_to_node[p] = n
-        # 根节点 path 可能等于 title
-        if n.get("title") and not p:
-            path_to_node[n["title"]] = n
+    id_to_node = NodeIdMap(flat.tree) if isinstance(flat, FlatNodes) else {n["id"]: n for n in flat}
+    used: Set[str] = set(id_to_node)
+    trie = PathTrie.from_nodes(flat)
 
     for item in details or []:
         t = item.get("type")
@@ -74,18 +100,24 @@ def merge_ai_suggestions_into_tree(
             parent_path = (item.get("suggest_parent_path") or "").strip()
             scene = (item.get("missing_scene") or "未命名场景").strip()
             reason = (item.get("reason") or "").strip()
-            parent = path_to_node.get(parent_path)
+            parent = trie.get(parent_path)
+            if not parent and parent_path:
+                # 路径部分有误：挂到实际存在的最深祖先下，并在原因里注明原建议位置
+                parent = _resolve_parent(trie, roots, parent_path)
+                if parent:
+                    note = f"（建议位置「{parent_path}」不存在，已挂在「{parent.get('path') or parent.get('title')}」下）"
+                    reason = f"{reason}{note}" if reason else note
             if not parent:
-                # 若路径不存在，挂在第一个 sheet 的根下
+                # 若路径完全不存在，挂在第一个 sheet 的根下
                 parent = roots[0] if roots else None
             if parent:
                 title = f"【AI建议新增】{scene}"
-                child = _add_standard_child(parent, title, parent.get("path", ""))
+                child = _add_standard_child(parent, title, parent.get("path", ""), used)
                 if reason:
-                    _add_standard_child(child, reason, child.get("path", ""))
+                    _add_standard_child(child, reason, child.get("path", ""), used)
                 flat.append(child)
                 if child.get("path"):
-                    path_to_node[child["path"]] = child
+                    trie.insert(child["path"], child)
 
         elif t == "insufficient_coverage":
             nid = item.get("node_id", "").strip()
@@ -93,10 +125,10 @@ def merge_ai_suggestions_into_tree(
             parent = id_to_node.get(nid)
             if parent and problem:
                 title = f"【AI建议补充】{problem}"
-                child = _add_standard_child(parent, title, parent.get("path", ""))
+                child = _add_standard_child(parent, title, parent.get("path", ""), used)
                 flat.append(child)
                 if child.get("path"):
-                    path_to_node[child["path"]] = child
+                    trie.insert(child["path"], child)
 
         elif t == "risk_node":
             nid = item.get("node_id", "").strip()
@@ -105,17 +137,17 @@ def merge_ai_suggestions_into_tree(
             parent = id_to_node.get(nid)
             if parent:
                 title = f"【风险】{reason} (评分:{score})" if reason else f"【风险】评分:{score}"
-                child = _add_standard_child(parent, title, parent.get("path", ""))
+                child = _add_standard_child(parent, title, parent.get("path", ""), used)
                 flat.append(child)
                 if child.get("path"):
-                    path_to_node[child["path"]] = child
+                    trie.insert(child["path"], child)
 
 
 def write_merged_xmind(roots: List[Dict[str, Any]], out_path: str) -> None:
     """将合并后的标准测试树（多 sheet）写入为 XMind Zen 格式的 .xmind 文件。"""
     content: List[Dict[str, Any]] = []
     for root in roots:
-        sheet_id = _xmind_topic_id()
+        sheet_id = _xmind_topic_id("sheet:" + (root.get("id") or ""))
         content.append({
             "id": sheet_id,
             "class": "sheet",
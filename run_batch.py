@@ -0,0 +1,239 @@
+"""
+# 批量入口：对整个目录（或 glob）里的文件非交互地执行某个流程，多个文件在独立进程中并行处理
+# 每个文件各起一个子进程运行对应入口脚本（run_pipeline / run_xmind_to_cases / run_xmind_review），
+# 输出仍写到各流程原有的目录；跨进程限流（.cache/rate_limit.sqlite）与 LLM 响应缓存由所有子进程共享。
+#
+用法：
+  python run_batch.py <流程> [目录或 glob] [--workers N] [--dry-run] [其它参数…]
+     流程：pipeline（流程1）| cases（流程2）| review（流程3），也可写 1 / 2 / 3
+     目录或 glob：不传时使用该流程的默认输入目录（inputs/、xmind_excel_input/、xmind_review_input/）；
+                  传目录时取其中该流程支持的文件，传 glob 时按 glob 匹配（支持 **）
+     --workers N：同时处理的文件数（默认读 BATCH_WORKERS，未配置为 4）
+     --dry-run：只列出将要处理的文件与命令，不执行
+     其它参数原样传给每个文件的入口脚本，如 --refresh、--concurrency 4、--format csv、--incremental
+  示例：
+     python run_batch.py pipeline inputs/ --workers 8 --stream
+     python run_batch.py cases "xmind_excel_input/**/*.xmind" --format csv --concurrency 4
+     python run_batch.py review --workers 2 --incremental
+
+输出：
+  每个文件的结果：outputs/<需求文件名>/、xmind_excel_output/<名称>.<格式>、xmind_review_output/<名称>_评审结果.xmind
+  每个文件的运行日志：<流程输出目录>/batch_logs/<批次时间>/<文件名>.log
+  汇总：<流程输出目录>/batch_summary_<批次时间>.json（每个文件的状态、耗时、输出与日志路径），并在终端打印
+  有文件失败时以退出码 1 结束，便于定时任务告警。
+"""
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from settings import load_env
+
+load_env()
+
+ROOT = Path(__file__).resolve().parent
+
+# 同时处理的文件数（每个文件一个子进程），可被 --workers 覆盖
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+
+_PIPELINE_PATTERNS = ("*.md", "*.markdown", "*.txt", "*.pdf", "*.png", "*.jpg", "*.jpeg", "*.webp")
+
+# 流程名 -> 入口脚本、默认输入目录、支持的文件、输出根目录
+FLOWS: Dict[str, Dict[str, Any]] = {
+    "pipeline": {
+        "script": "run_pipeline.py",
+        "input_dir": ROOT / "inputs",
+        "patterns": _PIPELINE_PATTERNS,
+        "output_dir": ROOT / "outputs",
+    },
+    "cases": {
+        "script": "run_xmind_to_cases.py",
+        "input_dir": ROOT / "xmind_excel_input",
+        "patterns": ("*.xmind",),
+        "output_dir": ROOT / "xmind_excel_output",
+    },
+    "review": {
+        "script": "run_xmind_review.py",
+        "input_dir": ROOT / "xmind_review_input",
+        "patterns": ("*.xmind",),
+        "output_dir": ROOT / "xmind_review_output",
+    },
+}
+_FLOW_ALIASES = {"1": "pipeline", "2": "cases", "3": "review"}
+
+
+def _collect_files(flow: str, target: Optional[str]) -> List[Path]:
+    """目录：取其中该流程支持的文件（不递归）；glob：按模式匹配；单个文件原样返回。结果按文件名排序、去重。"""
+    cfg = FLOWS[flow]
+    if target is None:
+        target = str(cfg["input_dir"])
+    path = Path(target)
+    if path.is_dir():
+        found = [p for pat in cfg["patterns"] for p in path.glob(pat)]
+    elif path.is_file():
+        found = [path]
+    else:
+        found = [Path(p) for p in glob.glob(target, recursive=True)]
+    files = {p.resolve() for p in found if p.is_file()}
+    return sorted(files, key=lambda p: (p.name.lower(), str(p)))
+
+
+def _output_of(flow: str, path: Path, passthrough: List[str]) -> Path:
+    """该文件的输出位置（与各入口脚本的命名规则一致），写入汇总便于查找。"""
+    out_dir = FLOWS[flow]["output_dir"]
+    if flow == "pipeline":
+        return out_dir / path.stem
+    if flow == "review":
+        return out_dir / f"{path.stem}_评审结果.xmind"
+    fmt = "xlsx"
+    if "--format" in passthrough:
+        i = passthrough.index("--format")
+        if i + 1 < len(passthrough):
+            fmt = passthrough[i + 1].strip().lower()
+    from case_writer import get_writer_class
+
+    return out_dir / (path.stem + get_writer_class(fmt).extension)
+
+
+def _run_one(flow: str, path: Path, passthrough: List[str], log_path: Path) -> Dict[str, Any]:
+    """在独立子进程中处理一个文件：stdin 关闭（不会停在交互选择），stdout/stderr 写入日志文件。"""
+    cmd = [sys.executable, str(ROOT / FLOWS[flow]["script"]), str(path)] + passthrough
+    env = dict(os.environ, PYTHONIOENCODING="utf-8", PYTHONUNBUFFERED="1")
+    env.pop("OUTPUT_DIR", None)
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    t0 = time.perf_counter()
+    with open(log_path, "w", encoding="utf-8") as log:
+        proc = subprocess.run(cmd, cwd=ROOT, env=env, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT)
+    elapsed = time.perf_counter() - t0
+    result: Dict[str, Any] = {
+        "file": str(path),
+        "status": "ok" if proc.returncode == 0 else "failed",
+        "returncode": proc.returncode,
+        "seconds": round(elapsed, 2),
+        "log": str(log_path),
+    }
+    if proc.returncode != 0:
+        lines = [ln for ln in log_path.read_text(encoding="utf-8", errors="replace").splitlines() if ln.strip()]
+        result["error"] = lines[-1].strip() if lines else f"退出码 {proc.returncode}"
+    return result
+
+
+def _check_output_conflicts(flow: str, files: List[Path], passthrough: List[str]) -> None:
+    """不同文件映射到同一输出（如 inputs/a.md 与 inputs/a.pdf）时并行写会互相覆盖，提前报错。"""
+    seen: Dict[Path, Path] = {}
+    conflicts = []
+    for p in files:
+        out = _output_of(flow, p, passthrough)
+        if out in seen:
+            conflicts.append(f"  {seen[out].name} 与 {p.name} → {out}")
+        else:
+            seen[out] = p
+    if conflicts:
+        raise SystemExit("以下文件的输出位置相同，请重命名后再批量运行：\n" + "\n".join(conflicts))
+
+
+def main() -> None:
+    argv = sys.argv[1:]
+    if not argv or "-h" in argv or "--help" in argv:
+        print(__doc__.strip())
+        return
+    flow = _FLOW_ALIASES.get(argv[0], argv[0]).strip().lower()
+    if flow not in FLOWS:
+        raise SystemExit(f"未知流程: {argv[0]}（可选 pipeline / cases / review）")
+    rest = argv[1:]
+    target: Optional[str] = None
+    if rest and not rest[0].startswith("-"):
+        target = rest.pop(0)
+
+    workers = BATCH_WORKERS
+    dry_run = False
+    passthrough: List[str] = []
+    i = 0
+    while i < len(rest):
+        if rest[i] == "--workers" and i + 1 < len(rest):
+            try:
+                workers = int(rest[i + 1])
+            except ValueError:
+                raise SystemExit(f"--workers 需要正整数，收到: {rest[i + 1]}")
+            i += 2
+            continue
+        if rest[i] == "--dry-run":
+            dry_run = True
+            i += 1
+            continue
+        passthrough.append(rest[i])
+        i += 1
+    workers = max(1, workers)
+
+    files = _collect_files(flow, target)
+    if not files:
+        raise SystemExit(f"未找到要处理的文件: {target or FLOWS[flow]['input_dir']}")
+    _check_output_conflicts(flow, files, passthrough)
+
+    script = FLOWS[flow]["script"]
+    print(f"[批量] 流程 {flow}（{script}），共 {len(files)} 个文件，并行 {min(workers, len(files))} 个进程")
+    if dry_run:
+        for p in files:
+            print(f"  python {script} {p} {' '.join(passthrough)}".rstrip())
+        return
+
+    batch_id = time.strftime("%Y%m%d_%H%M%S")
+    out_root: Path = FLOWS[flow]["output_dir"]
+    log_dir = out_root / "batch_logs" / batch_id
+    t0 = time.perf_counter()
+    results: Dict[Path, Dict[str, Any]] = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_run_one, flow, p, passthrough, log_dir / f"{p.name}.log"): p
+            for p in files
+        }
+        for done, fut in enumerate(as_completed(futures), start=1):
+            p = futures[fut]
+            r = fut.result()
+            r["output"] = str(_output_of(flow, p, passthrough))
+            results[p] = r
+            mark = "完成" if r["status"] == "ok" else f"失败（{r.get('error', '')}）"
+            print(f"[批量] {done}/{len(files)} {p.name} {mark}，耗时 {r['seconds']:.1f}s")
+    wall = time.perf_counter() - t0
+
+    ordered = [results[p] for p in files]
+    ok = sum(1 for r in ordered if r["status"] == "ok")
+    busy = sum(r["seconds"] for r in ordered)
+    summary = {
+        "flow": flow,
+        "batch_id": batch_id,
+        "workers": workers,
+        "passthrough": passthrough,
+        "total": len(ordered),
+        "ok": ok,
+        "failed": len(ordered) - ok,
+        "wall_seconds": round(wall, 2),
+        "sum_seconds": round(busy, 2),
+        "files": ordered,
+    }
+    out_root.mkdir(parents=True, exist_ok=True)
+    summary_path = out_root / f"batch_summary_{batch_id}.json"
+    summary_path.write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    name_width = max(len(Path(r["file"]).name) for r in ordered)
+    print(f"\n{'文件':<{name_width}}  {'状态':<6}{'耗时(s)':>8}  输出")
+    for r in ordered:
+        status = "ok" if r["status"] == "ok" else "失败"
+        print(f"{Path(r['file']).name:<{name_width}}  {status:<6}{r['seconds']:>8.1f}  {r['output'] if r['status'] == 'ok' else r['log']}")
+    print(
+        f"\n[批量] 成功 {ok}/{len(ordered)}，墙钟 {wall:.1f}s，各文件耗时合计 {busy:.1f}s"
+        f"（并行加速约 {busy / max(wall, 1e-9):.1f}x）"
+    )
+    print(f"[批量] 汇总: {summary_path}")
+    print(f"[批量] 日志: {log_dir}")
+    if ok < len(ordered):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,48 @@
 """
 # 流程1：需求 → 需求分析 + 测试点 + XMind（不生成测试用例）
-# 一键流水线：列出 inputs/ 下的需求文件，交互选择后依次执行 Step0 → Step1 → Step2。
+# 一键流水线：列出 inputs/ 下的需求文件，交互选择后执行 Step0 ∥ (Step1 → Step2)。
 #
 用法：
   python run_pipeline.py
      从 inputs/ 列出需求文件（.md / .txt / .pdf / 图片），交互选择后执行。
   python run_pipeline.py inputs/我的需求.md
      指定需求文件路径，直接执行。
+  python run_pipeline.py inputs/我的需求.md --refresh | --no-cache
+     --refresh 忽略已缓存的 LLM 回复并重新请求；--no-cache 完全不读写 LLM 响应缓存。
+  python run_pipeline.py inputs/我的需求.md --stream
+     流式生成测试点：每完成一个顶层章节就写入 测试点分析.md，并打印首个章节耗时（也可设 LLM_STREAM=1）。
+  python run_pipeline.py inputs/我的需求.md --serial
+     按顺序执行 Step0 → Step1 → Step2（默认 Step0 与 Step1 并行，也可设 PIPELINE_PARALLEL=0）。
+  python run_pipeline.py --list | --help
+     --list 只列出 inputs/ 下的需求文件；--help 显示本说明（二者都不加载 LLM 相关模块）。
 
 目录约定：
   inputs/    放入需求文档（.md / .txt / .pdf 或图片）
   outputs/  按需求文件名创建子文件夹
             outputs/<需求文件名>/需求分析.md、测试点分析.md、对话记录.md、测试点.xmind
 
-说明：Step0 与 Step1 共享同一次解析结果，仅识别内嵌图片一次。
+说明：Step0 与 Step1 共享同一次解析结果，仅识别内嵌图片一次；二者并行执行，Step1 完成后立即转 XMind（Step2），
+     结束时打印各阶段起止时间与并行节省的时间。
 生成测试用例请使用流程2：python run_xmind_to_cases.py <你的测试点.xmind>
 """
 import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Any, Callable, List, Tuple
 
 ROOT = Path(__file__).resolve().parent
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
+from settings import load_env
+
+load_env()
+
+# Step0（5W1H 需求分析）与 Step1（测试点）只依赖解析后的需求正文，默认并行执行；0 时按顺序执行（等同 --serial）
+PIPELINE_PARALLEL = os.getenv("PIPELINE_PARALLEL", "1").strip().lower() not in ("0", "false", "off")
+
 
 def _list_input_files() -> list[Path]:
     """列出 inputs 下所有需求文件：.md / .txt / .pdf 或图片（.png / .jpg / .jpeg / .webp）。"""
@@ -65,11 +84,29 @@ def _select_input() -> Path:
 
 
 def main() -> None:
-    argv_before = sys.argv.copy()
+    # --help / --list 只需标准库，在导入 LLM 相关模块之前处理
+    if "-h" in sys.argv[1:] or "--help" in sys.argv[1:]:
+        print(__doc__.strip())
+        return
+    if "--list" in sys.argv[1:]:
+        for p in _list_input_files():
+            print(p)
+        return
+
+    import concurrency_control
+    import hedging
+    import llm_cache
+    import rate_limiter
+    import vision_cache
+
+    rest = llm_cache.apply_cli_flags(sys.argv[1:])
+    stream = "--stream" in rest
+    parallel = PIPELINE_PARALLEL and "--serial" not in rest
+    positional = [a for a in rest if a not in ("--stream", "--serial")]
 
     # 确定输入文件
-    if len(argv_before) >= 2:
-        in_path = Path(argv_before[1])
+    if positional:
+        in_path = Path(positional[0])
         if not in_path.is_absolute():
             in_path = Path.cwd() / in_path
         if not in_path.exists():
@@ -84,37 +121,68 @@ def main() -> None:
     os.environ["OUTPUT_DIR"] = str(output_dir)
     print(f"输出目录: {output_dir}\n")
 
+    t_start = time.perf_counter()
+    stages: List[Tuple[str, float, float]] = []
+
+    def _stage(name: str, fn: Callable[[], Any]) -> Any:
+        """执行一个阶段并记录起止时间（相对流程开始），便于看出 Step0 与 Step1 的重叠。"""
+        t0 = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            t1 = time.perf_counter()
+            stages.append((name, t0 - t_start, t1 - t_start))
+            print(f"[耗时] {name} 完成，用时 {t1 - t0:.1f}s")
+
     # 只解析一次，Step0 与 Step1 共享 req_text
     from generate_md_v2 import get_req_text
 
-    req_text = get_req_text(in_path, prefix="[解析]")
+    req_text = _stage("解析需求", lambda: get_req_text(in_path, prefix="[解析]"))
     if not req_text.strip():
         raise SystemExit("需求内容为空，无法分析。")
 
-    # Step0: 需求分析
-    try:
-        import step0_req_to_analysis
-
-        step0_req_to_analysis.main(req_text=req_text, in_path=in_path)
-    finally:
-        sys.argv = argv_before
-
-    # Step1: 测试点 MD
-    try:
-        import step1_req_to_md
-
-        step1_req_to_md.main(req_text=req_text, in_path=in_path)
-    finally:
-        sys.argv = argv_before
-
-    # Step2: MD → XMind
-    sys.argv = [sys.argv[0]]
-    try:
-        import step2_md_to_xmind
-        step2_md_to_xmind.main()
-    finally:
-        sys.argv = argv_before
-
+    import step0_req_to_analysis
+    import step1_req_to_md
+    import step2_md_to_xmind
+
+    def _step0() -> None:
+        _stage("Step0 需求分析", lambda: step0_req_to_analysis.main(req_text=req_text, in_path=in_path))
+
+    def _step1_then_step2() -> None:
+        # Step2 只依赖 Step1 写出的 测试点分析.md：Step1 一结束就转 XMind，不等 Step0
+        stream_on = stream or step1_req_to_md.LLM_STREAM
+        _stage("Step1 测试点", lambda: step1_req_to_md.main(req_text=req_text, in_path=in_path, stream=stream_on))
+        _stage("Step2 XMind", lambda: step2_md_to_xmind.main(md_file=step1_req_to_md.OUTPUTS_DIR / "测试点分析.md"))
+
+    if parallel:
+        # Step0 与 Step1 互不依赖，两路 LLM 调用同时进行；某一路失败时等另一路结束后再报错
+        print("[流程1] Step0（需求分析）与 Step1 → Step2（测试点 → XMind）并行执行")
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="pipeline") as pool:
+            futures = [pool.submit(_step0), pool.submit(_step1_then_step2)]
+            errors = [f.exception() for f in futures]
+        for err in errors:
+            if err is not None:
+                raise err
+    else:
+        _step0()
+        _step1_then_step2()
+
+    wall = time.perf_counter() - t_start
+    busy = sum(end - begin for _name, begin, end in stages)
+    print("\n[耗时] 各阶段（相对流程开始，秒）：")
+    for name, begin, end in sorted(stages, key=lambda st: st[1]):
+        print(f"  {begin:>7.1f} → {end:>7.1f}  用时 {end - begin:>6.1f}s  {name}")
+    print(f"[耗时] 总墙钟 {wall:.1f}s，各阶段合计 {busy:.1f}s" + (f"，并行节省约 {busy - wall:.1f}s" if busy > wall else ""))
+
+    print(llm_cache.stats_line())
+    vision_stats = vision_cache.stats()
+    if vision_stats["hits"] + vision_stats["misses"]:
+        print(vision_cache.stats_line())
+    print(rate_limiter.stats_line())
+    if hedging.LLM_HEDGE:
+        print(hedging.stats_line())
+    if concurrency_control.LLM_AIMD:
+        print(concurrency_control.stats_line())
     print(f"\n✅ 流程1 完成。输出目录: {output_dir}")
 
 
@@ -6,7 +6,14 @@
 用法：
   python run_xmind_review.py
       从 xmind_review_input/ 列出 .xmind，选一个；同目录下可选 prd.txt / prototype.txt
-  python run_xmind_review.py <测试点.xmind> [--prd 需求.txt] [--prototype 原型.txt]
+  python run_xmind_review.py <测试点.xmind> [--prd 需求.txt] [--prototype 原型.txt] [--refresh | --no-cache]
+                             [--shard module|nodes] [--concurrency N] [--incremental]
+      --refresh 忽略已缓存的评审回复重新请求；--no-cache 不读写 LLM 响应缓存
+      --shard 大测试树分片并发评审：module 按一级模块分片，nodes 按节点数打包（REVIEW_SHARD_MAX_NODES）
+      --concurrency 同时进行的评审请求数（默认 REVIEW_CONCURRENCY）
+      --incremental 只评审相对上次有改动的模块（子树哈希比对），未变化的模块沿用上次结论
+  python run_xmind_review.py --list | --help
+      --list 只列出 xmind_review_input/ 下的 .xmind；--help 显示本说明（二者都不加载 LLM 相关模块）
 """
 import sys
 from pathlib import Path
@@ -62,10 +69,27 @@ def _read_optional_text(path: Path) -> str:
 
 
 def main() -> None:
-    argv = sys.argv[1:]
+    # --help / --list 只需标准库，在导入 LLM 相关模块之前处理
+    if "-h" in sys.argv[1:] or "--help" in sys.argv[1:]:
+        print(__doc__.strip())
+        return
+    if "--list" in sys.argv[1:]:
+        for p in _list_xmind_files():
+            print(p)
+        return
+
+    import concurrency_control
+    import hedging
+    import llm_cache
+    import rate_limiter
+
+    argv = llm_cache.apply_cli_flags(sys.argv[1:])
     xmind_path: Path | None = None
     prd_path: Path | None = None
     prototype_path: Path | None = None
+    shard: str | None = None
+    concurrency: int | None = None
+    incremental: bool | None = None
 
     i = 0
     while i < len(argv):
@@ -77,6 +101,23 @@ def main() -> None:
             prototype_path = Path(argv[i + 1]).resolve()
             i += 2
             continue
+        if argv[i] == "--shard" and i + 1 < len(argv):
+            shard = argv[i + 1].strip().lower()
+            if shard not in ("module", "nodes"):
+                raise SystemExit("--shard 只支持 module 或 nodes")
+            i += 2
+            continue
+        if argv[i] == "--incremental":
+            incremental = True
+            i += 1
+            continue
+        if argv[i] == "--concurrency" and i + 1 < len(argv):
+            try:
+                concurrency = max(1, int(argv[i + 1]))
+            except ValueError:
+                raise SystemExit(f"--concurrency 需要正整数，收到: {argv[i + 1]}")
+            i += 2
+            continue
         if not argv[i].startswith("--"):
             xmind_path = Path(argv[i]).resolve()
             if not xmind_path.is_absolute() or not xmind_path.exists():
@@ -144,10 +185,10 @@ def main() -> None:
 
     roots, flat = xmind_to_test_tree(str(xmind_path))
     if not flat:
-        raise SystemExit("未解析到任何测试树节点，请检查 XMind 格式（需含 content.json）。")
+        raise SystemExit("未解析到任何测试树节点，请检查 XMind 格式（需含 content.json 或 XMind 8 的 content.xml）。")
 
     print(f"[流程3] 解析到节点数: {len(flat)}")
-    report = run_review(prd_text, prototype_text, flat)
+    report = run_review(prd_text, prototype_text, flat, shard=shard, concurrency=concurrency, incremental=incremental)
     print("[流程3] AI 评审完成")
 
     details = report.get("details") or []
@@ -160,6 +201,12 @@ def main() -> None:
     write_merged_xmind(roots, str(out_xmind_path))
 
     summary = report.get("summary", {})
+    print(llm_cache.stats_line())
+    print(rate_limiter.stats_line())
+    if hedging.LLM_HEDGE:
+        print(hedging.stats_line())
+    if concurrency_control.LLM_AIMD:
+        print(concurrency_control.stats_line())
     print(f"\n✅ 流程3 完成，输出: {out_xmind_path}")
     print(f"  - 缺失场景: {summary.get('total_missing', 0)}  覆盖不足: {summary.get('weak_nodes', 0)}  风险节点: {summary.get('risk_count', 0)}")
 
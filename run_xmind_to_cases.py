@@ -7,7 +7,17 @@
      从 xmind_excel_input/ 列出 .xmind 文件，交互选择后执行（与流程1 相同方式）。
   python run_xmind_to_cases.py <测试点.xmind>
      指定文件路径，直接执行。
-  python run_xmind_to_cases.py <测试点.xmind> [--template 用例模板.xlsx] [--output 路径.xlsx]
+  python run_xmind_to_cases.py <测试点.xmind> [--template 用例模板.xlsx] [--output 路径.xlsx] [--concurrency N]
+     --concurrency N：同时向 LLM 发起 N 个叶子请求，Excel 行顺序仍与 XMind 叶子顺序一致
+  python run_xmind_to_cases.py <测试点.xmind> --batch-tokens 3000
+     --batch-tokens N：同父兄弟叶子合并为一次请求（单请求估算 token ≤ N），减少请求数与重复前缀
+  --refresh / --no-cache：忽略 LLM 响应缓存重新生成 / 完全不使用缓存（默认命中缓存的叶子不再请求）
+  --resume：上次运行中断后继续，跳过断点日志中已完成的叶子
+  --incremental：只为新增/改动的叶子请求 LLM，路径未变的叶子复用上次生成的用例
+  --format xlsx|csv|jsonl|testlink：输出格式，默认 xlsx；jsonl / testlink（TestLink 导入 XML）不需要模板，
+     大批量用例建议用 csv / jsonl，边生成边写出，不经过 Excel
+  python run_xmind_to_cases.py --list | --help
+     --list 只列出 xmind_excel_input/ 下的 .xmind；--help 显示本说明（二者都不加载 LLM 相关模块）
 """
 import sys
 from pathlib import Path
@@ -65,6 +75,15 @@ def _resolve_xmind_path(raw: str) -> Path:
 
 
 def main() -> None:
+    # --help / --list 只需标准库，在导入 LLM 相关模块之前处理
+    if "-h" in sys.argv[1:] or "--help" in sys.argv[1:]:
+        print(__doc__.strip())
+        return
+    if "--list" in sys.argv[1:]:
+        for p in _list_xmind_files():
+            print(p)
+        return
+
     argv = sys.argv[1:]
     opts = {}
     i = 0
@@ -77,6 +96,26 @@ def main() -> None:
             opts["output"] = Path(argv[i + 1]).resolve()
             i += 2
             continue
+        if argv[i] == "--concurrency" and i + 1 < len(argv):
+            opts["concurrency"] = argv[i + 1]
+            i += 2
+            continue
+        if argv[i] == "--batch-tokens" and i + 1 < len(argv):
+            opts["batch_tokens"] = argv[i + 1]
+            i += 2
+            continue
+        if argv[i] == "--format" and i + 1 < len(argv):
+            opts["format"] = argv[i + 1]
+            i += 2
+            continue
+        if argv[i] in ("--resume", "--incremental"):
+            opts.setdefault("flags", []).append(argv[i])
+            i += 1
+            continue
+        if argv[i] in ("--no-cache", "--refresh"):
+            opts.setdefault("cache_flags", []).append(argv[i])
+            i += 1
+            continue
         if not argv[i].startswith("--"):
             opts["xmind"] = _resolve_xmind_path(argv[i])
         i += 1
@@ -90,14 +129,22 @@ def main() -> None:
         print(f"错误: 文件不存在 {xmind_path}\n可将文件放入 {XMIND_INPUT_DIR} 后重新运行或只传文件名。")
         sys.exit(1)
 
-    # 调用 step3：argv = [脚本, xmind路径, 可选模板, 可选输出]
+    import step3_xmind_to_excel
+
+    # 调用 step3：argv = [脚本, xmind路径, 可选模板, 可选输出]（只给输出时模板位补默认值，避免输出被当成模板）
     sys.argv = [sys.argv[0], str(xmind_path)]
-    if opts.get("template"):
-        sys.argv.append(str(opts["template"]))
+    if opts.get("template") or opts.get("output"):
+        sys.argv.append(str(opts.get("template") or step3_xmind_to_excel.DEFAULT_TEMPLATE))
     if opts.get("output"):
         sys.argv.append(str(opts["output"]))
-
-    import step3_xmind_to_excel
+    if opts.get("format"):
+        sys.argv += ["--format", opts["format"]]
+    if opts.get("concurrency"):
+        sys.argv += ["--concurrency", opts["concurrency"]]
+    if opts.get("batch_tokens"):
+        sys.argv += ["--batch-tokens", opts["batch_tokens"]]
+    sys.argv += opts.get("cache_flags", [])
+    sys.argv += opts.get("flags", [])
 
     step3_xmind_to_excel.main()
 
@@ -0,0 +1,78 @@
+# 公共：配置与 LLM 客户端的惰性入口
+# import 任何模块都不读取 LLM 配置、不创建客户端、不会因缺少密钥而退出；首次真正调用 LLM 时才解析配置并建客户端。
+# .env 在进程内只加载一次（各模块统一调用 load_env()，不再各自 load_dotenv()）。
+import os
+import threading
+from typing import Any, Dict, Optional
+
+_env_lock = threading.Lock()
+_env_loaded = False
+_llm_config: Optional[Dict[str, str]] = None
+
+
+def load_env() -> None:
+    """加载 .env（进程内只加载一次；已存在的环境变量不被覆盖，与 load_dotenv() 默认行为一致）。"""
+    global _env_loaded
+    if _env_loaded:
+        return
+    with _env_lock:
+        if _env_loaded:
+            return
+        try:
+            from dotenv import load_dotenv
+        except ImportError:
+            pass
+        else:
+            load_dotenv()
+        _env_loaded = True
+
+
+def _read_llm_config() -> Dict[str, str]:
+    """优先使用 Gemini（原生 SDK），否则使用 DashScope。"""
+    load_env()
+    if os.getenv("GEMINI_API_KEY"):
+        return {
+            "provider": "gemini",
+            "api_key": os.getenv("GEMINI_API_KEY", ""),
+            "base_url": os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta/openai/"),
+            "model": os.getenv("GEMINI_MODEL", "gemini-2.0-flash"),
+            "vision_model": os.getenv("GEMINI_VISION_MODEL", "gemini-2.0-flash"),
+        }
+    api_key = os.getenv("DASHSCOPE_API_KEY")
+    if not api_key:
+        raise SystemExit("请在 .env 里配置 GEMINI_API_KEY 或 DASHSCOPE_API_KEY")
+    return {
+        "provider": "dashscope",
+        "api_key": api_key,
+        "base_url": os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"),
+        "model": os.getenv("DASHSCOPE_MODEL", "qwen-plus"),
+        "vision_model": os.getenv("DASHSCOPE_VISION_MODEL", "qwen-vl-plus"),
+    }
+
+
+def llm_config() -> Dict[str, str]:
+    """
+    需求 → 测试点（流程1）使用的 LLM 配置：provider / api_key / base_url / model / vision_model。
+    首次调用时读取并缓存；两个密钥都未配置时 SystemExit。
+    """
+    global _llm_config
+    if _llm_config is None:
+        cfg = _read_llm_config()
+        with _env_lock:
+            if _llm_config is None:
+                _llm_config = cfg
+    return _llm_config
+
+
+def use_native_gemini() -> bool:
+    return llm_config()["provider"] == "gemini"
+
+
+def text_client() -> Any:
+    """文本对话客户端：Gemini 走原生 SDK 返回 None（llm_gateway 约定），否则为共享的 OpenAI 兼容客户端。"""
+    cfg = llm_config()
+    if cfg["provider"] == "gemini":
+        return None
+    from llm_clients import get_openai_client
+
+    return get_openai_client(cfg["api_key"], cfg["base_url"])
@@ -55,4 +55,7 @@ def main(req_text: str | None = None, in_path: Path | None = None) -> None:
 
 
 if __name__ == "__main__":
-    main()
+    if "-h" in sys.argv[1:] or "--help" in sys.argv[1:]:
+        print(__doc__.strip())
+    else:
+        main()
@@ -1,20 +1,28 @@
 """
 # 需求 → 测试点 MD。生成 测试点分析.md、对话记录.md（与 AI 的完整对话流程）。
 步骤1：从 inputs 目录读取需求文件，生成 MD 测试点文档。
-用法：python step1_req_to_md.py [inputs/需求.md]
+用法：python step1_req_to_md.py [inputs/需求.md] [--stream]
       不传参数时自动使用 inputs 下第一个 .md 或 .txt 文件。
+      --stream（或 LLM_STREAM=1）：流式生成，每完成一个顶层章节即写入测试点分析.md。
 输出：outputs/测试点分析.md、outputs/对话记录.md（或 OUTPUT_DIR 下）
 """
 import os
 import sys
 from pathlib import Path
 
+from settings import load_env
+
+load_env()
+
 # SAVE_PROMPT=0 可禁用对话记录保存；默认保存到 对话记录.md
 SAVE_PROMPT = os.environ.get("SAVE_PROMPT", "1").strip().lower() != "0"
+# LLM_STREAM=1 时流式生成：每完成一个顶层章节即写入 测试点分析.md，并打印首个章节耗时
+LLM_STREAM = os.environ.get("LLM_STREAM", "0").strip().lower() in ("1", "true", "on")
 
 from generate_md_v2 import (
     IMAGE_EXTENSIONS,
     PDF_EXTENSION,
+    ProgressiveMarkdownWriter,
     get_req_text,
     llm_generate_struct,
     llm_generate_struct_from_image,
@@ -48,10 +56,13 @@ def is_pdf_path(path: Path) -> bool:
     return path.suffix.lower() == PDF_EXTENSION
 
 
-def main(req_text: str | None = None, in_path: Path | None = None) -> None:
+def main(req_text: str | None = None, in_path: Path | None = None, stream: bool | None = None) -> None:
+    if stream is None:
+        stream = LLM_STREAM or "--stream" in sys.argv[1:]
     if in_path is None:
-        if len(sys.argv) >= 2:
-            in_path = Path(sys.argv[1])
+        argv = [a for a in sys.argv[1:] if a != "--stream"]
+        if argv:
+            in_path = Path(argv[0])
             if not in_path.is_absolute():
                 in_path = Path.cwd() / in_path
             if not in_path.exists():
@@ -59,16 +70,23 @@ def main(req_text: str | None = None, in_path: Path | None = None) -> None:
         else:
             in_path = find_input_file()
 
+    OUTPUTS_DIR.mkdir(parents=True, exist_ok=True)
+    md_path = OUTPUTS_DIR / "测试点分析.md"
+    on_section = None
+    if stream:
+        # 流式：章节逐个写入 MD，生成结束后再整体覆盖为最终版本
+        on_section = ProgressiveMarkdownWriter(str(md_path), in_path.name).append_section
+
     conversation_md = ""
     if req_text is None:
         if is_image_path(in_path):
             print("[Step1] 检测到图片需求，使用视觉模型识别…")
-            result, conversation_md = llm_generate_struct_from_image(str(in_path))
+            result, conversation_md = llm_generate_struct_from_image(str(in_path), stream=stream, on_section=on_section)
         else:
             req_text = get_req_text(in_path, prefix="[Step1]")
-            result, conversation_md = llm_generate_struct(req_text)
+            result, conversation_md = llm_generate_struct(req_text, stream=stream, on_section=on_section)
     else:
-        result, conversation_md = llm_generate_struct(req_text)
+        result, conversation_md = llm_generate_struct(req_text, stream=stream, on_section=on_section)
 
     if SAVE_PROMPT and conversation_md:
         out = OUTPUTS_DIR / "对话记录.md"
@@ -76,9 +94,6 @@ def main(req_text: str | None = None, in_path: Path | None = None) -> None:
         out.write_text(conversation_md, encoding="utf-8")
         print(f"[Step1] 对话记录已保存: {out}")
 
-    OUTPUTS_DIR.mkdir(parents=True, exist_ok=True)
-    md_path = OUTPUTS_DIR / "测试点分析.md"
-
     save_to_markdown(result, str(md_path), file_title=in_path.name)
 
     print(f"[Step1] 需求 → 测试点 MD 完成")
@@ -86,4 +101,7 @@ def main(req_text: str | None = None, in_path: Path | None = None) -> None:
 
 
 if __name__ == "__main__":
-    main()
+    if "-h" in sys.argv[1:] or "--help" in sys.argv[1:]:
+        print(__doc__.strip())
+    else:
+        main()
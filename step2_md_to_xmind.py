@@ -142,9 +142,10 @@ def md_to_xmind_zen(md_path: str, out_xmind_path: str, root_title: str = "测试
         z.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False))
 
 
-def main() -> None:
+def main(md_file: Path | None = None) -> None:
     import sys
-    md_file = Path(sys.argv[1]) if len(sys.argv) >= 2 else DEFAULT_MD
+    if md_file is None:
+        md_file = Path(sys.argv[1]) if len(sys.argv) >= 2 else DEFAULT_MD
     if not md_file.exists():
         raise SystemExit(f"MD 文件不存在: {md_file}\n请先运行 step1_req_to_md.py 生成 测试点分析.md")
 
@@ -156,4 +157,9 @@ def main() -> None:
 
 
 if __name__ == "__main__":
-    main()
+    import sys
+
+    if "-h" in sys.argv[1:] or "--help" in sys.argv[1:]:
+        print(__doc__.strip())
+    else:
+        main()
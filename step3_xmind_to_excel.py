@@ -5,14 +5,19 @@
 用法：
   python step3_xmind_to_excel.py <测试点.xmind>
      从 xmind_excel_input/ 读取同名文件，或使用当前目录/绝对路径；输出到 xmind_excel_output/测试点.xlsx
-  python step3_xmind_to_excel.py <测试点.xmind> [用例模板.xlsx] [输出路径.xlsx]
+  python step3_xmind_to_excel.py <测试点.xmind> [用例模板.xlsx] [输出路径.xlsx] [--concurrency N]
+     --concurrency N：叶子级并发生成（默认读 CASES_CONCURRENCY，未配置为 1 即串行），用例行顺序不变
+  python step3_xmind_to_excel.py <测试点.xmind> --batch-tokens 3000
+     --batch-tokens N：同父兄弟叶子打包为一次请求，单请求估算 token 不超过 N（默认读 CASES_BATCH_TOKENS，0 关闭）
+  --refresh：忽略已缓存的 LLM 回复重新生成；--no-cache：不读写 LLM 响应缓存
+  --resume：上次运行中断时，从输出文件旁的 <名称>.journal.jsonl 跳过已完成的叶子继续生成
+  --incremental：XMind 改动后重跑，复用上次清单 <名称>.manifest.json 中路径未变的叶子，只为新增/改动的叶子请求 LLM
+  --format xlsx|csv|jsonl|testlink：输出格式（默认 xlsx）；未指定输出路径时扩展名随格式变化（testlink 为 .xml）
 """
 import os
 import sys
 from pathlib import Path
 
-from generate_cases_mvp import generate_cases_from_xmind_bytes
-
 ROOT = Path(__file__).resolve().parent
 XMIND_INPUT_DIR = ROOT / "xmind_excel_input"
 XMIND_OUTPUT_DIR = ROOT / "xmind_excel_output"
@@ -37,8 +42,53 @@ def _resolve_xmind_path(raw: str) -> Path:
     return Path(raw).resolve()
 
 
+def _split_options(argv: list[str]) -> tuple[list[str], dict]:
+    """从参数中拆出 --xxx 选项，返回 (位置参数, 选项)。"""
+    positional: list[str] = []
+    opts: dict = {}
+    i = 0
+    while i < len(argv):
+        if argv[i] == "--concurrency" and i + 1 < len(argv):
+            try:
+                opts["concurrency"] = max(1, int(argv[i + 1]))
+            except ValueError:
+                raise SystemExit(f"--concurrency 需要正整数，收到: {argv[i + 1]}")
+            i += 2
+            continue
+        if argv[i] == "--batch-tokens" and i + 1 < len(argv):
+            try:
+                opts["batch_tokens"] = max(0, int(argv[i + 1]))
+            except ValueError:
+                raise SystemExit(f"--batch-tokens 需要整数，收到: {argv[i + 1]}")
+            i += 2
+            continue
+        if argv[i] == "--format" and i + 1 < len(argv):
+            opts["format"] = argv[i + 1].strip().lower()
+            i += 2
+            continue
+        if argv[i] in ("--resume", "--incremental"):
+            opts[argv[i][2:]] = True
+            i += 1
+            continue
+        positional.append(argv[i])
+        i += 1
+    return positional, opts
+
+
 def main() -> None:
-    raw_xmind = sys.argv[1] if len(sys.argv) >= 2 else None
+    # LLM 相关模块（tenacity、openpyxl 等）在 main 中才导入，--help 与被 run_xmind_to_cases 导入取常量时不加载
+    import concurrency_control
+    import hedging
+    import llm_cache
+    import rate_limiter
+    from case_journal import discard_journal, journal_path_for
+    from case_manifest import manifest_path_for
+    from case_writer import get_writer_class
+    from generate_cases_mvp import generate_cases_from_xmind_bytes
+
+    positional, opts = _split_options(llm_cache.apply_cli_flags(sys.argv[1:]))
+    argv = [sys.argv[0]] + positional
+    raw_xmind = argv[1] if len(argv) >= 2 else None
     if not raw_xmind:
         raise SystemExit(
             "请指定测试点 .xmind 文件。\n"
@@ -46,8 +96,10 @@ def main() -> None:
             "可将 xmind 放入 xmind_excel_input/ 后只传文件名。"
         )
     xmind_path = _resolve_xmind_path(raw_xmind)
-    template_path = Path(sys.argv[2]) if len(sys.argv) >= 3 else DEFAULT_TEMPLATE
-    out_path = Path(sys.argv[3]) if len(sys.argv) >= 4 else None
+    output_format = opts.get("format", "xlsx")
+    writer_cls = get_writer_class(output_format)
+    template_path = Path(argv[2]) if len(argv) >= 3 else DEFAULT_TEMPLATE
+    out_path = Path(argv[3]) if len(argv) >= 4 else None
 
     if not xmind_path.exists():
         raise SystemExit(
@@ -56,22 +108,43 @@ def main() -> None:
         )
     if not template_path.exists():
         template_path = FALLBACK_TEMPLATE
-    if not template_path.exists():
+    if not template_path.exists() and writer_cls.uses_template:
         raise SystemExit(
             f"用例模板不存在: {template_path}\n请在 templates/ 下放置 用例模板.xlsx，或项目根目录放置 用例模板.xlsx。"
         )
 
     if out_path is None:
         XMIND_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-        out_path = XMIND_OUTPUT_DIR / (xmind_path.stem + ".xlsx")
+        out_path = XMIND_OUTPUT_DIR / (xmind_path.stem + writer_cls.extension)
     out_path = out_path.resolve()
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
     xmind_bytes = xmind_path.read_bytes()
-    excel_bytes = generate_cases_from_xmind_bytes(xmind_bytes, str(template_path))
-    out_path.write_bytes(excel_bytes)
+    journal_path = journal_path_for(out_path)
+    generate_cases_from_xmind_bytes(
+        xmind_bytes,
+        str(template_path),
+        concurrency=opts.get("concurrency"),
+        batch_tokens=opts.get("batch_tokens"),
+        journal_path=str(journal_path),
+        resume=opts.get("resume", False),
+        manifest_path=str(manifest_path_for(out_path)),
+        incremental=opts.get("incremental"),
+        output_path=str(out_path),
+        output_format=output_format,
+    )
+    discard_journal(journal_path)
+    print(llm_cache.stats_line())
+    print(rate_limiter.stats_line())
+    if hedging.LLM_HEDGE:
+        print(hedging.stats_line())
+    if concurrency_control.LLM_AIMD:
+        print(concurrency_control.stats_line())
     print(f"[流程2] XMind → 测试用例 完成: {out_path}")
 
 
 if __name__ == "__main__":
-    main()
+    if "-h" in sys.argv[1:] or "--help" in sys.argv[1:]:
+        print(__doc__.strip())
+    else:
+        main()
@@ -1,6 +1,9 @@
 # 流程3：测试树工具——树转 MD、路径列表、按 id 查找
+# 同时支持 dict 节点与紧凑存储的视图（compact_tree.FlatNodes / TestNode）
 from typing import Any, Dict, List
 
+from compact_tree import FlatNodes, NodeIdMap
+
 
 def tree_to_md_lines(node: Dict[str, Any], indent: int = 0) -> List[str]:
     """将统一测试树节点转为 Markdown 列表（供 LLM 语义理解）。"""
@@ -30,6 +33,11 @@ def tree_to_standard_md(roots: List[Dict[str, Any]]) -> str:
 
 def flat_to_compressed_path_list(flat: List[Dict[str, Any]]) -> str:
     """将扁平节点列表转为「压缩路径列表」文本，供 AI 输入用（控制 token）。"""
+    if isinstance(flat, FlatNodes):
+        # 整棵紧凑树：一次遍历生成全部路径，不逐个节点回溯父链
+        id_num, level = flat.tree.id_num, flat.tree.level
+        lines = [f"  {path}  [id:node-{id_num[i]:08x}] level={level[i]}" for i, path in enumerate(flat.tree.iter_paths())]
+        return "\n".join(lines) if lines else "（无节点）"
     lines = []
     for n in flat:
         path = n.get("path") or ""
@@ -40,5 +48,7 @@ def flat_to_compressed_path_list(flat: List[Dict[str, Any]]) -> str:
 
 
 def build_id_to_node(flat: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
-    """建立 node_id -> 节点 的映射，便于分支定位与高亮。"""
+    """建立 node_id -> 节点 的映射，便于分支定位与高亮（紧凑存储时返回按需查询的映射视图）。"""
+    if isinstance(flat, FlatNodes):
+        return NodeIdMap(flat.tree)
     return {n["id"]: n for n in flat if n.get("id")}
@@ -0,0 +1,103 @@
+# Token 估算：离线近似，不依赖具体模型的分词器。供批量打包、限流预估、上下文窗口检查等使用。
+import os
+from typing import Any, Dict, List, Optional
+
+from settings import load_env
+
+load_env()
+
+# 各模型上下文窗口（输入 + 输出 token）。按最长前缀匹配模型名，可用 LLM_CONTEXT_LIMITS 覆盖/补充。
+MODEL_CONTEXT_LIMITS: Dict[str, int] = {
+    "gemini-1.5-pro": 2_097_152,
+    "gemini-1.5-flash": 1_048_576,
+    "gemini-2.0-flash": 1_048_576,
+    "gemini-2.5": 1_048_576,
+    "gemini": 1_048_576,
+    "qwen-long": 10_000_000,
+    "qwen-turbo": 1_000_000,
+    "qwen-plus": 131_072,
+    "qwen-max": 32_768,
+    "qwen-vl": 32_768,
+    "qwen": 32_768,
+}
+# 未知模型的保守默认值
+DEFAULT_CONTEXT_LIMIT = int(os.getenv("LLM_DEFAULT_CONTEXT_LIMIT", "32768"))
+# 「模型:上下文token」逗号分隔，如 qwen-plus:131072,my-model:65536
+LLM_CONTEXT_LIMITS = os.getenv("LLM_CONTEXT_LIMITS", "")
+# 按模型校准估算值：「模型:倍数」逗号分隔，如 qwen-plus:1.15（用真实 usage 对比离线估算得出）
+LLM_TOKEN_CALIBRATION = os.getenv("LLM_TOKEN_CALIBRATION", "")
+# 为模型输出预留的 token 数（从上下文窗口中扣除）
+LLM_OUTPUT_RESERVE_TOKENS = int(os.getenv("LLM_OUTPUT_RESERVE_TOKENS", "8192"))
+
+
+def _parse_model_map(raw: str, cast: Any) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for item in raw.split(","):
+        name, _, value = item.strip().rpartition(":")
+        if not name:
+            continue
+        try:
+            out[name.strip()] = cast(value)
+        except ValueError:
+            continue
+    return out
+
+
+_CONTEXT_OVERRIDES: Dict[str, int] = _parse_model_map(LLM_CONTEXT_LIMITS, int)
+_CALIBRATION: Dict[str, float] = _parse_model_map(LLM_TOKEN_CALIBRATION, float)
+
+
+def _lookup(table: Dict[str, Any], model: str) -> Optional[Any]:
+    """精确匹配优先，否则取最长前缀匹配。"""
+    if model in table:
+        return table[model]
+    best = ""
+    for prefix in table:
+        if model.startswith(prefix) and len(prefix) > len(best):
+            best = prefix
+    return table[best] if best else None
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符约 1 token/字，其余约 4 字符/token。"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if "\u3000" <= ch <= "\u9fff" or "\uff00" <= ch <= "\uffef")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def estimate_messages_tokens(messages: List[Dict[str, Any]]) -> int:
+    """估算一组对话消息的输入 token（每条消息额外计 4 个 token 的角色/分隔开销）。"""
+    total = 0
+    for m in messages:
+        content = m.get("content")
+        if isinstance(content, str):
+            total += estimate_tokens(content)
+        elif isinstance(content, list):
+            for item in content:
+                if isinstance(item, dict) and item.get("type") == "text":
+                    total += estimate_tokens(item.get("text", ""))
+        total += 4
+    return total
+
+
+def context_limit(model: str) -> int:
+    """模型上下文窗口（token）：LLM_CONTEXT_LIMITS 覆盖 > 内置表 > LLM_DEFAULT_CONTEXT_LIMIT。"""
+    model = model or ""
+    return _lookup(_CONTEXT_OVERRIDES, model) or _lookup(MODEL_CONTEXT_LIMITS, model) or DEFAULT_CONTEXT_LIMIT
+
+
+def prompt_budget(model: str, cap: int = 0) -> int:
+    """单次请求可用的输入 token 预算：上下文窗口减去输出预留；cap > 0 时再取较小值。"""
+    budget = max(1024, context_limit(model) - LLM_OUTPUT_RESERVE_TOKENS)
+    return min(budget, cap) if cap > 0 else budget
+
+
+def calibration_factor(model: str) -> float:
+    """LLM_TOKEN_CALIBRATION 中该模型的校准倍数，未配置为 1.0。"""
+    return _lookup(_CALIBRATION, model or "") or 1.0
+
+
+def estimate_for_model(model: str, messages: List[Dict[str, Any]]) -> int:
+    """按模型校准后的消息 token 估算（未配置校准时等同 estimate_messages_tokens）。"""
+    return int(estimate_messages_tokens(messages) * calibration_factor(model))
@@ -0,0 +1,63 @@
+# 流程1：图片识别结果缓存——按 图片内容 SHA-256 + provider + 视觉模型 + 识别提示词 + 提示词版本 做键。
+# 与 LLM 响应缓存共用存储（LLM_CACHE_PATH，TTL 与总大小 LRU 淘汰、--no-cache / --refresh 同样生效），
+# 只是键按图片内容而非 data URL 计算：单张图片输入（get_req_text）与 Markdown 内嵌图片共享同一份结果，
+# 图片换地址、换文件名不影响命中；需求文档更新后重跑流程1，只有新增/改动的图片才会调用视觉模型。
+import hashlib
+import json
+import threading
+from typing import Dict, Optional
+
+import llm_cache
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def image_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_key(digest: str, provider: str, model: str, prompt: str, temperature: float) -> str:
+    """缓存键：图片内容哈希、provider、视觉模型、temperature、识别提示词、提示词版本 的 SHA-256。"""
+    payload = json.dumps(
+        {
+            "kind": "vision",
+            "image_sha256": digest,
+            "provider": provider,
+            "model": model,
+            "temperature": round(float(temperature), 4),
+            "prompt": prompt,
+            "prompt_version": llm_cache.PROMPT_VERSION,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get(key: str) -> Optional[str]:
+    """命中返回识别文本，未命中或缓存已关闭返回 None。"""
+    if not llm_cache.is_enabled():
+        return None
+    value = llm_cache.get(key)
+    with _lock:
+        _stats["hits" if value is not None else "misses"] += 1
+    return value
+
+
+def put(key: str, value: str, provider: str = "", model: str = "") -> None:
+    """写入一条识别结果（空文本不缓存，下次重新识别）。"""
+    llm_cache.put(key, value, provider=provider, model=model)
+
+
+def stats() -> Dict[str, int]:
+    """本进程内图片识别的命中/未命中计数。"""
+    with _lock:
+        return dict(_stats)
+
+
+def stats_line() -> str:
+    s = stats()
+    if not llm_cache.is_enabled():
+        return "[视觉缓存] 已关闭（--no-cache）"
+    return f"[视觉缓存] 命中 {s['hits']} / 未命中 {s['misses']}，省去 {s['hits']} 次视觉模型调用"
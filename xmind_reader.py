@@ -0,0 +1,143 @@
+# 公共：XMind 读取（流程2、流程3 共用）
+# 一次先序遍历逐个交出主题节点，支持 XMind Zen/2020+ 的 content.json 与 XMind 8 的 content.xml（流式解析）。
+# 只处理 attached 子主题（与画布上的主干结构一致），游离主题、概要、标注忽略。
+#
+# 交出的节点为元组 (sheet 序号, 层级, 同级序号, 标题)：层级从 1（中心主题）开始，标题已去首尾空白（可能为空）。
+# 先序 + 层级即可完整还原树形：节点的父节点是它之前最近的一个「层级 - 1」的节点。
+import json
+import xml.etree.ElementTree as ET
+import zipfile
+from typing import IO, Any, Dict, Iterator, List, Tuple
+
+from path_trie import PathTrie, TrieNode
+
+XMindTopic = Tuple[int, int, int, str]
+
+
+def _member_name(z: zipfile.ZipFile) -> str:
+    """优先 content.json（XMind Zen 也会附带一个提示升级的 content.xml），其次 content.xml；都没有返回空串。"""
+    names = z.namelist()
+    for target in ("content.json", "content.xml"):
+        if target in names:
+            return target
+        cand = [n for n in names if n.endswith("/" + target)]
+        if cand:
+            return cand[0]
+    return ""
+
+
+def _iter_json_topics(data: Any) -> Iterator[XMindTopic]:
+    sheets = data if isinstance(data, list) else [data] if isinstance(data, dict) else []
+    for sheet_idx, sheet in enumerate(sheets):
+        root = sheet.get("rootTopic") if isinstance(sheet, dict) else None
+        if not root:
+            continue
+        # 显式栈代替递归：层级很深的导图不会触发递归上限
+        stack: List[Tuple[Dict[str, Any], int, int]] = [(root, 1, 0)]
+        while stack:
+            node, level, index = stack.pop()
+            yield sheet_idx, level, index, (node.get("title") or "").strip()
+            children = node.get("children")
+            attached = (children.get("attached") or []) if isinstance(children, dict) else []
+            for i in range(len(attached) - 1, -1, -1):
+                stack.append((attached[i], level + 1, i))
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _iter_xml_topics(fp: IO[bytes]) -> Iterator[XMindTopic]:
+    """
+    XMind 8 content.xml：sheet > topic > title / children > topics[type=attached] > topic ...
+    用 iterparse 边读边交出，处理完的元素立即 clear，内存占用与导图大小基本无关。
+    主题在其标题解析完（或第一个子主题出现）时交出，仍保持先序。
+    """
+    sheet_idx = -1
+    has_root = False
+    # 每个打开的 topic：[层级, 同级序号, 标题, 是否已交出, 已见子主题数]
+    topics: List[List[Any]] = []
+    tags: List[str] = []
+    # 非 0 时表示正处于需要忽略的分支（游离主题、概要等），值为该分支根元素的嵌套深度
+    skip_at = 0
+    for event, elem in ET.iterparse(fp, events=("start", "end")):
+        tag = _local(elem.tag)
+        if event == "start":
+            parent = tags[-1] if tags else ""
+            tags.append(tag)
+            if skip_at:
+                continue
+            if tag == "sheet":
+                sheet_idx += 1
+                has_root = False
+            elif tag == "topics" and elem.get("type", "attached") != "attached":
+                skip_at = len(tags)
+            elif tag == "topic":
+                if parent == "sheet" and not has_root:
+                    has_root = True
+                    topics.append([1, 0, "", False, 0])
+                elif parent == "topics" and topics:
+                    owner = topics[-1]
+                    if not owner[3]:
+                        owner[3] = True
+                        yield sheet_idx, owner[0], owner[1], owner[2]
+                    topics.append([owner[0] + 1, owner[4], "", False, 0])
+                    owner[4] += 1
+                else:
+                    skip_at = len(tags)
+            continue
+
+        if skip_at:
+            if len(tags) == skip_at:
+                skip_at = 0
+            tags.pop()
+            elem.clear()
+            continue
+        tags.pop()
+        if tag == "title" and tags and tags[-1] == "topic" and topics and not topics[-1][3]:
+            cur = topics[-1]
+            cur[2] = (elem.text or "").strip()
+            cur[3] = True
+            yield sheet_idx, cur[0], cur[1], cur[2]
+        elif tag == "topic" and topics:
+            cur = topics.pop()
+            if not cur[3]:
+                yield sheet_idx, cur[0], cur[1], cur[2]
+        elem.clear()
+
+
+def iter_xmind_topics(xmind_path: str) -> Iterator[XMindTopic]:
+    """逐个交出 XMind 中的主题节点（先序）。文件中既无 content.json 也无 content.xml 时不交出任何节点。"""
+    with zipfile.ZipFile(xmind_path, "r") as z:
+        name = _member_name(z)
+        if not name:
+            return
+        if name.endswith(".json"):
+            data = json.loads(z.read(name).decode("utf-8"))
+            yield from _iter_json_topics(data)
+        else:
+            with z.open(name) as fp:
+                yield from _iter_xml_topics(fp)
+
+
+def xmind_leaf_paths(xmind_path: str) -> List[List[str]]:
+    """
+    一次遍历得到所有叶子测试点的路径（只含非空标题，至少两级）。
+    无标题节点不进入路径但继续向下遍历；某条路径若是其它任一路径的前缀（含同名兄弟的子树），则不算叶子。
+    遍历时把每条路径逐级挂进前缀树（每个节点 O(1)），遍历结束后前缀树上没有子节点的路径即为叶子。
+    """
+    trie = PathTrie()
+    candidates: List[Tuple[List[str], TrieNode]] = []
+    # chain[i]：第 i+1 层节点对应的 (有标题祖先路径, 前缀树节点)
+    chain: List[Tuple[List[str], TrieNode]] = []
+    for _sheet, level, _index, title in iter_xmind_topics(xmind_path):
+        del chain[level - 1:]
+        parent_path, parent_node = chain[-1] if chain else ([], trie.root)
+        if title:
+            cur = (parent_path + [title], parent_node.child(title))
+            if len(cur[0]) >= 2:
+                candidates.append(cur)
+        else:
+            cur = (parent_path, parent_node)
+        chain.append(cur)
+    return [path for path, node in candidates if not node.children]
@@ -1,16 +1,48 @@
 # 流程3：XMind → 统一测试树协议（带 id / path / parent_id / level）
 # 供测试智能评审引擎使用：精确定位分支、AI 遗漏检测
-import json
-import zipfile
-import uuid
-from typing import Any, Dict, List, Optional, Tuple
+#
+# 节点 id 由内容派生（不再随机）：同一份 XMind 每次解析得到完全相同的 id，
+# 因此拼出的评审 prompt 逐字节相同，可命中 LLM 响应缓存、跨次对比结果。
+import hashlib
+import os
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from compact_tree import CompactTestTree
+from settings import load_env
+from xmind_reader import iter_xmind_topics
+
+load_env()
 
 # 统一测试树节点类型（可按需扩展）
 NODE_TYPES = ("module", "scene", "case", "condition")
+# 紧凑（列式）存储：auto = 节点数达到 TEST_TREE_COMPACT_MIN_NODES 时启用；1 = 总是；0 = 从不
+TEST_TREE_COMPACT = os.getenv("TEST_TREE_COMPACT", "auto").strip().lower()
+TEST_TREE_COMPACT_MIN_NODES = int(os.getenv("TEST_TREE_COMPACT_MIN_NODES", "20000"))
+
 
+def _make_node_id(parent_key: str, index: int, title: str, used: Optional[Set[str]] = None) -> str:
+    """
+    确定性节点 id：node-<8 位哈希>，由父节点 id（根节点为 sheet 序号）、同级序号、标题计算。
+    同一输入（sheet、路径、同级顺序都相同）永远得到同一个 id；路径上任一标题或顺序变化，该节点及其子孙 id 随之改变。
+    传入 used 时保证在集合内唯一：哈希冲突则追加序号重新计算（遍历顺序固定，结果仍确定），并把新 id 加入集合。
+    """
+    base = f"{parent_key}\0{index}\0{title}"
+    node_id = "node-" + hashlib.sha256(base.encode("utf-8")).hexdigest()[:8]
+    salt = 0
+    while used is not None and node_id in used:
+        salt += 1
+        node_id = "node-" + hashlib.sha256(f"{base}\0{salt}".encode("utf-8")).hexdigest()[:8]
+    if used is not None:
+        used.add(node_id)
+    return node_id
 
-def _make_node_id() -> str:
-    return "node-" + uuid.uuid4().hex[:8]
+
+def _subtree_hash(title: str, child_hashes: List[str]) -> str:
+    """Merkle 式子树哈希：本节点标题 + 各子节点子树哈希（有序）。子树内任一标题或结构变化都会改变根哈希。"""
+    h = hashlib.sha256(title.encode("utf-8"))
+    for ch in child_hashes:
+        h.update(b"\0" + ch.encode("ascii"))
+    return h.hexdigest()[:16]
 
 
 def _infer_type(level: int, has_children: bool) -> str:
@@ -24,84 +56,49 @@ def _infer_type(level: int, has_children: bool) -> str:
     return "case"
 
 
-def _walk_xmind(
-    node: Dict[str, Any],
-    path: List[str],
-    parent_id: Optional[str],
-    level: int,
-    out_flat: List[Dict[str, Any]],
-) -> Dict[str, Any]:
-    """
-    递归遍历 XMind content.json 中的节点，转为统一测试树节点。
-    out_flat 收集所有节点（含 id/path）便于后续查找与输出。
+def build_compact_test_tree(xmind_path: str) -> CompactTestTree:
+    """解析 XMind 为列式存储的测试树（见 compact_tree），一次遍历建树，再逆序补 type 与子树哈希。"""
+    tree = CompactTestTree()
+    used: Set[str] = set()
+    # stack[i] 为当前分支上第 i+1 层节点的下标
+    stack: List[int] = []
+    for sheet_idx, level, index, title in iter_xmind_topics(xmind_path):
+        del stack[level - 1:]
+        parent = stack[-1] if stack else -1
+        id_key = tree.node_id(parent) if parent >= 0 else f"sheet-{sheet_idx}"
+        stack.append(tree.add_node(parent, title, level, _make_node_id(id_key, index, title, used)))
+
+    # 节点按先序编号，逆序处理保证子节点先于父节点
+    for i in range(len(tree) - 1, -1, -1):
+        tree.set_type(i, _infer_type(tree.level[i], tree.has_children(i)))
+        tree.set_subtree_hash(i, _subtree_hash(tree.title(i), [tree.subtree_hash(c) for c in tree.children(i)]))
+    return tree
+
+
+def xmind_to_test_tree(
+    xmind_path: str,
+    compact: Optional[bool] = None,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
     """
-    title = (node.get("title") or "").strip()
-    children_raw = node.get("children", {})
-    attached = (children_raw.get("attached") or []) if isinstance(children_raw, dict) else []
-    has_children = bool(attached)
-
-    node_id = _make_node_id()
-    path_parts = path + ([title] if title else [])
-    path_str = "/".join(path_parts) if path_parts else ""
-
-    node_type = _infer_type(level, has_children)
-    standard: Dict[str, Any] = {
-        "id": node_id,
-        "parent_id": parent_id or "",
-        "path": path_str,
-        "title": title or "(无标题)",
-        "type": node_type,
-        "level": level,
-        "children": [],
-    }
-
-    out_flat.append(standard)
-
-    for child in attached:
-        child_standard = _walk_xmind(child, path_parts, node_id, level + 1, out_flat)
-        standard["children"].append(child_standard)
-
-    return standard
-
-
-def _load_xmind_content(xmind_path: str) -> List[Dict[str, Any]]:
-    """从 .xmind（zip）中读取 content.json，返回 sheet 列表。"""
-    with zipfile.ZipFile(xmind_path, "r") as z:
-        name = "content.json" if "content.json" in z.namelist() else None
-        if not name:
-            cand = [n for n in z.namelist() if n.endswith("content.json")]
-            if not cand:
-                return []
-            name = cand[0]
-        data = json.loads(z.read(name).decode("utf-8"))
-
-    if isinstance(data, list):
-        return data
-    if isinstance(data, dict):
-        return [data]
-    return []
-
-
-def xmind_to_test_tree(xmind_path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
-    """
-    解析 XMind 为统一测试树协议。
+    解析 XMind 为统一测试树协议（支持 content.json 与 XMind 8 的 content.xml，见 xmind_reader）。
 
     返回:
-        roots: 各 sheet 的根节点列表（树形，每个节点含 id/parent_id/path/title/type/level/children）
-        flat: 所有节点的扁平列表，便于按 id 查找
+        roots: 各 sheet 的根节点列表（树形，每个节点含 id/parent_id/path/title/type/level/children/subtree_hash）
+        flat: 所有节点的扁平列表（先序），便于按 id 查找
+
+    id 由 sheet 序号 + 路径 + 同级序号派生，同一文件多次解析结果完全一致（见 _make_node_id）。
+    compact 为 True 时返回列式存储上的视图（TestNode 列表 / FlatNodes），读取方式与 dict 相同；
+    默认取 TEST_TREE_COMPACT（auto 时节点数达到 TEST_TREE_COMPACT_MIN_NODES 才使用）。
     """
-    sheets = _load_xmind_content(xmind_path)
-    roots: List[Dict[str, Any]] = []
-    flat: List[Dict[str, Any]] = []
-
-    for sheet in sheets:
-        root_topic = sheet.get("rootTopic")
-        if not root_topic:
-            continue
-        root_standard = _walk_xmind(root_topic, [], None, 1, flat)
-        roots.append(root_standard)
-
-    return roots, flat
+    tree = build_compact_test_tree(xmind_path)
+    if compact is None:
+        compact = TEST_TREE_COMPACT in ("1", "true", "on") or (
+            TEST_TREE_COMPACT == "auto" and len(tree) >= TEST_TREE_COMPACT_MIN_NODES
+        )
+    if compact:
+        print(f"[测试树] 使用紧凑存储：{len(tree)} 个节点，{len(tree.titles)} 个不同标题")
+        return tree.roots, tree.flat
+    return tree.to_dicts()
 
 
 def test_tree_to_flat_id_path(flat: List[Dict[str, Any]]) -> List[Dict[str, str]]: